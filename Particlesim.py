@@ -1,39 +1,112 @@
 import pygame
 import math
 import random
-import colorsys
+import json
+import struct
+import time
+import heapq
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+try:
+    import numba # Optional: compiles the force field kernel (see force_field_loop)
+except ImportError:
+    numba = None
 
 # Initialize Pygame
 pygame.init()
 
 # Constants
 WIDTH, HEIGHT = 1200, 800
-FPS = 60
+FPS = 60 # Render frame cap
+SIM_RATE = 60 # Simulation steps per second, whatever the render rate
+MAX_SUBSTEPS = 5 # Most simulation steps per rendered frame; past that the simulation slows down instead of falling further behind
 GRAVITY = 0.2
 DAMPING = 0.99
 PARTICLE_LIFE = 180  # frames (default for most particles)
 MAX_PARTICLES = 5000 # Increased max particles for more dynamic effects
+SPRING_REPULSION_RADIUS = 50 # Spring particles push apart when closer than this
+CONSTELLATION_LINK_DISTANCE = 100 # Constellation stars closer than this are joined by a line
+SPRITE_CACHE_BUDGET = 32 * 1024 * 1024 # Bytes of pre-rendered glow sprites kept around
+SPRITE_ATLAS_BUDGET = 32 * 1024 * 1024 # Bytes of pre-rendered bodies and trail dots for the batched renderer
+RENDERER = "immediate" # "immediate" issues pygame.draw calls per particle, "batched" one Surface.blits per frame
+PROFILE_WINDOW = 300 # Frames the profiler overlay's rolling percentiles cover
+PROFILE_LOG = "frame_metrics.jsonl" # Where the profiler streams per-frame metrics when logging is on
+ENGINE = "array" # "array" advances a columnar NumPy ParticleStore, "object" one Particle instance per particle
+EVICTION = "oldest" # Which particles go past MAX_PARTICLES: "oldest", "lowest_life" or "type_quota" (fair share per type)
+EVICTION_POLICIES = ("oldest", "lowest_life", "type_quota")
+WORKERS = 0 # Worker processes advancing the array engine in parallel; 0 updates it in this process
+PARALLEL_CHUNK = 8192 # Rows per worker task
+PARALLEL_MIN_ROWS = 20000 # Below this the array engine updates in this process even with workers
+PIPELINED = False # Array engine: update on a background thread while the main thread draws the previous state
+INPUT_LOG = "input_log.bin" # Where F5 records the sandbox's input for replay.py
+SNAPSHOT = "snapshot.pss" # Where F6 saves the simulation state and F7 loads it from
+DIRTY_RECTS = True # Clear, redraw and present only the screen regions particles and UI touched (F8 toggles)
+DIRTY_TILE = 32 # Pixels per side of the tiles dirty regions are rounded to
+DIRTY_COVERAGE = 0.5 # Above this fraction of dirty tiles a frame is redrawn and flipped whole
+DIRTY_RECHECK = 30 # Frames drawn whole after one above DIRTY_COVERAGE before particle boxes are computed again
+LOD_HIGH = 0.9 # Drop a level of detail when a frame's work takes more than this fraction of the 1 / FPS budget
+LOD_LOW = 0.5 # Go back up a level when it takes less than this fraction
+LOD_HOLD = 30 # Frames the LOD controller stays at a level before it moves again
+LOD_SMOOTHING = 0.1 # Weight of the newest frame in the controller's running average of frame work time
+EMISSION_GOVERNOR = True # Scale emission down while frames run over budget (F10 toggles)
+EMIT_HIGH = 1.0 # Emit less while a frame's work takes more than this fraction of the 1 / FPS budget
+EMIT_LOW = 0.7 # Work back up to the full rate while it takes less than this fraction
+EMIT_BACKOFF = 0.9 # Factor the current mode's emission scale is multiplied by per frame over budget
+EMIT_RECOVERY = 0.02 # Scale added back per frame under EMIT_LOW
+EMIT_MIN_SCALE = 0.1 # Lowest emission scale, from the governor or a nearly full system, so emission never stops
+EMIT_HEADROOM = 0.2 # Emission tapers off once fewer than this fraction of max_particles are left
+EMIT_SMOOTHING = 0.2 # Weight of the newest frame in the governor's running average of frame work time
+PALETTE_HUES = 256 # Colors in each precomputed hue table
+RAMP_STEPS = 128 # Brightness levels in each base color's fade ramp; faded colors are off by at most 255 / RAMP_STEPS
 
 # Colors
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
+class ParticleExtras:
+    # State only a few special_types need (lightning, firefly, solar, geyser, pixel_painter, sound_visualizer).
+    # Kept off Particle so every other particle skips the memory; Particle.extra is None for them.
+    __slots__ = ("branch_timer", "branched", "pulse_offset", "pulse_speed", "initial_speed", "initial_y",
+                 "target_x", "target_y", "base_size")
+
 class Particle:
-    def __init__(self, x, y, vx, vy, color, size=3, special_type=None, target_pos=None, initial_life=None):
+    # Fixed slots instead of a per-instance __dict__: smaller objects and less for the GC to walk
+    __slots__ = ("x", "y", "prev_x", "prev_y", "vx", "vy", "color", "size", "life", "max_life", "max_trail", "trail",
+                 "trail_head", "special_type", "behavior", "age", "rotation", "spin_speed", "target_pos", "initial_size",
+                 "current_color", "current_size", "ramp", "extra", "pool")
+
+    def __init__(self, x, y, vx, vy, color, size=3, special_type=None, target_pos=None, initial_life=None, pool=None):
+        self.trail = []
+        self.special_type = None
+        self.extra = None
+        self.pool = pool # ParticlePool this particle came from; the particles it spawns come from it too
+        self.reset(x, y, vx, vy, color, size, special_type, target_pos, initial_life)
+
+    def reset(self, x, y, vx, vy, color, size=3, special_type=None, target_pos=None, initial_life=None):
+        # (Re)initialize in place; ParticlePool calls this to bring a dead particle back as a new one
+        recycled = self.extra if special_type == self.special_type else None # Per-type state to reuse
         self.x = x
         self.y = y
+        self.prev_x = x # Position before the last update, for drawing between simulation steps
+        self.prev_y = y
         self.vx = vx
         self.vy = vy
         self.color = color
+        self.ramp = palette.ramp(color) # current_color at each brightness, see Palette
         self.size = size
         
         # Set life based on initial_life or default PARTICLE_LIFE
         self.life = initial_life if initial_life is not None else PARTICLE_LIFE
         self.max_life = initial_life if initial_life is not None else PARTICLE_LIFE
 
-        self.trail = [(x, y)]
-        self.max_trail = 15
+        self.max_trail = 100 if special_type == "light_tracer" else 15 # Very long trail for light tracers
+        self.trail[:] = (x, y) # Flat x0, y0, x1, y1, ... ring of the last max_trail points, see update
+        self.trail_head = 0 # Index in trail of the oldest point once the ring is full
         self.special_type = special_type
+        self.behavior = BEHAVIORS[special_type] # Flags and per-type hooks, looked up once
         self.age = 0
         self.rotation = 0
         self.spin_speed = random.uniform(-0.2, 0.2)
@@ -45,380 +118,63 @@ class Particle:
         self.current_color = self.color
         self.current_size = self.size
 
-        # Specific attributes for certain modes
+        # Specific attributes for certain modes, in side storage only the types that use them allocate
+        self.extra = None
         if self.special_type == "lightning":
-            self.branch_timer = random.randint(10, 30) # Time until it might branch
-            self.branched = False
+            extra = self.extra = recycled or ParticleExtras()
+            extra.branch_timer = random.randint(10, 30) # Time until it might branch
+            extra.branched = False
         elif self.special_type == "firefly":
-            self.pulse_offset = random.uniform(0, math.pi * 2) # For pulsating glow
-            self.pulse_speed = random.uniform(0.05, 0.15)
+            extra = self.extra = recycled or ParticleExtras()
+            extra.pulse_offset = random.uniform(0, math.pi * 2) # For pulsating glow
+            extra.pulse_speed = random.uniform(0.05, 0.15)
         elif self.special_type == "solar":
-            self.initial_speed = math.hypot(vx, vy) # Store initial speed for corona effect
+            extra = self.extra = recycled or ParticleExtras()
+            extra.initial_speed = math.hypot(vx, vy) # Store initial speed for corona effect
         elif self.special_type == "geyser":
-            self.initial_y = y # Store initial Y for geyser behavior
-        elif self.special_type == "explosion_implosion":
-            self.origin_pos = (x, y) # Store origin for implosion effect
+            extra = self.extra = recycled or ParticleExtras()
+            extra.initial_y = y # Store initial Y for geyser behavior
         elif self.special_type == "pixel_painter":
-            self.target_x = x # For pixel painter, particles try to stay at their spawn point
-            self.target_y = y
+            extra = self.extra = recycled or ParticleExtras()
+            extra.target_x = x # For pixel painter, particles try to stay at their spawn point
+            extra.target_y = y
             self.vx = 0 # Start static
             self.vy = 0
             self.life = PARTICLE_LIFE * 5 # Live much longer for persistent pixels
             self.max_life = self.life
             self.size = random.randint(3, 6) # Fixed size for pixels
         elif self.special_type == "light_tracer":
-            self.max_trail = 100 # Very long trail
             self.life = PARTICLE_LIFE * 2 # Longer life
             self.max_life = self.life
             self.size = 2 # Small particle
         elif self.special_type == "sound_visualizer":
-            self.base_size = size
-            self.pulse_offset = random.uniform(0, math.pi * 2)
+            extra = self.extra = recycled or ParticleExtras()
+            extra.base_size = size
+            extra.pulse_offset = random.uniform(0, math.pi * 2)
         elif self.special_type == "constellation":
             self.life = PARTICLE_LIFE * 10 # Very long life for constellations
             self.max_life = self.life
 
-
-    def update(self, mouse_pos=None, mouse_buttons=None, all_particles=None, simulated_beat=0): # Added all_particles and simulated_beat
+    def update(self, mouse_pos=None, mouse_buttons=None, all_particles=None, simulated_beat=0, spatial_index=None): # Added all_particles and simulated_beat
+        behavior = self.behavior
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.age += 1
         self.rotation += self.spin_speed
         
         # Apply physics (reduced for some special types)
         # Default gravity application
-        if self.special_type not in ["bubble", "snow", "smoke", "rain", "firefly", "nebula", "solar", "blackhole", "fluid", "aurora", "swarm", "flowing_stream", "wave_ripple", "path_follower", "explosion_implosion", "pixel_painter", "spring_attraction", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]:
+        if behavior.gravity:
             self.vy += GRAVITY
         
         # Special behaviors based on particle type
-        if self.special_type == "electric":
-            # Electric particles zigzag
-            self.vx += random.uniform(-1, 1)
-            self.vy += random.uniform(-0.5, 0.5)
-        elif self.special_type == "magnetic":
-            # Magnetic particles curve
-            self.vx += math.sin(self.age * 0.1) * 0.5
-            self.vy += math.cos(self.age * 0.1) * 0.3
-        elif self.special_type == "bubble":
-            # Bubbles float upward
-            self.vy -= 0.3
-            self.vx += random.uniform(-0.2, 0.2)
-        elif self.special_type == "snow":
-            # Snow drifts slowly
-            self.vx += math.sin(self.age * 0.05) * 0.2
-            self.vy = abs(self.vy) * 0.3  # Always fall down slowly
-        elif self.special_type == "spiral":
-            # Spiral particles rotate around their path
-            angle = self.age * 0.2
-            self.vx += math.cos(angle) * 0.3
-            self.vy += math.sin(angle) * 0.3
-        elif self.special_type == "rain":
-            # Rain falls mostly straight, slight wind
-            self.vy += GRAVITY * 0.5 # Less affected by gravity
-            self.vx += random.uniform(-0.1, 0.1) # Slight horizontal drift
-            self.vx *= 0.98 # Less damping
-            self.vy *= 0.98 # Less damping
-        elif self.special_type == "smoke":
-            # Smoke rises and expands
-            self.vy -= 0.15 # Rise upward
-            self.vx += random.uniform(-0.1, 0.1) # Gentle horizontal drift
-            self.size += 0.05 # Expand over time
-            self.vx *= 0.95 # Less damping for a floaty feel
-            self.vy *= 0.95 # Less damping
-        elif self.special_type == "confetti":
-            # Confetti flutters down with rotation
-            self.vy += GRAVITY * 0.8 # Affected by gravity
-            self.vx += math.sin(self.age * 0.1) * 0.5 # Flutter horizontally
-            self.spin_speed = random.uniform(-0.5, 0.5) # Faster spin
-        elif self.special_type == "attractor" and mouse_pos:
-            # Attractor mode: particles drawn to mouse_pos
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            if dist > 0.1: # Use a small epsilon to prevent division by zero or near-zero
-                force_strength = 0.5 / (dist ** 0.5) # Inverse square root for softer attraction
-                self.vx += dx / dist * force_strength
-                self.vy += dy / dist * force_strength
-                # Add a slight tangential force for swirling effect
-                self.vx -= dy / dist * 0.05
-                self.vy += dx / dist * 0.05
-            else: # If very close to the mouse, slow down
-                self.vx *= 0.8
-                self.vy *= 0.8
-        elif self.special_type == "blackhole" and mouse_pos:
-            # Blackhole: particles spiral into mouse_pos
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            if dist > 5: # Avoid extreme forces at center
-                # Stronger attraction
-                force_strength = 1000 / (dist ** 2) # Inverse square law for stronger pull
-                self.vx += dx / dist * force_strength
-                self.vy += dy / dist * force_strength
-                # Tangential force for spiraling
-                self.vx -= dy / dist * (force_strength * 0.5)
-                self.vy += dx / dist * (force_strength * 0.5)
-            else: # If very close, slow down and eventually disappear
-                self.vx *= 0.5
-                self.vy *= 0.5
-                self.life -= 5 # Accelerate fading
-            self.vx *= 0.9 # Less damping to maintain speed
-            self.vy *= 0.9 # Less damping
-        elif self.special_type == "fluid":
-            # Fluid: very low gravity, high damping, gentle movement
-            self.vy += GRAVITY * 0.1 # Very slight gravity
-            self.vx *= 0.95 # High damping
-            self.vy *= 0.95 # High damping
-            self.spin_speed = 0 # No rotation
-        elif self.special_type == "crystal":
-            # Crystal: falls with gravity, rotates
-            self.vy += GRAVITY * 0.5 # Slower fall
-            self.spin_speed = random.uniform(-0.1, 0.1) # Consistent spin
-        elif self.special_type == "lightning":
-            # Lightning: erratic movement, short life, potential to branch
-            self.vx += random.uniform(-5, 5)
-            self.vy += random.uniform(-5, 5)
-            self.life -= 1.65 # How visible it is
-            self.branch_timer -= 1
-            if self.branch_timer <= 0 and not self.branched:
-                self.branched = True
-                # Return new particles to be created by the system, with slightly longer life
-                return [
-                    Particle(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40)),
-                    Particle(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40))
-                ]
-        elif self.special_type == "lava":
-            # Lava: slow, heavy, emits smoke
-            self.vy += GRAVITY * 0.5 # Slow fall
-            self.vx *= 0.98
-            self.vy *= 0.98
-            if self.age % 10 == 0: # Emit smoke periodically
-                return [Particle(self.x, self.y, random.uniform(-0.5, 0.5), random.uniform(-1, -0.2), (100, 100, 100), random.randint(3, 6), "smoke")]
-        elif self.special_type == "firefly":
-            # Firefly: gentle random walk, no gravity, pulsating brightness
-            self.vx += random.uniform(-0.1, 0.1)
-            self.vy += random.uniform(-0.1, 0.1)
-            self.vx *= 0.99
-            self.vy *= 0.99
-            # Keep within bounds gently
-            if self.x < 0 or self.x > WIDTH: self.vx *= -1
-            if self.y < 0 or self.y > HEIGHT: self.vy *= -1
-        elif self.special_type == "nebula":
-            # Nebula: very slow, expands, fades, no gravity
-            self.vx *= 0.99
-            self.vy *= 0.99
-            self.size += 0.1 # Gradually expand
-            self.life -= 0.5 # Slower fade
-        elif self.special_type == "solar":
-            # Solar: strong outward initial velocity, fades with distance/time
-            # No additional forces, just initial burst and natural damping
-            pass # Forces handled on creation, just damp and fade
-        elif self.special_type == "vortex" and mouse_pos:
-            # Vortex: particles spiral into mouse_pos, but less aggressively than blackhole
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            if dist > 1:
-                force_strength = 50 / (dist ** 1.5) # Inverse square root for softer attraction
-                self.vx += dx / dist * force_strength
-                self.vy += dy / dist * force_strength
-                # Tangential force for spiraling
-                self.vx -= dy / dist * (force_strength * 0.2)
-                self.vy += dx / dist * (force_strength * 0.2)
-            else: # If very close, slow down
-                self.vx *= 0.8
-                self.vy *= 0.8
-            self.vx *= 0.95 # Some damping
-            self.vy *= 0.95 # Some damping
-        elif self.special_type == "aurora":
-            # Aurora: drifts slowly upward/sideways, very transparent
-            self.vy -= 0.05 # Gentle upward drift
-            self.vx += math.sin(self.age * 0.02) * 0.1 # Gentle horizontal sway
-            self.vx *= 0.99
-            self.vy *= 0.99
-            self.size += 0.02 # Slowly expand
-            self.life -= 0.2 # Very slow fade
-        elif self.special_type == "geyser":
-            # Geyser: strong initial upward force, then gravity takes over
-            # Only apply initial upward force once or based on age
-            if self.age < 10: # Initial burst
-                self.vy -= 0.5 # Continuous upward push for a short duration
-            self.vy += GRAVITY * 0.8 # Gravity pulls it down
-            if self.y > self.initial_y + 10: # If it falls below initial point, consider it "splashed"
-                self.life = 0 # Mark for removal
-                # Could add a splash effect here by returning new small particles
-        elif self.special_type == "swarm" and mouse_pos:
-            # Swarm: particles try to move towards mouse_pos and stay somewhat together
-            # Simple cohesion and attraction to mouse
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            if dist > 50: # Attract towards mouse if far
-                self.vx += dx / dist * 0.1
-                self.vy += dy / dist * 0.1
-            elif dist < 20: # Repel from mouse if too close
-                self.vx -= dx / dist * 0.05
-                self.vy -= dy / dist * 0.05
-            
-            # Add some random movement to make it look organic
-            self.vx += random.uniform(-0.1, 0.1)
-            self.vy += random.uniform(-0.1, 0.1)
-
-            self.vx *= 0.98 # Damping
-            self.vy *= 0.98 # Damping
-        elif self.special_type == "gravity_field" and mouse_pos and mouse_buttons:
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            
-            if dist > 0.1:
-                force_direction = 5 # Attraction by default
-                if mouse_buttons[2]: # Right-click for repulsion (button 2 is right mouse button)
-                    force_direction = -7
-                
-                # Inverse square law for stronger force closer to the mouse
-                force_strength = 100 / (dist ** 1.5) 
-                
-                self.vx += dx / dist * force_strength * force_direction
-                self.vy += dy / dist * force_strength * force_direction
-                
-                # Add a slight tangential force for orbiting effect if attracting
-                if force_direction == 1:
-                    self.vx -= dy / dist * (force_strength * 0.1)
-                    self.vy += dx / dist * (force_strength * 0.1)
-            else: # If very close to the mouse, slow down
-                self.vx *= 0.8
-                self.vy *= 0.8
-            self.vx *= 0.97 # Some damping
-            self.vy *= 0.97 # Some damping
-        elif self.special_type == "flowing_stream":
-            # Very low gravity, very low damping to maintain flow
-            self.vy += GRAVITY * 0.05
-            self.vx *= 0.995
-            self.vy *= 0.995
-            self.size += 0.01 # Slowly expand to give a dissipating effect
-            self.life -= 0.5 # Slightly faster fade
-        elif self.special_type == "bouncing_collision":
-            # Apply normal gravity
-            self.vy += GRAVITY
-            # Bounce off walls
-            if self.x < 0:
-                self.x = 0
-                self.vx *= -0.8 # Bounce with energy loss
-            elif self.x > WIDTH:
-                self.x = WIDTH
-                self.vx *= -0.8
-            if self.y < 0:
-                self.y = 0
-                self.vy *= -0.8
-            elif self.y > HEIGHT:
-                self.y = HEIGHT
-                self.vy *= -0.8
-            self.vx *= DAMPING # Apply general damping
-            self.vy *= DAMPING
-        elif self.special_type == "explosion_implosion":
-            if self.target_pos: # This particle is part of an implosion
-                dx = self.target_pos[0] - self.x
-                dy = self.target_pos[1] - self.y
-                dist = math.hypot(dx, dy)
-                if dist > 1:
-                    force_strength = 200 / (dist ** 2) # Strong attraction to origin
-                    self.vx += dx / dist * force_strength
-                    self.vy += dy / dist * force_strength
-                else:
-                    self.life -= 10 # Accelerate fading if very close to center
-            # Apply damping for both explosion and implosion
-            self.vx *= 0.95
-            self.vy *= 0.95
-            self.size -= 0.05 # Shrink over time
-        elif self.special_type == "wave_ripple":
-            # Particles expand outwards and fade
-            self.size += 0.1 # Grow in size
-            self.life -= 1 # Fade
-            self.vx *= 0.99 # Slight damping
-            self.vy *= 0.99 # Slight damping
-        elif self.special_type == "path_follower" and mouse_pos:
-            # Particles try to follow the mouse's current position
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            if dist > 10: # Only apply force if not too close
-                self.vx += dx / dist * 0.5
-                self.vy += dy / dist * 0.5
-            
-            self.vx *= 0.9 # Damping
-            self.vy *= 0.9 # Damping
-        elif self.special_type == "spring_attraction" and mouse_pos:
-            # Spring-like attraction to mouse
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
-            dist = math.hypot(dx, dy)
-            spring_constant = 0.05 # How strong the spring is
-            if dist > 1:
-                self.vx += dx * spring_constant
-                self.vy += dy * spring_constant
-            
-            # Slight repulsion from other particles (simple approximation)
-            if all_particles:
-                for other_p in all_particles:
-                    if other_p is not self and other_p.special_type == "spring_attraction":
-                        odx = self.x - other_p.x
-                        ody = self.y - other_p.y
-                        odist = math.hypot(odx, ody)
-                        if 0 < odist < 50: # Repel if too close
-                            repel_force = 1 / (odist ** 0.5) # Inverse square root for softer repulsion
-                            self.vx += odx / odist * repel_force * 0.1
-                            self.vy += ody / odist * repel_force * 0.1
-            
-            self.vx *= 0.95 # Damping
-            self.vy *= 0.95 # Damping
-        elif self.special_type == "pixel_painter":
-            # Particles try to stay at their target_x, target_y
-            dx = self.target_x - self.x
-            dy = self.target_y - self.y
-            
-            # Strong damping to make them settle quickly
-            self.vx *= 0.8
-            self.vy *= 0.8
-            
-            # Gentle force to move towards target
-            self.vx += dx * 0.05
-            self.vy += dy * 0.05
-            
-            # If very close to target, stop movement
-            if math.hypot(dx, dy) < 1:
-                self.x = self.target_x
-                self.y = self.target_y
-                self.vx = 0
-                self.vy = 0
-        elif self.special_type == "chain_explosion":
-            # These particles just move outwards and fade quickly
-            self.life -= 5 # Very short life
-            self.vx *= 0.98
-            self.vy *= 0.98
-        elif self.special_type == "light_tracer":
-            # Very low damping, almost no gravity
-            self.vy += GRAVITY * 0.01 # Minimal gravity
-            self.vx *= 0.999 # Very low damping
-            self.vy *= 0.999 # Very low damping
-        elif self.special_type == "sound_visualizer":
-            # Particles pulse in size and brightness based on simulated_beat
-            pulse_factor = (math.sin(self.age * 0.1 + self.pulse_offset) + 1) / 2 # 0 to 1
-            # Incorporate simulated_beat into the pulse
-            self.current_size = max(1, int(self.base_size * (1 + pulse_factor * 0.5 + simulated_beat * 0.8)))
-            # No gravity, just drift slightly
-            self.vx += random.uniform(-0.05, 0.05)
-            self.vy += random.uniform(-0.05, 0.05)
-            self.vx *= 0.99
-            self.vy *= 0.99
-        elif self.special_type == "constellation":
-            # Particles drift very slowly, no gravity
-            self.vx *= 0.995
-            self.vy *= 0.995
-            self.vx += random.uniform(-0.02, 0.02)
-            self.vy += random.uniform(-0.02, 0.02)
-
+        if behavior.force:
+            spawned = behavior.force(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index)
+            if spawned is not None:
+                return spawned # Lightning branches and lava smoke skip the rest of this frame
 
         # Apply general damping (if not overridden by specific type)
-        if self.special_type not in ["blackhole", "lightning", "fluid", "rain", "smoke", "firefly", "nebula", "vortex", "aurora", "swarm", "gravity_field", "flowing_stream", "bouncing_collision", "explosion_implosion", "wave_ripple", "path_follower", "spring_attraction", "pixel_painter", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]:
+        if behavior.damping:
             self.vx *= DAMPING
             self.vy *= DAMPING
         
@@ -427,7 +183,7 @@ class Particle:
         self.y += self.vy
         
         # Bounce off walls (except for specific types that pass through or dissipate)
-        if self.special_type not in ["rain", "smoke", "nebula", "firefly", "blackhole", "aurora", "geyser", "flowing_stream", "explosion_implosion", "wave_ripple", "path_follower", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]: # Added new modes
+        if behavior.edge == "bounce":
             if self.x < 0:
                 self.x = 0
                 self.vx *= -0.8
@@ -440,909 +196,3365 @@ class Particle:
             elif self.y > HEIGHT:
                 self.y = HEIGHT
                 self.vy *= -0.8
-        elif self.special_type in ["rain", "smoke", "geyser", "flowing_stream", "explosion_implosion", "wave_ripple", "path_follower", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]: # For these, let them pass through bottom, or reset
+        elif behavior.edge == "cull": # For these, let them pass through bottom, or reset
             if self.y > HEIGHT + 50 or self.y < -50 or self.x > WIDTH + 50 or self.x < -50: # Disappear far off screen
                 self.life = 0 # Mark for removal
-        elif self.special_type == "blackhole": # Blackhole particles disappear at center
+        elif behavior.edge == "center": # Blackhole particles disappear at center
             if mouse_pos and math.hypot(mouse_pos[0] - self.x, mouse_pos[1] - self.y) < 5:
                 self.life = 0
-        elif self.special_type == "aurora": # Aurora particles wrap around or dissipate
-            if self.y < -50 or self.y > HEIGHT + 50: self.life = 0
-            if self.x < -50 or self.x > WIDTH + 50: self.life = 0
             
-        # Update trail
-        self.trail.append((self.x, self.y))
-        if len(self.trail) > self.max_trail:
-            self.trail.pop(0)
+        # Update trail. A flat list allocates nothing per point (no tuple for the GC to track), and unlike
+        # a deque it doesn't reserve a 64-slot block for a 15 point trail. It grows to max_trail points, then
+        # becomes a ring like ParticleStore's: the newest point overwrites the oldest at trail_head, so
+        # nothing is shifted down the list.
+        trail = self.trail
+        if len(trail) < 2 * self.max_trail:
+            trail += (self.x, self.y)
+        else:
+            head = self.trail_head
+            trail[head] = self.x
+            trail[head + 1] = self.y
+            head += 2
+            self.trail_head = head if head < len(trail) else 0
             
         # Decrease life
         self.life -= 1
         
         # Fade out
         alpha = self.life / self.max_life
-        r, g, b = self.color
-        
-        # Handle pulsating for fireflies
-        if self.special_type == "firefly":
-            pulse_factor = (math.sin(self.age * self.pulse_speed + self.pulse_offset) + 1) / 2 # 0 to 1
-            current_alpha = alpha * (0.5 + pulse_factor * 0.5) # Base transparency + pulse
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.initial_size * (0.8 + pulse_factor * 0.2))) # Size also pulses
-        elif self.special_type == "nebula":
-            current_alpha = alpha * 0.2 # Very transparent
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "solar":
-            # Fade based on distance from origin or time
-            # Ensure mouse_pos is available for solar mode
-            if mouse_pos:
-                distance_ratio = math.hypot(self.x - mouse_pos[0], self.y - mouse_pos[1]) / (self.max_life * self.initial_speed) # Rough distance ratio
-                current_alpha = max(0, alpha - distance_ratio * 0.5) # Fade faster with distance
-            else: # Fallback if mouse_pos somehow not passed (shouldn't happen in solar mode)
-                current_alpha = alpha
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size * current_alpha)) # Size also fades
-        elif self.special_type == "aurora":
-            current_alpha = alpha * 0.3 # More transparent for aurora effect
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "flowing_stream":
-            current_alpha = alpha * 0.8 # Slightly transparent
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "explosion_implosion":
-            current_alpha = alpha # Full alpha, fades with life
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "wave_ripple":
-            current_alpha = alpha * 0.4 # Very transparent
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "path_follower":
-            current_alpha = alpha # Standard fade
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "spring_attraction":
-            current_alpha = alpha # Standard fade
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
-        elif self.special_type == "pixel_painter":
-            current_alpha = alpha # Standard fade, but longer life
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size is mostly fixed
-        elif self.special_type == "chain_explosion":
-            current_alpha = alpha # Fast fade
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size * alpha)) # Shrink as it fades
-        elif self.special_type == "light_tracer":
-            current_alpha = alpha * 0.7 # More transparent for long trails
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size is fixed
-        elif self.special_type == "sound_visualizer":
-            # Color also pulses with beat
-            pulse_color_factor = (math.sin(self.age * 0.1 + self.pulse_offset) + 1) / 2
-            current_alpha = alpha * (0.5 + pulse_color_factor * 0.5)
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            # Size is handled in update method
-        elif self.special_type == "constellation":
-            current_alpha = alpha * 0.8 # Slightly transparent
-            self.current_color = (int(r * current_alpha), int(g * current_alpha), int(b * current_alpha))
-            self.current_size = max(1, int(self.size)) # Size changes in update, not here
+        if behavior.fade:
+            behavior.fade(self, alpha, mouse_pos)
         else:
-            self.current_color = (int(r * alpha), int(g * alpha), int(b * alpha))
-            self.current_size = max(1, int(self.size * alpha))
+            current_alpha = alpha * behavior.fade_factor
+            self.current_color = self.ramp[int(current_alpha * RAMP_STEPS)] if current_alpha > 0 else BLACK
+            # Types with a fade factor change size in update (or keep it); the rest shrink as they fade
+            self.current_size = max(1, int(self.size * alpha)) if behavior.size_fades else max(1, int(self.size))
         
-        # Return any new particles generated (e.g., for branching lightning, lava smoke, chain reaction)
-        if self.special_type == "lightning" and self.branched:
-            self.branched = False # Reset to prevent continuous branching from one particle
-            return [
-                Particle(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40)),
-                Particle(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40))
-            ]
-        elif self.special_type == "lava" and self.age % 10 == 0:
-            return [Particle(self.x, self.y, random.uniform(-0.5, 0.5), random.uniform(-1, -0.2), (100, 100, 100), random.randint(3, 6), "smoke")]
-        elif self.special_type == "chain_starter":
-            # This particle immediately triggers an explosion and then dies
-            self.life = 0 # Mark for removal
-            new_burst_particles = []
-            for _ in range(random.randint(10, 20)): # Create a burst of particles
-                angle = random.uniform(0, 2 * math.pi)
-                speed = random.uniform(5, 10)
-                vx = math.cos(angle) * speed
-                vy = math.sin(angle) * speed
-                new_burst_particles.append(Particle(self.x, self.y, vx, vy, self.color, random.randint(3, 6), "chain_explosion", initial_life=random.randint(20, 40)))
-            return new_burst_particles
+        # Return any new particles generated (e.g., for branching lightning, chain reaction)
+        if behavior.spawn:
+            return behavior.spawn(self)
         return [] # Default: no new particles
 
-    def draw(self, screen):
-        # Draw trail
-        for i, pos in enumerate(self.trail[:-1]):
-            alpha = (i / len(self.trail)) * (self.life / self.max_life)
-            if alpha > 0:
-                trail_color = (int(self.color[0] * alpha * 0.5), 
-                             int(self.color[1] * alpha * 0.5), 
-                             int(self.color[2] * alpha * 0.5))
-                trail_size = max(1, int(self.current_size * alpha * 0.5)) # Thinner trail
-                pygame.draw.circle(screen, trail_color, (int(pos[0]), int(pos[1])), trail_size)
-        
-        # Draw particle with special effects
-        if self.life > 0:
-            x, y = int(self.x), int(self.y)
-            
-            if self.special_type == "electric":
-                # Electric particles with lightning effect
-                for i in range(3):
-                    offset_x = random.randint(-3, 3)
-                    offset_y = random.randint(-3, 3)
-                    pygame.draw.circle(screen, (255, 255, 100), 
-                                     (x + offset_x, y + offset_y), 1)
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                
-            elif self.special_type == "bubble":
-                # Bubble with highlight
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                pygame.draw.circle(screen, (255, 255, 255), 
-                                 (x - self.current_size//3, y - self.current_size//3), 
-                                 max(1, self.current_size//3))
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size, 2)
-                
-            elif self.special_type == "snow":
-                # Snowflake shape
-                for angle in range(0, 360, 60):
-                    end_x = x + math.cos(math.radians(angle + self.rotation)) * self.current_size
-                    end_y = y + math.sin(math.radians(angle + self.rotation)) * self.current_size
-                    pygame.draw.line(screen, self.current_color, (x, y), (end_x, end_y), 1)
-                pygame.draw.circle(screen, self.current_color, (x, y), 2)
-                
-            elif self.special_type == "spiral":
-                # Spiral with rotating arms
-                for i in range(4):
-                    angle = self.rotation + i * math.pi / 2
-                    end_x = x + math.cos(angle) * self.current_size * 2
-                    end_y = y + math.sin(angle) * self.current_size * 2
-                    pygame.draw.line(screen, self.current_color, (x, y), (end_x, end_y), 2)
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-            
-            elif self.special_type == "rain":
-                # Draw as a small line for raindrop effect
-                line_length = self.current_size * 2
-                end_x = x - self.vx * 0.5
-                end_y = y - self.vy * 0.5
-                pygame.draw.line(screen, self.current_color, (x, y), (end_x, end_y), 1)
-                
-            elif self.special_type == "smoke":
-                # Draw as a soft, larger circle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                
-            elif self.special_type == "confetti":
-                # Draw as a rotating rectangle/square
-                half_size = self.current_size / 2
-                points = [
-                    (x + half_size * math.cos(self.rotation) - half_size * math.sin(self.rotation),
-                     y + half_size * math.sin(self.rotation) + half_size * math.cos(self.rotation)),
-                    (x - half_size * math.cos(self.rotation) - half_size * math.sin(self.rotation),
-                     y - half_size * math.sin(self.rotation) + half_size * math.cos(self.rotation)),
-                    (x - half_size * math.cos(self.rotation) + half_size * math.sin(self.rotation),
-                     y - half_size * math.sin(self.rotation) - half_size * math.cos(self.rotation)),
-                    (x + half_size * math.cos(self.rotation) + half_size * math.sin(self.rotation),
-                     y + half_size * math.sin(self.rotation) - half_size * math.cos(self.rotation))
-                ]
-                pygame.draw.polygon(screen, self.current_color, points)
-            
-            elif self.special_type == "blackhole":
-                # Draw as small, dark, intense circles
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                
-            elif self.special_type == "fluid":
-                # Draw as slightly larger, solid circles
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-
-            elif self.special_type == "crystal":
-                # Draw as a rotating square
-                half_size = self.current_size / 2
-                points = [
-                    (x + half_size * math.cos(self.rotation) - half_size * math.sin(self.rotation),
-                     y + half_size * math.sin(self.rotation) + half_size * math.cos(self.rotation)),
-                    (x - half_size * math.cos(self.rotation) - half_size * math.sin(self.rotation),
-                     y - half_size * math.sin(self.rotation) + half_size * math.cos(self.rotation)),
-                    (x - half_size * math.cos(self.rotation) + half_size * math.sin(self.rotation),
-                     y - half_size * math.sin(self.rotation) - half_size * math.cos(self.rotation)),
-                    (x + half_size * math.cos(self.rotation) + half_size * math.sin(self.rotation),
-                     y + half_size * math.sin(self.rotation) - half_size * math.cos(self.rotation))
-                ]
-                pygame.draw.polygon(screen, self.current_color, points)
-                
-            elif self.special_type == "lightning":
-                # Draw as a very bright, small circle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                # Add a bright glow
-                pygame.draw.circle(screen, (255, 255, 255), (x, y), self.current_size + 1, 1)
-
-            elif self.special_type == "lava":
-                # Draw as a large, glowing circle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                # Add inner glow
-                pygame.draw.circle(screen, (min(255, self.current_color[0] + 50),
-                                            min(255, self.current_color[1] + 50),
-                                            min(255, self.current_color[2] + 50)),
-                                   (x, y), self.current_size - 2, 1)
-
-            elif self.special_type == "firefly":
-                # Draw as a small, soft glowing circle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                # Add a larger, very faint outer glow
-                glow_alpha = int((self.current_color[0] + self.current_color[1] + self.current_color[2]) / 3 * 0.1)
-                glow_color = (self.current_color[0], self.current_color[1], self.current_color[2], glow_alpha)
-                # Pygame draw.circle doesn't support alpha directly, so we'll draw a surface
-                s = pygame.Surface((self.current_size * 4, self.current_size * 4), pygame.SRCALPHA)
-                pygame.draw.circle(s, glow_color, (self.current_size * 2, self.current_size * 2), self.current_size * 1.5)
-                screen.blit(s, (x - self.current_size * 2, y - self.current_size * 2))
-
-            elif self.special_type == "nebula":
-                # Draw as a very large, soft, transparent circle
-                s = pygame.Surface((self.current_size * 4, self.current_size * 4), pygame.SRCALPHA)
-                current_alpha = int(self.current_color[0] / self.color[0] * 255) if self.color[0] > 0 else 0
-                nebula_color = (self.color[0], self.color[1], self.color[2], int(current_alpha * 0.1)) # Very low alpha
-                pygame.draw.circle(s, nebula_color, (self.current_size * 2, self.current_size * 2), self.current_size * 2)
-                screen.blit(s, (x - self.current_size * 2, y - self.current_size * 2))
-
-            elif self.special_type == "solar":
-                # Draw as a bright core with a larger, fading corona
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                # Corona effect
-                corona_alpha = int(self.current_color[0] / self.color[0] * 255 * 0.3) if self.color[0] > 0 else 0
-                corona_color = (self.color[0], self.color[1], self.color[2], corona_alpha)
-                s = pygame.Surface((self.current_size * 6, self.current_size * 6), pygame.SRCALPHA)
-                pygame.draw.circle(s, corona_color, (self.current_size * 3, self.current_size * 3), self.current_size * 2.5)
-                screen.blit(s, (x - self.current_size * 3, y - self.current_size * 3))
-            
-            elif self.special_type == "vortex":
-                # Draw as small, slightly glowing circles
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                glow_color = (min(255, self.current_color[0] + 30),
-                              min(255, self.current_color[1] + 30),
-                              min(255, self.current_color[2] + 30))
-                pygame.draw.circle(screen, glow_color, (x, y), self.current_size + 1, 1)
-
-            elif self.special_type == "aurora":
-                # Draw as elongated, very transparent shapes or lines
-                # Using a surface for alpha blending
-                s = pygame.Surface((self.current_size * 4, self.current_size * 4), pygame.SRCALPHA)
-                current_alpha = int(self.current_color[0] / self.color[0] * 255) if self.color[0] > 0 else 0
-                aurora_color = (self.color[0], self.color[1], self.color[2], int(current_alpha * 0.15)) # Very low alpha
-                
-                # Draw an elongated ellipse for a ribbon effect
-                ellipse_rect = pygame.Rect(0, 0, self.current_size * 3, self.current_size)
-                ellipse_rect.center = (self.current_size * 2, self.current_size * 2)
-                pygame.draw.ellipse(s, aurora_color, ellipse_rect, 0)
-                
-                # Rotate the surface to give a flowing look
-                rotated_s = pygame.transform.rotate(s, self.rotation)
-                rotated_rect = rotated_s.get_rect(center=(x, y))
-                screen.blit(rotated_s, rotated_rect)
-
-            elif self.special_type == "geyser":
-                # Draw as simple circles, maybe with a slight trail
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                
-            elif self.special_type == "swarm":
-                # Draw as small triangles pointing in direction of velocity
-                if math.hypot(self.vx, self.vy) > 0.1: # Only if moving
-                    angle = math.atan2(self.vy, self.vx)
-                    # Create a triangle pointing in the direction of movement
-                    p1 = (x + self.current_size * math.cos(angle), y + self.current_size * math.sin(angle))
-                    p2 = (x + self.current_size * 0.5 * math.cos(angle - 2*math.pi/3), y + self.current_size * 0.5 * math.sin(angle - 2*math.pi/3))
-                    p3 = (x + self.current_size * 0.5 * math.cos(angle + 2*math.pi/3), y + self.current_size * 0.5 * math.sin(angle + 2*math.pi/3))
-                    pygame.draw.polygon(screen, self.current_color, [p1, p2, p3])
-                else:
-                    pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-            
-            elif self.special_type == "gravity_field":
-                # Draw as a glowing circle, color indicating attraction/repulsion
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                glow_color = (min(255, self.current_color[0] + 20),
-                              min(255, self.current_color[1] + 20),
-                              min(255, self.current_color[2] + 20))
-                pygame.draw.circle(screen, glow_color, (x, y), self.current_size + 2, 1)
-
-            elif self.special_type == "flowing_stream":
-                # Draw as small, slightly transparent circles
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-            
-            elif self.special_type == "bouncing_collision":
-                # Draw as solid, distinct circles
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-            
-            elif self.special_type == "explosion_implosion":
-                # Draw as a solid circle, shrinking/fading
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-
-            elif self.special_type == "wave_ripple":
-                # Draw as a very transparent, expanding circle
-                s = pygame.Surface((self.current_size * 4, self.current_size * 4), pygame.SRCALPHA)
-                current_alpha = int(self.current_color[0] / self.color[0] * 255) if self.color[0] > 0 else 0
-                ripple_color = (self.color[0], self.color[1], self.color[2], int(current_alpha * 0.1)) # Very low alpha
-                pygame.draw.circle(s, ripple_color, (self.current_size * 2, self.current_size * 2), self.current_size * 2)
-                screen.blit(s, (x - self.current_size * 2, y - self.current_size * 2))
-
-            elif self.special_type == "path_follower":
-                # Draw as small, distinct circles with a trail
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-
-            elif self.special_type == "spring_attraction":
-                # Draw as a glowing circle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                glow_color = (min(255, self.current_color[0] + 30),
-                              min(255, self.current_color[1] + 30),
-                              min(255, self.current_color[2] + 30))
-                pygame.draw.circle(screen, glow_color, (x, y), self.current_size + 1, 1)
-            
-            elif self.special_type == "pixel_painter":
-                # Draw as a solid square for a pixel effect
-                pygame.draw.rect(screen, self.current_color, (x - self.current_size/2, y - self.current_size/2, self.current_size, self.current_size))
+    def update_electric(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Electric particles zigzag
+        self.vx += random.uniform(-1, 1)
+        self.vy += random.uniform(-0.5, 0.5)
+
+    def update_magnetic(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Magnetic particles curve
+        self.vx += math.sin(self.age * 0.1) * 0.5
+        self.vy += math.cos(self.age * 0.1) * 0.3
+
+    def update_bubble(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Bubbles float upward
+        self.vy -= 0.3
+        self.vx += random.uniform(-0.2, 0.2)
+
+    def update_snow(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Snow drifts slowly
+        self.vx += math.sin(self.age * 0.05) * 0.2
+        self.vy = abs(self.vy) * 0.3  # Always fall down slowly
+
+    def update_spiral(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Spiral particles rotate around their path
+        angle = self.age * 0.2
+        self.vx += math.cos(angle) * 0.3
+        self.vy += math.sin(angle) * 0.3
+
+    def update_rain(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Rain falls mostly straight, slight wind
+        self.vy += GRAVITY * 0.5 # Less affected by gravity
+        self.vx += random.uniform(-0.1, 0.1) # Slight horizontal drift
+        self.vx *= 0.98 # Less damping
+        self.vy *= 0.98 # Less damping
+
+    def update_smoke(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Smoke rises and expands
+        self.vy -= 0.15 # Rise upward
+        self.vx += random.uniform(-0.1, 0.1) # Gentle horizontal drift
+        self.size += 0.05 # Expand over time
+        self.vx *= 0.95 # Less damping for a floaty feel
+        self.vy *= 0.95 # Less damping
+
+    def update_confetti(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Confetti flutters down with rotation
+        self.vy += GRAVITY * 0.8 # Affected by gravity
+        self.vx += math.sin(self.age * 0.1) * 0.5 # Flutter horizontally
+        self.spin_speed = random.uniform(-0.5, 0.5) # Faster spin
+
+    def update_attractor(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not mouse_pos:
+            return
+        # Attractor mode: particles drawn to mouse_pos
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        if dist > 0.1: # Use a small epsilon to prevent division by zero or near-zero
+            force_strength = 0.5 / (dist ** 0.5) # Inverse square root for softer attraction
+            self.vx += dx / dist * force_strength
+            self.vy += dy / dist * force_strength
+            # Add a slight tangential force for swirling effect
+            self.vx -= dy / dist * 0.05
+            self.vy += dx / dist * 0.05
+        else: # If very close to the mouse, slow down
+            self.vx *= 0.8
+            self.vy *= 0.8
 
-            elif self.special_type == "chain_explosion":
-                # Draw as small, bright, fading circles
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
+    def update_blackhole(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not mouse_pos:
+            return
+        # Blackhole: particles spiral into mouse_pos
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        if dist > 5: # Avoid extreme forces at center
+            # Stronger attraction
+            force_strength = 1000 / (dist ** 2) # Inverse square law for stronger pull
+            self.vx += dx / dist * force_strength
+            self.vy += dy / dist * force_strength
+            # Tangential force for spiraling
+            self.vx -= dy / dist * (force_strength * 0.5)
+            self.vy += dx / dist * (force_strength * 0.5)
+        else: # If very close, slow down and eventually disappear
+            self.vx *= 0.5
+            self.vy *= 0.5
+            self.life -= 5 # Accelerate fading
+        self.vx *= 0.9 # Less damping to maintain speed
+        self.vy *= 0.9 # Less damping
+
+    def update_fluid(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Fluid: very low gravity, high damping, gentle movement
+        self.vy += GRAVITY * 0.1 # Very slight gravity
+        self.vx *= 0.95 # High damping
+        self.vy *= 0.95 # High damping
+        self.spin_speed = 0 # No rotation
+
+    def update_crystal(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Crystal: falls with gravity, rotates
+        self.vy += GRAVITY * 0.5 # Slower fall
+        self.spin_speed = random.uniform(-0.1, 0.1) # Consistent spin
+
+    def update_lightning(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Lightning: erratic movement, short life, potential to branch
+        self.vx += random.uniform(-5, 5)
+        self.vy += random.uniform(-5, 5)
+        self.life -= 1.65 # How visible it is
+        self.extra.branch_timer -= 1
+        if self.extra.branch_timer <= 0 and not self.extra.branched:
+            self.extra.branched = True
+            # Return new particles to be created by the system, with slightly longer life
+            return [
+                self.pool.acquire(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40)),
+                self.pool.acquire(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40))
+            ]
 
-            elif self.special_type == "light_tracer":
-                # Draw as a small, bright point
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                
-            elif self.special_type == "sound_visualizer":
-                # Draw as a pulsating circle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                # Add a subtle outer glow that also pulses
-                glow_alpha = int((self.current_color[0] + self.current_color[1] + self.current_color[2]) / 3 * 0.05)
-                glow_color = (self.color[0], self.color[1], self.color[2], glow_alpha)
-                s = pygame.Surface((self.current_size * 4, self.current_size * 4), pygame.SRCALPHA)
-                pygame.draw.circle(s, glow_color, (self.current_size * 2, self.current_size * 2), self.current_size * 1.5)
-                screen.blit(s, (x - self.current_size * 2, y - self.current_size * 2))
-
-            elif self.special_type == "constellation":
-                # Draw as a small, slightly glowing star-like particle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                glow_color = (min(255, self.current_color[0] + 20),
-                              min(255, self.current_color[1] + 20),
-                              min(255, self.current_color[2] + 20))
-                pygame.draw.circle(screen, glow_color, (x, y), self.current_size + 1, 1)
-                
+    def update_lava(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Lava: slow, heavy, emits smoke
+        self.vy += GRAVITY * 0.5 # Slow fall
+        self.vx *= 0.98
+        self.vy *= 0.98
+        if self.age % 10 == 0: # Emit smoke periodically
+            return [self.pool.acquire(self.x, self.y, random.uniform(-0.5, 0.5), random.uniform(-1, -0.2), (100, 100, 100), random.randint(3, 6), "smoke")]
+
+    def update_firefly(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Firefly: gentle random walk, no gravity, pulsating brightness
+        self.vx += random.uniform(-0.1, 0.1)
+        self.vy += random.uniform(-0.1, 0.1)
+        self.vx *= 0.99
+        self.vy *= 0.99
+        # Keep within bounds gently
+        if self.x < 0 or self.x > WIDTH: self.vx *= -1
+        if self.y < 0 or self.y > HEIGHT: self.vy *= -1
+
+    def update_nebula(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Nebula: very slow, expands, fades, no gravity
+        self.vx *= 0.99
+        self.vy *= 0.99
+        self.size += 0.1 # Gradually expand
+        self.life -= 0.5 # Slower fade
+
+    def update_vortex(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not mouse_pos:
+            return
+        # Vortex: particles spiral into mouse_pos, but less aggressively than blackhole
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        if dist > 1:
+            force_strength = 50 / (dist ** 1.5) # Inverse square root for softer attraction
+            self.vx += dx / dist * force_strength
+            self.vy += dy / dist * force_strength
+            # Tangential force for spiraling
+            self.vx -= dy / dist * (force_strength * 0.2)
+            self.vy += dx / dist * (force_strength * 0.2)
+        else: # If very close, slow down
+            self.vx *= 0.8
+            self.vy *= 0.8
+        self.vx *= 0.95 # Some damping
+        self.vy *= 0.95 # Some damping
+
+    def update_aurora(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Aurora: drifts slowly upward/sideways, very transparent
+        self.vy -= 0.05 # Gentle upward drift
+        self.vx += math.sin(self.age * 0.02) * 0.1 # Gentle horizontal sway
+        self.vx *= 0.99
+        self.vy *= 0.99
+        self.size += 0.02 # Slowly expand
+        self.life -= 0.2 # Very slow fade
+
+    def update_geyser(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Geyser: strong initial upward force, then gravity takes over
+        # Only apply initial upward force once or based on age
+        if self.age < 10: # Initial burst
+            self.vy -= 0.5 # Continuous upward push for a short duration
+        self.vy += GRAVITY * 0.8 # Gravity pulls it down
+        if self.y > self.extra.initial_y + 10: # If it falls below initial point, consider it "splashed"
+            self.life = 0 # Mark for removal
+            # Could add a splash effect here by returning new small particles
+
+    def update_swarm(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not mouse_pos:
+            return
+        # Swarm: particles try to move towards mouse_pos and stay somewhat together
+        # Simple cohesion and attraction to mouse
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        if dist > 50: # Attract towards mouse if far
+            self.vx += dx / dist * 0.1
+            self.vy += dy / dist * 0.1
+        elif dist < 20: # Repel from mouse if too close
+            self.vx -= dx / dist * 0.05
+            self.vy -= dy / dist * 0.05
+        
+        # Add some random movement to make it look organic
+        self.vx += random.uniform(-0.1, 0.1)
+        self.vy += random.uniform(-0.1, 0.1)
+
+        self.vx *= 0.98 # Damping
+        self.vy *= 0.98 # Damping
+
+    def update_gravity_field(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not (mouse_pos and mouse_buttons):
+            return
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        
+        if dist > 0.1:
+            force_direction = 5 # Attraction by default
+            if mouse_buttons[2]: # Right-click for repulsion (button 2 is right mouse button)
+                force_direction = -7
+            
+            # Inverse square law for stronger force closer to the mouse
+            force_strength = 100 / (dist ** 1.5) 
+            
+            self.vx += dx / dist * force_strength * force_direction
+            self.vy += dy / dist * force_strength * force_direction
+            
+            # Add a slight tangential force for orbiting effect if attracting
+            if force_direction == 1:
+                self.vx -= dy / dist * (force_strength * 0.1)
+                self.vy += dx / dist * (force_strength * 0.1)
+        else: # If very close to the mouse, slow down
+            self.vx *= 0.8
+            self.vy *= 0.8
+        self.vx *= 0.97 # Some damping
+        self.vy *= 0.97 # Some damping
+
+    def update_flowing_stream(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Very low gravity, very low damping to maintain flow
+        self.vy += GRAVITY * 0.05
+        self.vx *= 0.995
+        self.vy *= 0.995
+        self.size += 0.01 # Slowly expand to give a dissipating effect
+        self.life -= 0.5 # Slightly faster fade
+
+    def update_bouncing_collision(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Apply normal gravity
+        self.vy += GRAVITY
+        # Bounce off walls
+        if self.x < 0:
+            self.x = 0
+            self.vx *= -0.8 # Bounce with energy loss
+        elif self.x > WIDTH:
+            self.x = WIDTH
+            self.vx *= -0.8
+        if self.y < 0:
+            self.y = 0
+            self.vy *= -0.8
+        elif self.y > HEIGHT:
+            self.y = HEIGHT
+            self.vy *= -0.8
+        self.vx *= DAMPING # Apply general damping
+        self.vy *= DAMPING
+
+    def update_explosion_implosion(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if self.target_pos: # This particle is part of an implosion
+            dx = self.target_pos[0] - self.x
+            dy = self.target_pos[1] - self.y
+            dist = math.hypot(dx, dy)
+            if dist > 1:
+                force_strength = 200 / (dist ** 2) # Strong attraction to origin
+                self.vx += dx / dist * force_strength
+                self.vy += dy / dist * force_strength
             else:
-                # Default particle
-                pygame.draw.circle(screen, self.current_color, (x, y), self.current_size)
-                # Add glow effect
-                glow_color = (min(255, self.current_color[0] + 50),
-                             min(255, self.current_color[1] + 50),
-                             min(255, self.current_color[2] + 50))
-                pygame.draw.circle(screen, glow_color, (x, y), self.current_size + 2, 1)
-
-class ParticleSystem:
-    def __init__(self):
-        self.particles = []
-        self.emitters = []
-        self.mode = "fountain"  # All modes: fountain, fireworks, paint, electric, bubbles, snow, spiral, galaxy, tornado, rain, smoke, confetti, attractor, blackhole, fluid, crystal, lightning, lava, firefly, nebula, solar, vortex, aurora, geyser, swarm, gravity_field, flowing_stream, bouncing_collision, explosion_implosion, wave_ripple, path_follower, spring_attraction, pixel_painter, chain_reaction, light_tracer, sound_visualizer, constellation
-        self.pixel_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255), (255, 0, 255)]
-        self.pixel_color_index = 0
-        self.simulated_beat_timer = 0
-        self.simulated_beat_frequency = 0.05 # How fast the beat pulses (higher = faster)
-        self.simulated_beat_strength = 0 # Current strength of the beat (0 to 1)
-
-    def get_next_pixel_color(self):
-        color = self.pixel_colors[self.pixel_color_index]
-        self.pixel_color_index = (self.pixel_color_index + 1) % len(self.pixel_colors)
-        return color
+                self.life -= 10 # Accelerate fading if very close to center
+        # Apply damping for both explosion and implosion
+        self.vx *= 0.95
+        self.vy *= 0.95
+        self.size -= 0.05 # Shrink over time
+
+    def update_wave_ripple(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Particles expand outwards and fade
+        self.size += 0.1 # Grow in size
+        self.life -= 1 # Fade
+        self.vx *= 0.99 # Slight damping
+        self.vy *= 0.99 # Slight damping
+
+    def update_path_follower(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not mouse_pos:
+            return
+        # Particles try to follow the mouse's current position
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        if dist > 10: # Only apply force if not too close
+            self.vx += dx / dist * 0.5
+            self.vy += dy / dist * 0.5
         
-    def create_fountain(self, x, y):
-        for _ in range(5):
-            angle = random.uniform(-math.pi/3, -2*math.pi/3)
-            speed = random.uniform(5, 15)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            # Rainbow colors
-            hue = random.random()
-            rgb = colorsys.hsv_to_rgb(hue, 0.8, 1.0)
-            color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-            
-            size = random.randint(2, 5)
-            self.particles.append(Particle(x, y, vx, vy, color, size))
-            
-    def create_firework(self, x, y):
-        for _ in range(20):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(8, 20)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            # Warm explosion colors
-            colors = [(255, 100, 100), (255, 200, 100), (255, 255, 100), 
-                     (255, 150, 200), (200, 100, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(3, 6)
-            self.particles.append(Particle(x, y, vx, vy, color, size))
-            
-    def create_paint_splash(self, x, y, mouse_vel):
-        for _ in range(8):
-            angle = random.uniform(-math.pi/4, math.pi/4)
-            speed = random.uniform(3, 12)
-            vx = math.cos(angle) * speed + mouse_vel[0] * 0.3
-            vy = math.sin(angle) * speed + mouse_vel[1] * 0.3
-            
-            # Cool paint colors
-            colors = [(100, 150, 255), (150, 100, 255), (100, 255, 150), 
-                     (255, 100, 150), (255, 255, 100)]
-            color = random.choice(colors)
-            
-            size = random.randint(4, 8)
-            self.particles.append(Particle(x, y, vx, vy, color, size))
-            
-    def create_electric_storm(self, x, y):
-        for _ in range(3):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(5, 15)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            # Electric colors
-            colors = [(40, 0, 80), (80, 0, 120), (30, 30, 30)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "electric"))
-            
-    def create_bubbles(self, x, y):
-        for _ in range(4):
-            vx = random.uniform(-2, 2)
-            vy = random.uniform(-5, -1)
-            
-            # Bubble colors
-            colors = [(100, 200, 255), (150, 220, 255), (200, 240, 255), (255, 255, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(5, 12)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "bubble"))
-            
-    def create_snow(self, x, y):
-        for _ in range(6):
-            vx = random.uniform(-1, 1)
-            vy = random.uniform(0.5, 3)
-            
-            # Snow colors
-            colors = [(255, 255, 255), (240, 240, 255), (220, 220, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(3, 6)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "snow"))
-            
-    def create_spiral(self, x, y):
-        for _ in range(3):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(3, 8)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            # Spiral colors
-            colors = [(255, 100, 255), (255, 150, 100), (100, 255, 255), (255, 255, 100)]
-            color = random.choice(colors)
-            
-            size = random.randint(3, 5)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "spiral"))
-            
-    def create_galaxy(self, x, y):
-        for _ in range(8):
-            angle = random.uniform(0, 2 * math.pi)
-            distance = random.uniform(0, 50)
-            start_x = x + math.cos(angle) * distance
-            start_y = y + math.sin(angle) * distance
-            
-            vx = -math.sin(angle) * 3 + random.uniform(-1, 1)
-            vy = math.cos(angle) * 3 + random.uniform(-1, 1)
-            
-            colors = [(150, 100, 255), (100, 150, 255), (255, 200, 100), (255, 100, 200)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "magnetic"))
-            
-    def create_tornado(self, x, y):
-        for _ in range(6):
-            angle = random.uniform(0, 2 * math.pi)
-            radius = random.uniform(5, 25)
-            start_x = x + math.cos(angle) * radius
-            start_y = y + random.uniform(0, 30)
-            
-            vx = -math.sin(angle) * 4
-            vy = random.uniform(-8, -3)
-            
-            colors = [(200, 200, 200), (150, 150, 150), (180, 180, 180), (220, 220, 220)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 5)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "spiral"))
-
-    def create_rain(self, x, y):
-        for _ in range(3):
-            start_x = x + random.uniform(-20, 20)
-            start_y = y - random.uniform(50, 100)
-            vx = random.uniform(-0.5, 0.5)
-            vy = random.uniform(5, 10)
-            
-            colors = [(100, 150, 200), (120, 170, 220), (150, 180, 230), (180, 200, 240)]
-            color = random.choice(colors)
-            
-            size = random.randint(1, 3)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "rain"))
-
-    def create_smoke(self, x, y):
-        for _ in range(2):
-            vx = random.uniform(-1, 1)
-            vy = random.uniform(-2, -0.5)
-            
-            colors = [(100, 100, 100), (150, 150, 150), (200, 200, 200), (230, 230, 230)]
-            color = random.choice(colors)
-            
-            size = random.randint(5, 10)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "smoke"))
+        self.vx *= 0.9 # Damping
+        self.vy *= 0.9 # Damping
+
+    def update_spring_attraction(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        if not mouse_pos:
+            return
+        # Spring-like attraction to mouse
+        dx = mouse_pos[0] - self.x
+        dy = mouse_pos[1] - self.y
+        dist = math.hypot(dx, dy)
+        spring_constant = 0.05 # How strong the spring is
+        if dist > 1:
+            self.vx += dx * spring_constant
+            self.vy += dy * spring_constant
+        
+        # Slight repulsion from other particles (simple approximation)
+        if spatial_index is not None:
+            neighbors = spatial_index.query_items(self.x, self.y) # Spring particles in nearby cells only
+        else:
+            neighbors = all_particles or []
+        for other_p in neighbors:
+            if other_p is not self and other_p.special_type == "spring_attraction":
+                odx = self.x - other_p.x
+                ody = self.y - other_p.y
+                odist = math.hypot(odx, ody)
+                if 0 < odist < SPRING_REPULSION_RADIUS: # Repel if too close
+                    repel_force = 1 / (odist ** 0.5) # Inverse square root for softer repulsion
+                    self.vx += odx / odist * repel_force * 0.1
+                    self.vy += ody / odist * repel_force * 0.1
+        
+        self.vx *= 0.95 # Damping
+        self.vy *= 0.95 # Damping
 
-    def create_confetti(self, x, y):
-        for _ in range(5):
-            vx = random.uniform(-3, 3)
-            vy = random.uniform(-5, 0)
-            
-            hue = random.random()
-            rgb = colorsys.hsv_to_rgb(hue, 0.9, 1.0)
-            color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-            
-            size = random.randint(4, 7)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "confetti"))
+    def update_pixel_painter(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Particles try to stay at their target_x, target_y
+        dx = self.extra.target_x - self.x
+        dy = self.extra.target_y - self.y
+        
+        # Strong damping to make them settle quickly
+        self.vx *= 0.8
+        self.vy *= 0.8
+        
+        # Gentle force to move towards target
+        self.vx += dx * 0.05
+        self.vy += dy * 0.05
+        
+        # If very close to target, stop movement
+        if math.hypot(dx, dy) < 1:
+            self.x = self.extra.target_x
+            self.y = self.extra.target_y
+            self.vx = 0
+            self.vy = 0
 
-    def create_attractor(self, x, y):
-        for _ in range(5):
+    def update_chain_explosion(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # These particles just move outwards and fade quickly
+        self.life -= 5 # Very short life
+        self.vx *= 0.98
+        self.vy *= 0.98
+
+    def update_light_tracer(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Very low damping, almost no gravity
+        self.vy += GRAVITY * 0.01 # Minimal gravity
+        self.vx *= 0.999 # Very low damping
+        self.vy *= 0.999 # Very low damping
+
+    def update_sound_visualizer(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Particles pulse in size and brightness based on simulated_beat
+        pulse_factor = (math.sin(self.age * 0.1 + self.extra.pulse_offset) + 1) / 2 # 0 to 1
+        # Incorporate simulated_beat into the pulse
+        self.current_size = max(1, int(self.extra.base_size * (1 + pulse_factor * 0.5 + simulated_beat * 0.8)))
+        # No gravity, just drift slightly
+        self.vx += random.uniform(-0.05, 0.05)
+        self.vy += random.uniform(-0.05, 0.05)
+        self.vx *= 0.99
+        self.vy *= 0.99
+
+    def update_constellation(self, mouse_pos, mouse_buttons, all_particles, simulated_beat, spatial_index):
+        # Particles drift very slowly, no gravity
+        self.vx *= 0.995
+        self.vy *= 0.995
+        self.vx += random.uniform(-0.02, 0.02)
+        self.vy += random.uniform(-0.02, 0.02)
+
+    def fade_firefly(self, alpha, mouse_pos):
+        # Handle pulsating for fireflies
+        pulse_factor = (math.sin(self.age * self.extra.pulse_speed + self.extra.pulse_offset) + 1) / 2 # 0 to 1
+        current_alpha = alpha * (0.5 + pulse_factor * 0.5) # Base transparency + pulse
+        self.current_color = self.ramp[int(current_alpha * RAMP_STEPS)] if current_alpha > 0 else BLACK
+        self.current_size = max(1, int(self.initial_size * (0.8 + pulse_factor * 0.2))) # Size also pulses
+
+    def fade_solar(self, alpha, mouse_pos):
+        # Fade based on distance from origin or time
+        # Ensure mouse_pos is available for solar mode
+        if mouse_pos:
+            distance_ratio = math.hypot(self.x - mouse_pos[0], self.y - mouse_pos[1]) / (self.max_life * self.extra.initial_speed) # Rough distance ratio
+            current_alpha = max(0, alpha - distance_ratio * 0.5) # Fade faster with distance
+        else: # Fallback if mouse_pos somehow not passed (shouldn't happen in solar mode)
+            current_alpha = alpha
+        self.current_color = self.ramp[int(current_alpha * RAMP_STEPS)] if current_alpha > 0 else BLACK
+        self.current_size = max(1, int(self.size * current_alpha)) # Size also fades
+
+    def fade_sound_visualizer(self, alpha, mouse_pos):
+        # Color also pulses with beat
+        pulse_color_factor = (math.sin(self.age * 0.1 + self.extra.pulse_offset) + 1) / 2
+        current_alpha = alpha * (0.5 + pulse_color_factor * 0.5)
+        self.current_color = self.ramp[int(current_alpha * RAMP_STEPS)] if current_alpha > 0 else BLACK
+        # Size is handled in update method
+
+    def spawn_lightning(self):
+        if not self.extra.branched:
+            return []
+        self.extra.branched = False # Reset to prevent continuous branching from one particle
+        return [
+            self.pool.acquire(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40)),
+            self.pool.acquire(self.x, self.y, random.uniform(-5, 5), random.uniform(-5, 5), self.color, self.size, "lightning", initial_life=random.randint(20, 40))
+        ]
+
+    def spawn_chain_starter(self):
+        # This particle immediately triggers an explosion and then dies
+        self.life = 0 # Mark for removal
+        new_burst_particles = []
+        for _ in range(random.randint(10, 20)): # Create a burst of particles
             angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(2, 5)
+            speed = random.uniform(5, 10)
             vx = math.cos(angle) * speed
             vy = math.sin(angle) * speed
-            
-            colors = [(50, 0, 50), (0, 50, 50), (50, 50, 0), (20, 20, 20)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "attractor", (x, y)))
-
-    def create_blackhole(self, x, y):
-        for _ in range(8):
-            angle = random.uniform(0, 2 * math.pi)
-            distance = random.uniform(50, 150)
-            start_x = x + math.cos(angle) * distance
-            start_y = y + math.sin(angle) * distance
-            
-            speed = random.uniform(0.5, 2)
-            vx = -math.cos(angle) * speed * 0.5 - math.sin(angle) * speed * 0.5
-            vy = -math.sin(angle) * speed * 0.5 + math.cos(angle) * speed * 0.5
-            
-            colors = [(40, 0, 80), (80, 0, 120), (30, 30, 30)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 5)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "blackhole", (x, y)))
-
-    def create_fluid(self, x, y):
-        for _ in range(10):
-            vx = random.uniform(-1, 1)
-            vy = random.uniform(-1, 1)
-            
-            colors = [(50, 100, 200), (70, 120, 220), (90, 140, 240)]
-            color = random.choice(colors)
-            
-            size = random.randint(6, 10)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "fluid"))
-
-    def create_crystal(self, x, y):
-        for _ in range(4):
-            vx = random.uniform(-2, 2)
-            vy = random.uniform(-3, 0)
-            
-            colors = [(150, 200, 255), (200, 255, 255), (255, 255, 255), (100, 150, 200)]
-            color = random.choice(colors)
-            
-            size = random.randint(5, 8)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "crystal"))
-
-    def create_lightning(self, x, y):
-        color = (255, 255, 150)
-        size = random.randint(2, 4)
-        vx = random.uniform(-5, 5)
-        vy = random.uniform(-5, 5)
-        self.particles.append(Particle(x, y, vx, vy, color, size, "lightning", initial_life=60)) 
-
-    def create_lava(self, x, y):
-        for _ in range(3):
-            vx = random.uniform(-1, 1)
-            vy = random.uniform(-3, -1)
-            
-            colors = [(255, 50, 0), (255, 100, 0), (255, 150, 0), (200, 50, 0)]
-            color = random.choice(colors)
-            
-            size = random.randint(8, 15)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "lava"))
-
-    def create_firefly(self, x, y):
-        for _ in range(2):
-            vx = random.uniform(-0.5, 0.5)
-            vy = random.uniform(-0.5, 0.5)
-            
-            colors = [(150, 255, 150), (200, 255, 200), (255, 255, 150), (100, 200, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(3, 6)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "firefly"))
+            new_burst_particles.append(self.pool.acquire(self.x, self.y, vx, vy, self.color, random.randint(3, 6), "chain_explosion", initial_life=random.randint(20, 40)))
+        return new_burst_particles
+
+    def trail_points(self):
+        # Flat trail oldest point first, unrolling the ring once it has wrapped
+        head = self.trail_head
+        return self.trail[head:] + self.trail[:head] if head else self.trail
+
+    def draw(self, screen, alpha=1.0, detail=None):
+        # alpha: how far between the previous and the current update to draw the particle (see FixedTimestep)
+        # detail: the DrawDetail (LOD level) to draw at, full detail if None
+        draw_trail(screen, self.trail_points(), self.color, self.life / self.max_life, self.current_size,
+                   detail.trail_stride if detail else 1)
+        
+        # Draw particle with special effects
+        if self.life > 0:
+            x, y = self.x, self.y
+            if alpha != 1:
+                x += (x - self.prev_x) * (alpha - 1)
+                y += (y - self.prev_y) * (alpha - 1)
+            if detail:
+                draw_body_at_detail(screen, detail, self.special_type, int(x), int(y), self.current_size,
+                                    self.current_color, self.color, self.rotation, self.vx, self.vy)
+            else:
+                self.behavior.draw(screen, int(x), int(y), self.current_size,
+                                   self.current_color, self.color, self.rotation, self.vx, self.vy)
+
+class SpriteCache:
+    # Pre-rendered alpha-blended glow sprites. Each unique (type, size, color, alpha, rotation) glow is
+    # rasterized once and blitted many times; the least recently used sprites are evicted once the
+    # cache grows past its memory budget. Quantization steps trade accuracy for hit rate: check
+    # hits/misses (stats()) when tuning them.
+    def __init__(self, budget=SPRITE_CACHE_BUDGET, size_step=1, color_step=4, alpha_step=4, rotation_step=5):
+        self.budget = budget
+        self.size_step = size_step
+        self.color_step = color_step
+        self.alpha_step = alpha_step
+        self.rotation_step = rotation_step # Degrees
+        self.sprites = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, special_type, size, rgb, alpha, rotation=0):
+        # Returns (sprite, half width, half height) so callers can center it without asking the surface.
+        # The key holds bucket numbers (value // step), so building it is just integer division.
+        color_step = self.color_step
+        key = (special_type, size // self.size_step, rgb[0] // color_step, rgb[1] // color_step, rgb[2] // color_step,
+               alpha // self.alpha_step, int(rotation) % 360 // self.rotation_step)
+        entry = self.sprites.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return entry
+        self.misses += 1
+        # Rasterize the bucket's first value so exact inputs (step 1) render exactly
+        glow_color = (key[2] * color_step, key[3] * color_step, key[4] * color_step, key[5] * self.alpha_step)
+        sprite = render_glow(special_type, max(1, key[1] * self.size_step), glow_color, key[6] * self.rotation_step)
+        width, height = sprite.get_size()
+        entry = (sprite, width // 2, height // 2)
+        self.sprites[key] = entry
+        self.bytes += width * height * 4
+        while self.bytes > self.budget and len(self.sprites) > 1:
+            _, (evicted, half_w, half_h) = self.sprites.popitem(last=False)
+            self.bytes -= evicted.get_width() * evicted.get_height() * 4
+            self.evictions += 1
+        return entry
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "sprites": len(self.sprites),
+                "bytes": self.bytes, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def render_glow(special_type, size, glow_color, rotation):
+    # Rasterize one glow the way draw_particle_body used to draw it every frame
+    if special_type == "aurora":
+        # Elongated ellipse for a ribbon effect, rotated to give a flowing look
+        s = pygame.Surface((size * 4, size * 4), pygame.SRCALPHA)
+        ellipse_rect = pygame.Rect(0, 0, size * 3, size)
+        ellipse_rect.center = (size * 2, size * 2)
+        pygame.draw.ellipse(s, glow_color, ellipse_rect, 0)
+        return pygame.transform.rotate(s, rotation)
+    if special_type == "solar":
+        s = pygame.Surface((size * 6, size * 6), pygame.SRCALPHA)
+        pygame.draw.circle(s, glow_color, (size * 3, size * 3), size * 2.5)
+        return s
+    s = pygame.Surface((size * 4, size * 4), pygame.SRCALPHA)
+    radius = size * 2 if special_type in ("nebula", "wave_ripple") else size * 1.5
+    pygame.draw.circle(s, glow_color, (size * 2, size * 2), radius)
+    return s
+
+glow_sprites = SpriteCache()
+
+def glow_style(special_type, current_color, color):
+    # Color and alpha of a type's translucent glow, shared by both renderers
+    if special_type == "firefly":
+        return current_color, int((current_color[0] + current_color[1] + current_color[2]) / 3 * 0.1)
+    if special_type == "sound_visualizer":
+        return color, int((current_color[0] + current_color[1] + current_color[2]) / 3 * 0.05) # Pulses with the body
+    if color[0] <= 0:
+        return color, 0
+    if special_type == "solar":
+        return color, int(current_color[0] / color[0] * 255 * 0.3) # Corona
+    current_alpha = int(current_color[0] / color[0] * 255)
+    return color, int(current_alpha * (0.15 if special_type == "aurora" else 0.1)) # Very low alpha
+
+def blit_glow(screen, special_type, x, y, size, rgb, alpha, rotation=0):
+    if alpha <= 0:
+        return # Fully transparent, nothing to draw
+    sprite, half_w, half_h = glow_sprites.get(special_type, size, rgb, alpha, rotation)
+    screen.blit(sprite, (x - half_w, y - half_h))
+
+def draw_trail(screen, trail, color, life_ratio, current_size, stride=1):
+    # Draw a fading trail (flat x, y list); the last point is the particle itself and is skipped.
+    # stride > 1 draws only every stride-th point, counting back from the newest.
+    points = len(trail) // 2
+    for i in range((points - 2) % stride if points > 1 else 0, points - 1, stride):
+        alpha = (i / points) * life_ratio
+        if alpha > 0:
+            trail_color = (int(color[0] * alpha * 0.5), 
+                         int(color[1] * alpha * 0.5), 
+                         int(color[2] * alpha * 0.5))
+            trail_size = max(1, int(current_size * alpha * 0.5)) # Thinner trail
+            pygame.draw.circle(screen, trail_color, (int(trail[2 * i]), int(trail[2 * i + 1])), trail_size)
+
+class ParticlePool:
+    # Free list of dead Particle objects. acquire() brings one back with reset() instead of allocating,
+    # so steady-state emission reuses the particles that just died; it only allocates when the list is
+    # empty. At most capacity spares are kept.
+    def __init__(self, capacity=MAX_PARTICLES):
+        self.capacity = capacity
+        self.free = []
+        self.reused = 0 # Allocations avoided
+        self.allocated = 0
+        self.rate = 0.0
+        self.rate_start = time.perf_counter()
+        self.rate_reused = 0
+
+    def acquire(self, x, y, vx, vy, color, size=3, special_type=None, target_pos=None, initial_life=None):
+        if self.free:
+            particle = self.free.pop()
+            particle.reset(x, y, vx, vy, color, size, special_type, target_pos, initial_life)
+            self.reused += 1
+            return particle
+        self.allocated += 1
+        return Particle(x, y, vx, vy, color, size, special_type, target_pos, initial_life, self)
+
+    def recycle(self, particle):
+        if len(self.free) < self.capacity:
+            self.free.append(particle)
+
+    def release(self, particles):
+        # Hand back particles nothing references anymore
+        room = self.capacity - len(self.free)
+        if len(particles) <= room:
+            self.free.extend(particles)
+        elif room > 0:
+            self.free.extend(particles[:room])
+
+    def reused_per_second(self):
+        # Allocations avoided per second, refreshed about once a second
+        now = time.perf_counter()
+        if now - self.rate_start >= 1:
+            self.rate = (self.reused - self.rate_reused) / (now - self.rate_start)
+            self.rate_start = now
+            self.rate_reused = self.reused
+        return self.rate
+
+def hsv_colors(hue, saturation, value):
+    # colorsys.hsv_to_rgb for an array of hues at one saturation and value, as (n, 3) 0-255 ints
+    sector = (hue * 6).astype(np.int64)
+    f = hue * 6 - sector
+    v = np.full_like(f, value)
+    p = np.full_like(f, value * (1 - saturation))
+    q = value * (1 - saturation * f)
+    t = value * (1 - saturation * (1 - f))
+    rows = [(v, t, p), (q, v, p), (p, v, t), (p, q, v), (t, p, v), (v, p, q)]
+    rgb = np.choose(sector[:, None] % 6, [np.stack(row, axis=1) for row in rows])
+    return (rgb * 255).astype(np.int64)
+
+class Palette:
+    # Precomputed colors. hues(saturation, value) is a table of PALETTE_HUES colors around the color wheel,
+    # built once per pair, that the rainbow emitters index. ramp(color) is a base color at each of
+    # RAMP_STEPS + 1 brightness levels, built once per color, so fading a particle costs
+    # ramp[int(alpha * RAMP_STEPS)] instead of three multiplications and a new tuple.
+    def __init__(self, hues=PALETTE_HUES, steps=RAMP_STEPS):
+        self.hue_count = hues
+        self.steps = steps
+        self.hue_tables = {} # (saturation, value) -> (hues, 3) int array
+        self.ramps = {} # Base color -> tuple of faded color tuples
+
+    def hues(self, saturation, value):
+        table = self.hue_tables.get((saturation, value))
+        if table is None:
+            table = hsv_colors(np.arange(self.hue_count) / self.hue_count, saturation, value)
+            self.hue_tables[(saturation, value)] = table
+        return table
+
+    def ramp(self, color):
+        ramp = self.ramps.get(color)
+        if ramp is None:
+            r, g, b = color
+            steps = self.steps
+            ramp = tuple((int(r * i / steps), int(g * i / steps), int(b * i / steps)) for i in range(steps + 1))
+            self.ramps[color] = ramp
+        return ramp
+
+palette = Palette()
+
+draw_random = random.Random() # Jitter for drawing only, so rendering never moves a ParticleSystem's random stream
+
+def draw_electric_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Electric particles with lightning effect
+    for i in range(3):
+        offset_x = draw_random.randint(-3, 3)
+        offset_y = draw_random.randint(-3, 3)
+        pygame.draw.circle(screen, (255, 255, 100),
+                         (x + offset_x, y + offset_y), 1)
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_bubble_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Bubble with highlight
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    pygame.draw.circle(screen, (255, 255, 255),
+                     (x - current_size//3, y - current_size//3),
+                     max(1, current_size//3))
+    pygame.draw.circle(screen, current_color, (x, y), current_size, 2)
+
+def draw_snow_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Snowflake shape
+    for angle in range(0, 360, 60):
+        end_x = x + math.cos(math.radians(angle + rotation)) * current_size
+        end_y = y + math.sin(math.radians(angle + rotation)) * current_size
+        pygame.draw.line(screen, current_color, (x, y), (end_x, end_y), 1)
+    pygame.draw.circle(screen, current_color, (x, y), 2)
+
+def draw_spiral_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Spiral with rotating arms
+    for i in range(4):
+        angle = rotation + i * math.pi / 2
+        end_x = x + math.cos(angle) * current_size * 2
+        end_y = y + math.sin(angle) * current_size * 2
+        pygame.draw.line(screen, current_color, (x, y), (end_x, end_y), 2)
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_rain_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a small line for raindrop effect
+    line_length = current_size * 2
+    end_x = x - vx * 0.5
+    end_y = y - vy * 0.5
+    pygame.draw.line(screen, current_color, (x, y), (end_x, end_y), 1)
+
+def draw_smoke_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a soft, larger circle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_confetti_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a rotating rectangle/square
+    half_size = current_size / 2
+    points = [
+        (x + half_size * math.cos(rotation) - half_size * math.sin(rotation),
+         y + half_size * math.sin(rotation) + half_size * math.cos(rotation)),
+        (x - half_size * math.cos(rotation) - half_size * math.sin(rotation),
+         y - half_size * math.sin(rotation) + half_size * math.cos(rotation)),
+        (x - half_size * math.cos(rotation) + half_size * math.sin(rotation),
+         y - half_size * math.sin(rotation) - half_size * math.cos(rotation)),
+        (x + half_size * math.cos(rotation) + half_size * math.sin(rotation),
+         y + half_size * math.sin(rotation) - half_size * math.cos(rotation))
+    ]
+    pygame.draw.polygon(screen, current_color, points)
+
+def draw_blackhole_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as small, dark, intense circles
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_fluid_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as slightly larger, solid circles
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_crystal_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a rotating square
+    half_size = current_size / 2
+    points = [
+        (x + half_size * math.cos(rotation) - half_size * math.sin(rotation),
+         y + half_size * math.sin(rotation) + half_size * math.cos(rotation)),
+        (x - half_size * math.cos(rotation) - half_size * math.sin(rotation),
+         y - half_size * math.sin(rotation) + half_size * math.cos(rotation)),
+        (x - half_size * math.cos(rotation) + half_size * math.sin(rotation),
+         y - half_size * math.sin(rotation) - half_size * math.cos(rotation)),
+        (x + half_size * math.cos(rotation) + half_size * math.sin(rotation),
+         y + half_size * math.sin(rotation) - half_size * math.cos(rotation))
+    ]
+    pygame.draw.polygon(screen, current_color, points)
+
+def draw_lightning_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a very bright, small circle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    # Add a bright glow
+    pygame.draw.circle(screen, (255, 255, 255), (x, y), current_size + 1, 1)
+
+def draw_lava_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a large, glowing circle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    # Add inner glow
+    pygame.draw.circle(screen, (min(255, current_color[0] + 50),
+                                min(255, current_color[1] + 50),
+                                min(255, current_color[2] + 50)),
+                       (x, y), current_size - 2, 1)
+
+def draw_firefly_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a small, soft glowing circle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    # Add a larger, very faint outer glow
+    # Pygame draw.circle doesn't support alpha directly, so we blit a cached pre-rendered sprite
+    blit_glow(screen, "firefly", x, y, current_size, *glow_style("firefly", current_color, color))
+
+def draw_nebula_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a very large, soft, transparent circle
+    blit_glow(screen, "nebula", x, y, current_size, *glow_style("nebula", current_color, color)) # Very low alpha
+
+def draw_solar_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a bright core with a larger, fading corona
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    # Corona effect
+    blit_glow(screen, "solar", x, y, current_size, *glow_style("solar", current_color, color))
+
+def draw_vortex_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as small, slightly glowing circles
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    glow_color = (min(255, current_color[0] + 30),
+                  min(255, current_color[1] + 30),
+                  min(255, current_color[2] + 30))
+    pygame.draw.circle(screen, glow_color, (x, y), current_size + 1, 1)
+
+def draw_aurora_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as elongated, very transparent shapes: a cached, pre-rotated ellipse sprite
+    blit_glow(screen, "aurora", x, y, current_size, *glow_style("aurora", current_color, color), rotation) # Very low alpha
+
+def draw_geyser_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as simple circles, maybe with a slight trail
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_swarm_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as small triangles pointing in direction of velocity
+    if math.hypot(vx, vy) > 0.1: # Only if moving
+        angle = math.atan2(vy, vx)
+        # Create a triangle pointing in the direction of movement
+        p1 = (x + current_size * math.cos(angle), y + current_size * math.sin(angle))
+        p2 = (x + current_size * 0.5 * math.cos(angle - 2*math.pi/3), y + current_size * 0.5 * math.sin(angle - 2*math.pi/3))
+        p3 = (x + current_size * 0.5 * math.cos(angle + 2*math.pi/3), y + current_size * 0.5 * math.sin(angle + 2*math.pi/3))
+        pygame.draw.polygon(screen, current_color, [p1, p2, p3])
+    else:
+        pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_gravity_field_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a glowing circle, color indicating attraction/repulsion
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    glow_color = (min(255, current_color[0] + 20),
+                  min(255, current_color[1] + 20),
+                  min(255, current_color[2] + 20))
+    pygame.draw.circle(screen, glow_color, (x, y), current_size + 2, 1)
+
+def draw_flowing_stream_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as small, slightly transparent circles
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_bouncing_collision_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as solid, distinct circles
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_explosion_implosion_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a solid circle, shrinking/fading
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_wave_ripple_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a very transparent, expanding circle
+    blit_glow(screen, "wave_ripple", x, y, current_size, *glow_style("wave_ripple", current_color, color)) # Very low alpha
+
+def draw_path_follower_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as small, distinct circles with a trail
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_spring_attraction_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a glowing circle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    glow_color = (min(255, current_color[0] + 30),
+                  min(255, current_color[1] + 30),
+                  min(255, current_color[2] + 30))
+    pygame.draw.circle(screen, glow_color, (x, y), current_size + 1, 1)
+
+def draw_pixel_painter_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a solid square for a pixel effect
+    pygame.draw.rect(screen, current_color, (x - current_size/2, y - current_size/2, current_size, current_size))
+
+def draw_chain_explosion_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as small, bright, fading circles
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_light_tracer_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a small, bright point
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+
+def draw_sound_visualizer_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a pulsating circle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    # Add a subtle outer glow that also pulses
+    blit_glow(screen, "sound_visualizer", x, y, current_size, *glow_style("sound_visualizer", current_color, color))
+
+def draw_constellation_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw as a small, slightly glowing star-like particle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    glow_color = (min(255, current_color[0] + 20),
+                  min(255, current_color[1] + 20),
+                  min(255, current_color[2] + 20))
+    pygame.draw.circle(screen, glow_color, (x, y), current_size + 1, 1)
+
+def draw_default_body(screen, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Default particle
+    pygame.draw.circle(screen, current_color, (x, y), current_size)
+    # Add glow effect
+    glow_color = (min(255, current_color[0] + 50),
+                 min(255, current_color[1] + 50),
+                 min(255, current_color[2] + 50))
+    pygame.draw.circle(screen, glow_color, (x, y), current_size + 2, 1)
+
+def draw_particle_body(screen, special_type, x, y, current_size, current_color, color, rotation, vx, vy):
+    # Draw a particle's body with its type-specific special effects
+    BEHAVIORS[special_type].draw(screen, x, y, current_size, current_color, color, rotation, vx, vy)
+
+class DrawDetail:
+    # One level of detail (LOD) for drawing particles. trail_stride > 1 draws every stride-th trail circle.
+    # simple_bodies draws the types in SIMPLE_BODY_TYPES as one plain circle, without their glow passes,
+    # glow rings, sparks, spokes or arms. Particles no bigger than pixel_size, or whose brightest color
+    # channel has faded below pixel_brightness, become a single pixel (a 1 px atlas sprite when batched).
+    def __init__(self, name, trail_stride=1, simple_bodies=False, pixel_size=0, pixel_brightness=0):
+        self.name = name
+        self.trail_stride = trail_stride
+        self.simple_bodies = simple_bodies
+        self.pixel_size = pixel_size
+        self.pixel_brightness = pixel_brightness
+
+    def pixel(self, current_size, current_color):
+        return current_size <= self.pixel_size or max(current_color) < self.pixel_brightness
+
+# Levels from full detail down; LodController moves between them with the frame budget, F9 picks one by hand
+LOD_LEVELS = [DrawDetail("Full"),
+              DrawDetail("Lean", trail_stride=2),
+              DrawDetail("Simple", trail_stride=4, simple_bodies=True),
+              DrawDetail("Minimal", trail_stride=8, simple_bodies=True, pixel_size=2, pixel_brightness=64)]
+
+# Types whose body is more than one draw call; nebula, aurora and wave_ripple are only a glow and keep it
+SIMPLE_BODY_TYPES = {None, "electric", "bubble", "snow", "spiral", "lightning", "lava", "firefly", "solar", "vortex",
+                     "gravity_field", "spring_attraction", "sound_visualizer", "constellation"}
+
+def draw_body_at_detail(screen, detail, special_type, x, y, current_size, current_color, color, rotation, vx, vy):
+    # draw_particle_body, simplified as detail says
+    if detail.pixel(current_size, current_color):
+        screen.fill(current_color, (x, y, 1, 1))
+    elif detail.simple_bodies and special_type in SIMPLE_BODY_TYPES:
+        pygame.draw.circle(screen, current_color, (x, y), current_size)
+    else:
+        BEHAVIORS[special_type].draw(screen, x, y, current_size, current_color, color, rotation, vx, vy)
+
+# Every special_type gets a small integer code so the columnar store can keep types in one int array
+PARTICLE_TYPES = [None, "electric", "magnetic", "bubble", "snow", "spiral", "rain", "smoke", "confetti",
+                  "attractor", "blackhole", "fluid", "crystal", "lightning", "lava", "firefly", "nebula",
+                  "solar", "vortex", "aurora", "geyser", "swarm", "gravity_field", "flowing_stream",
+                  "bouncing_collision", "explosion_implosion", "wave_ripple", "path_follower",
+                  "spring_attraction", "pixel_painter", "chain_starter", "chain_explosion", "light_tracer",
+                  "sound_visualizer", "constellation"]
+TYPE_CODES = {name: code for code, name in enumerate(PARTICLE_TYPES)}
+
+# Types that opt out of the shared physics steps (the Behavior flags below are built from these)
+NO_GRAVITY_TYPES = ["bubble", "snow", "smoke", "rain", "firefly", "nebula", "solar", "blackhole", "fluid", "aurora", "swarm", "flowing_stream", "wave_ripple", "path_follower", "explosion_implosion", "pixel_painter", "spring_attraction", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]
+NO_DAMPING_TYPES = ["blackhole", "lightning", "fluid", "rain", "smoke", "firefly", "nebula", "vortex", "aurora", "swarm", "gravity_field", "flowing_stream", "bouncing_collision", "explosion_implosion", "wave_ripple", "path_follower", "spring_attraction", "pixel_painter", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]
+NO_BOUNCE_TYPES = ["rain", "smoke", "nebula", "firefly", "blackhole", "aurora", "geyser", "flowing_stream", "explosion_implosion", "wave_ripple", "path_follower", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]
+OFFSCREEN_CULL_TYPES = ["rain", "smoke", "geyser", "flowing_stream", "explosion_implosion", "wave_ripple", "path_follower", "chain_explosion", "light_tracer", "sound_visualizer", "constellation"]
+
+# Color fade multiplier for types whose size doesn't shrink with life
+FADE_FACTORS = {"nebula": 0.2, "aurora": 0.3, "flowing_stream": 0.8, "explosion_implosion": 1.0, "wave_ripple": 0.4,
+                "path_follower": 1.0, "spring_attraction": 1.0, "pixel_painter": 1.0, "light_tracer": 0.7, "constellation": 0.8}
+
+MAX_TRAIL = 100 # Longest trail any type keeps (light_tracer)
+
+class Behavior:
+    # Everything type-specific about a special_type, decided once: flags for the shared physics steps
+    # and the hooks Particle.update and Particle.draw call. Each Particle keeps a reference to its
+    # behavior, so a frame costs one attribute lookup per step instead of a walk down an elif chain.
+    def __init__(self, name):
+        self.name = name
+        self.gravity = name not in NO_GRAVITY_TYPES
+        self.damping = name not in NO_DAMPING_TYPES
+        # What happens at the screen edge: bounce back, die far off screen, or (blackhole) die at the mouse
+        if name not in NO_BOUNCE_TYPES:
+            self.edge = "bounce"
+        elif name in OFFSCREEN_CULL_TYPES or name == "aurora":
+            self.edge = "cull"
+        elif name == "blackhole":
+            self.edge = "center"
+        else:
+            self.edge = None
+        self.fade_factor = FADE_FACTORS.get(name, 1.0) # Color multiplier on top of the life ratio
+        self.size_fades = name not in FADE_FACTORS
+        key = name or "default"
+        self.force = getattr(Particle, "update_" + key, None) # Per-frame forces; may return early spawns
+        self.fade = getattr(Particle, "fade_" + key, None) # Replaces the standard fade
+        self.spawn = getattr(Particle, "spawn_" + key, None) # New particles at the end of the update
+        self.draw = globals().get("draw_%s_body" % key, draw_default_body)
+
+BEHAVIORS = {name: Behavior(name) for name in PARTICLE_TYPES}
+
+def behavior_mask(flag):
+    return np.array([flag(BEHAVIORS[name]) for name in PARTICLE_TYPES], dtype=bool)
+
+GRAVITY_MASK = behavior_mask(lambda behavior: behavior.gravity)
+DAMPING_MASK = behavior_mask(lambda behavior: behavior.damping)
+BOUNCE_MASK = behavior_mask(lambda behavior: behavior.edge == "bounce")
+CULL_MASK = behavior_mask(lambda behavior: behavior.edge == "cull")
+FADE_TABLE = np.array([BEHAVIORS[name].fade_factor for name in PARTICLE_TYPES], dtype=np.float32)
+SIZE_FADES = behavior_mask(lambda behavior: behavior.size_fades)
+
+# How far from its position each type draws, as (multiple of its size, extra pixels): glows and spiral arms
+# reach past the body, electric sparks jitter 3 px and constellation lines run at most halfway to the next
+# star. Anything else draws within its size plus a ring and rounding. Rain also streaks back by half its velocity.
+DRAW_REACH = {"spiral": (2, 3), "aurora": (3, 2), "solar": (3, 2), "nebula": (2, 2), "wave_ripple": (2, 2),
+              "firefly": (2, 2), "sound_visualizer": (2, 2), "electric": (1, 5),
+              "constellation": (1, CONSTELLATION_LINK_DISTANCE / 2 + 3)}
+REACH_SCALE = np.array([DRAW_REACH.get(name, (1, 3))[0] for name in PARTICLE_TYPES], dtype=np.float32)
+REACH_PAD = np.array([DRAW_REACH.get(name, (1, 3))[1] for name in PARTICLE_TYPES], dtype=np.float32)
+
+def draw_boxes(kind, left, top, right, bottom, size, vx, vy):
+    # Screen boxes (x0, y0, x1, y1 rows) covering everything drawn for particles whose positions and trail
+    # points span [left, right] x [top, bottom]
+    reach = size * REACH_SCALE[kind] + REACH_PAD[kind]
+    rain = kind == TYPE_CODES["rain"]
+    if rain.any():
+        reach[rain] += np.maximum(np.abs(vx[rain]), np.abs(vy[rain])) * 0.5
+    return np.stack([left - reach, top - reach, right + reach, bottom + reach], axis=1)
+
+# Mouse-centered force laws, applied to every row of these types at once by ParticleStore.apply_forces.
+# Rows with min_dist < distance to the mouse < max_dist are pulled toward it by strength / dist ** exponent
+# (repel_strength instead while the right button is held) and pushed sideways by swirl + swirl_ratio * that
+# force. Rows within min_dist are damped by inner_damping and lose inner_life. damping then applies to all
+# rows of the type. buttons laws only apply when mouse buttons are given.
+FORCE_FIELDS = ("min_dist", "max_dist", "strength", "repel_strength", "exponent", "swirl", "swirl_ratio",
+                "inner_damping", "inner_life", "damping", "buttons")
+FORCE_LAWS = {
+    "attractor": dict(min_dist=0.1, strength=0.5, exponent=0.5, swirl=0.05, inner_damping=0.8),
+    "blackhole": dict(min_dist=5, strength=1000, exponent=2, swirl_ratio=0.5, inner_damping=0.5, inner_life=5, damping=0.9),
+    "vortex": dict(min_dist=1, strength=50, exponent=1.5, swirl_ratio=0.2, inner_damping=0.8, damping=0.95),
+    "swarm": dict(min_dist=50, strength=0.1), # Plus jitter and close-range repulsion in update_swarm
+    "gravity_field": dict(min_dist=0.1, strength=500, repel_strength=-700, exponent=1.5, inner_damping=0.8,
+                          damping=0.97, buttons=True), # Right-click for repulsion
+    "path_follower": dict(min_dist=10, strength=0.5, damping=0.9),
+    "spring_attraction": dict(min_dist=1, strength=0.05, exponent=-1), # Spring pull, dist * 0.05; see update_spring_attraction
+}
+(FORCE_MIN_DIST, FORCE_MAX_DIST, FORCE_STRENGTH, FORCE_REPEL_STRENGTH, FORCE_EXPONENT, FORCE_SWIRL, FORCE_SWIRL_RATIO,
+ FORCE_INNER_DAMPING, FORCE_INNER_LIFE, FORCE_DAMPING, FORCE_BUTTONS) = range(len(FORCE_FIELDS)) # FORCE_TABLE columns
+
+def force_law(name):
+    law = dict(min_dist=0, max_dist=np.inf, strength=0, exponent=0, swirl=0, swirl_ratio=0, inner_damping=1,
+               inner_life=0, damping=1, buttons=False)
+    law.update(FORCE_LAWS.get(name, {}))
+    law.setdefault("repel_strength", law["strength"])
+    return [law[field] for field in FORCE_FIELDS]
+
+FORCE_TABLE = np.array([force_law(name) for name in PARTICLE_TYPES], dtype=np.float32) # One row per type code
+FORCE_MASK = np.array([name in FORCE_LAWS for name in PARTICLE_TYPES], dtype=bool)
+
+def force_field_loop(rows, kind, table, x, y, vx, vy, life, mouse_x, mouse_y, repel):
+    # Row-at-a-time ParticleStore.apply_forces, for numba to compile when it is installed
+    for row in rows:
+        law = table[kind[row]]
+        dx = mouse_x - x[row]
+        dy = mouse_y - y[row]
+        dist = math.sqrt(dx * dx + dy * dy)
+        if dist <= law[FORCE_MIN_DIST]:
+            vx[row] *= law[FORCE_INNER_DAMPING]
+            vy[row] *= law[FORCE_INNER_DAMPING]
+            life[row] -= law[FORCE_INNER_LIFE]
+        elif dist < law[FORCE_MAX_DIST]:
+            force = law[FORCE_REPEL_STRENGTH if repel else FORCE_STRENGTH] / dist ** law[FORCE_EXPONENT]
+            swirl = law[FORCE_SWIRL] + law[FORCE_SWIRL_RATIO] * force
+            vx[row] += dx / dist * force - dy / dist * swirl
+            vy[row] += dy / dist * force + dx / dist * swirl
+        vx[row] *= law[FORCE_DAMPING]
+        vy[row] *= law[FORCE_DAMPING]
+
+force_field_jit = numba.njit(cache=True)(force_field_loop) if numba else None
+
+def fair_shares(counts, limit):
+    # Split limit between the keys of counts as evenly as possible without giving a key more than it has.
+    # Keys under the even share keep everything and the rest is shared out again among the others.
+    shares = {}
+    pending = sorted(counts, key=counts.get)
+    while pending:
+        share, spare = divmod(limit, len(pending))
+        if counts[pending[0]] > share:
+            for i, key in enumerate(pending):
+                shares[key] = share + (i >= len(pending) - spare) # Leftover units go to the largest keys
+            break
+        key = pending.pop(0)
+        shares[key] = counts[key]
+        limit -= counts[key]
+    return shares
+
+class SpatialHash:
+    # Uniform grid spatial index. Points are bucketed into square cells of cell_size, so every
+    # neighbor closer than cell_size sits in the 3x3 block of cells around a point.
+    # Rebuild it once per frame, then query it as often as needed.
+    KEY_OFFSET = 1 << 20 # Keeps cell coordinates positive, even far off screen
+    KEY_STRIDE = 1 << 21
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.rebuild([], [])
+
+    def cell_key(self, cx, cy):
+        cx = np.clip(cx, -self.KEY_OFFSET, self.KEY_OFFSET - 1) + self.KEY_OFFSET
+        cy = np.clip(cy, -self.KEY_OFFSET, self.KEY_OFFSET - 2) + self.KEY_OFFSET
+        return cx * self.KEY_STRIDE + cy
+
+    def rebuild(self, x, y, items=None):
+        # items (optional) maps point i back to whatever the caller indexes by: store rows, Particle objects...
+        self.x = np.asarray(x, np.float32)
+        self.y = np.asarray(y, np.float32)
+        self.items = items
+        cx = np.floor(self.x / self.cell_size).astype(np.int64)
+        cy = np.floor(self.y / self.cell_size).astype(np.int64)
+        keys = self.cell_key(cx, cy)
+        self.order = np.argsort(keys, kind="stable") # Points sorted by cell, so each cell is one contiguous run
+        self.sorted_keys = keys[self.order]
+        self.sorted_x, self.sorted_y = self.x[self.order], self.y[self.order]
+        self.sorted_cx, self.sorted_cy = cx[self.order], cy[self.order]
+
+    def __len__(self):
+        return len(self.x)
+
+    def query(self, px, py):
+        # Indices of the points in the 3x3 block of cells around (px, py); callers check exact distances.
+        # Cells in one grid column have consecutive keys, so each column of the block is one run.
+        cx = math.floor(px / self.cell_size)
+        cy = math.floor(py / self.cell_size)
+        columns = np.array([cx - 1, cx, cx + 1])
+        starts = np.searchsorted(self.sorted_keys, self.cell_key(columns, cy - 1), "left")
+        ends = np.searchsorted(self.sorted_keys, self.cell_key(columns, cy + 1), "right")
+        return np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+
+    def query_items(self, px, py):
+        return [self.items[i] for i in self.query(px, py).tolist()]
+
+    def pairs(self, radius):
+        # Every pair (i, j), i < j, closer than radius (at most cell_size), found in one batch.
+        # Returns i, j and the offsets/distance from point j to point i.
+        n = len(self.x)
+        firsts, seconds, dxs, dys = [], [], [], []
+        # Half of the 3x3 neighborhood: each pair of adjacent cells is visited from one side only.
+        # Work in cell-sorted order so every candidate run is a contiguous slice.
+        for ox, oy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            if n < 2:
+                break
+            keys = self.cell_key(self.sorted_cx + ox, self.sorted_cy + oy)
+            starts = np.searchsorted(self.sorted_keys, keys, "left")
+            counts = np.searchsorted(self.sorted_keys, keys, "right") - starts
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            first = np.repeat(np.arange(n), counts)
+            second = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            if ox == 0 and oy == 0:
+                keep = first < second # Same cell: count each pair once and skip the point itself
+                first, second = first[keep], second[keep]
+            dx = self.sorted_x[first] - self.sorted_x[second]
+            dy = self.sorted_y[first] - self.sorted_y[second]
+            close = dx * dx + dy * dy < radius * radius
+            firsts.append(first[close])
+            seconds.append(second[close])
+            dxs.append(dx[close])
+            dys.append(dy[close])
+        if not firsts:
+            empty = np.zeros(0, np.float32)
+            return np.zeros(0, np.int64), np.zeros(0, np.int64), empty, empty, empty
+        dx, dy = np.concatenate(dxs), np.concatenate(dys)
+        first = self.order[np.concatenate(firsts)]
+        second = self.order[np.concatenate(seconds)]
+        return first, second, dx, dy, np.hypot(dx, dy)
+
+# Every ParticleStore column as (name, dtype, shape of one row), widest types first so columns packed
+# back to back into one shared memory block stay aligned
+STORE_COLUMNS = [(name, np.float32, ()) for name in ("x", "y", "px", "py", "vx", "vy", "life", "max_life", "size", "age", "rotation",
+                                                     "spin_speed", "initial_size", "tx", "ty", "phase", "rate", "aux", "timer")] + [
+    ("trail", np.float32, (MAX_TRAIL, 2)), # Ring buffer of the last max_trail positions
+    ("cur_size", np.int32, ()),
+    ("kind", np.int16, ()), # Index into PARTICLE_TYPES
+    ("max_trail", np.int16, ()),
+    ("trail_len", np.int16, ()),
+    ("trail_head", np.int16, ()), # Next slot to write in the row's trail ring
+    ("has_target", bool, ()),
+    ("branched", bool, ()),
+    ("color", np.uint8, (3,)),
+    ("cur_color", np.uint8, (3,)),
+]
+
+def store_bytes(capacity):
+    return sum(capacity * np.dtype(dtype).itemsize * math.prod(row) for _, dtype, row in STORE_COLUMNS)
+
+def store_columns(capacity, buffer=None):
+    # Arrays for capacity rows of every column: zeroed, or views laid out back to back in buffer
+    columns = {}
+    offset = 0
+    for name, dtype, row in STORE_COLUMNS:
+        if buffer is None:
+            columns[name] = np.zeros((capacity,) + row, dtype)
+        else:
+            columns[name] = np.ndarray((capacity,) + row, dtype, buffer, offset)
+            offset += columns[name].nbytes
+    return columns
+
+# Snapshot file (ParticleSystem.save/load): SNAPSHOT_HEADER, a JSON description of the system and its columns,
+# then each column's live rows back to back, every column starting on a SNAPSHOT_ALIGN byte boundary
+SNAPSHOT_MAGIC = b"PSSN"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHI") # Magic, version, length of the JSON description
+SNAPSHOT_ALIGN = 64
+
+def write_snapshot(path, store, state):
+    # Write the store's live rows and state, a JSON-able dict of everything else to restore
+    n = store.count
+    columns = []
+    offset = 0
+    for name, dtype, row in STORE_COLUMNS:
+        offset = -(-offset // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+        columns.append((name, np.dtype(dtype).str, row, offset))
+        offset += n * np.dtype(dtype).itemsize * math.prod(row)
+    description = json.dumps(dict(state, count=n, columns=columns)).encode()
+    start = -(-(SNAPSHOT_HEADER.size + len(description)) // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN # Column data offset
+    with open(path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(description)))
+        f.write(description)
+        for name, _, _, offset in columns:
+            f.write(bytes(start + offset - f.tell())) # Padding up to the column
+            f.write(np.ascontiguousarray(getattr(store, name)[:n]).data)
+
+def read_snapshot(path):
+    # Returns (state, columns): the dict passed to write_snapshot and each column's rows as read-only arrays
+    # over a memory map of the file, so nothing is read until the rows are copied out
+    with open(path, "rb") as f:
+        magic, version, length = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("%s is not a version %d snapshot" % (path, SNAPSHOT_VERSION))
+        state = json.loads(f.read(length))
+    start = -(-(SNAPSHOT_HEADER.size + length) // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+    n = state.pop("count")
+    data = np.memmap(path, np.uint8, "r") if n else None
+    columns = {name: np.ndarray((n,) + tuple(row), dtype, data, start + offset) if n else np.zeros((0,) + tuple(row), dtype)
+               for name, dtype, row, offset in state.pop("columns")}
+    return state, columns
+
+class ParticleStore:
+    # Structure-of-arrays particle storage: particle i lives in row i of every column.
+    # Rows [0, count) are alive and kept in spawn order (oldest first), like ParticleSystem.particles.
+    # A shared store keeps its columns in one multiprocessing.shared_memory block so ParallelUpdater's
+    # workers can advance rows in place. columns, if given, are existing arrays to wrap, all rows alive.
+    def __init__(self, capacity=MAX_PARTICLES, rng=None, shared=False, columns=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0
+        self.capacity = 0
+        self.columns = []
+        self.shared = shared
+        self.block = None # SharedMemory holding the columns of a shared store
+        if columns is None:
+            self.allocate(capacity)
+        else:
+            for name, column in columns.items():
+                setattr(self, name, column)
+            self.columns = list(columns)
+            self.count = self.capacity = len(self.x)
+        # Batched behavior for each type code, e.g. update_vortex for "vortex"
+        self.behaviors = {code: getattr(self, "update_" + name) for code, name in enumerate(PARTICLE_TYPES)
+                          if name and hasattr(self, "update_" + name)}
+
+    def allocate(self, capacity):
+        # (Re)allocate every column, keeping the live rows
+        block = shared_memory.SharedMemory(create=True, size=store_bytes(capacity)) if self.shared else None
+        columns = store_columns(capacity, block.buf if block else None)
+        for name, column in columns.items():
+            if self.count:
+                column[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, column)
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.release_block()
+        self.block = block
+
+    def release_block(self):
+        # Free the shared memory block; a no-op for stores in ordinary memory
+        if self.block is None:
+            return
+        self.block.unlink()
+        try:
+            self.block.close()
+        except BufferError:
+            pass # A caller still holds views into it; it is unmapped once those are collected
+        self.block = None
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, special_type, x, y, vx, vy, color, size, initial_life=None, target_pos=None):
+        # Bulk-append a batch of one particle type; mirrors Particle.__init__ for every row at once
+        x = np.asarray(x, np.float32)
+        k = x.size
+        if k == 0:
+            return
+        start, end = self.count, self.count + k
+        if end > self.capacity:
+            self.allocate(max(end, self.capacity * 2))
+        s = slice(start, end)
+        rng = self.rng
+
+        self.x[s] = x
+        self.y[s] = y
+        self.px[s] = x # Position before the last update, for drawing between simulation steps
+        self.py[s] = y
+        self.vx[s] = vx
+        self.vy[s] = vy
+        self.color[s] = color
+        self.cur_color[s] = color
+        self.size[s] = size
+        self.initial_size[s] = size
+        self.cur_size[s] = size
+        life = PARTICLE_LIFE if initial_life is None else initial_life
+        self.life[s] = life
+        self.max_life[s] = life
+        self.age[s] = 0
+        self.rotation[s] = 0
+        self.spin_speed[s] = rng.uniform(-0.2, 0.2, k)
+        self.kind[s] = TYPE_CODES[special_type]
+        self.max_trail[s] = 15
+        self.has_target[s] = target_pos is not None
+        if target_pos is not None:
+            self.tx[s] = target_pos[0]
+            self.ty[s] = target_pos[1]
+        self.branched[s] = False
 
-    def create_nebula(self, x, y):
-        for _ in range(1):
-            vx = random.uniform(-0.1, 0.1)
-            vy = random.uniform(-0.1, 0.1)
-            
-            colors = [(100, 0, 150), (0, 100, 150), (150, 50, 0), (0, 150, 100), (100, 100, 200)]
-            color = random.choice(colors)
-            
-            size = random.randint(20, 50)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "nebula"))
+        # Specific attributes for certain modes
+        if special_type == "lightning":
+            self.timer[s] = rng.integers(10, 31, k) # Time until it might branch
+        elif special_type == "firefly":
+            self.phase[s] = rng.uniform(0, math.pi * 2, k)
+            self.rate[s] = rng.uniform(0.05, 0.15, k)
+        elif special_type == "solar":
+            self.aux[s] = np.hypot(self.vx[s], self.vy[s]) # Initial speed for corona effect
+        elif special_type == "geyser":
+            self.aux[s] = self.y[s] # Initial Y for geyser behavior
+        elif special_type == "pixel_painter":
+            self.tx[s] = self.x[s]
+            self.ty[s] = self.y[s]
+            self.vx[s] = 0
+            self.vy[s] = 0
+            self.life[s] = PARTICLE_LIFE * 5
+            self.max_life[s] = PARTICLE_LIFE * 5
+            self.size[s] = rng.integers(3, 7, k)
+        elif special_type == "light_tracer":
+            self.max_trail[s] = 100
+            self.life[s] = PARTICLE_LIFE * 2
+            self.max_life[s] = PARTICLE_LIFE * 2
+            self.size[s] = 2
+        elif special_type == "sound_visualizer":
+            self.aux[s] = self.size[s] # Base size
+            self.phase[s] = rng.uniform(0, math.pi * 2, k)
+        elif special_type == "constellation":
+            self.life[s] = PARTICLE_LIFE * 10
+            self.max_life[s] = PARTICLE_LIFE * 10
+
+        self.trail[s, 0, 0] = self.x[s]
+        self.trail[s, 0, 1] = self.y[s]
+        self.trail_len[s] = 1
+        self.trail_head[s] = 1
+        self.count = end
+
+    def extend_from_particles(self, particles):
+        # Copy the full state of existing Particle objects into the store
+        k = len(particles)
+        if k == 0:
+            return
+        start, end = self.count, self.count + k
+        if end > self.capacity:
+            self.allocate(max(end, self.capacity * 2))
+        for row, p in enumerate(particles, start):
+            self.x[row], self.y[row], self.vx[row], self.vy[row] = p.x, p.y, p.vx, p.vy
+            self.px[row], self.py[row] = p.prev_x, p.prev_y
+            self.life[row], self.max_life[row], self.size[row] = p.life, p.max_life, p.size
+            self.age[row], self.rotation[row], self.spin_speed[row] = p.age, p.rotation, p.spin_speed
+            self.initial_size[row] = p.initial_size
+            self.kind[row] = TYPE_CODES[p.special_type]
+            self.color[row] = p.color
+            self.cur_color[row] = p.current_color
+            self.cur_size[row] = p.current_size
+            self.has_target[row] = p.target_pos is not None
+            if p.target_pos is not None:
+                self.tx[row], self.ty[row] = p.target_pos
+            extra = p.extra # None unless the type keeps extra state
+            self.branched[row] = getattr(extra, "branched", False)
+            self.timer[row] = getattr(extra, "branch_timer", 0)
+            self.phase[row] = getattr(extra, "pulse_offset", 0)
+            self.rate[row] = getattr(extra, "pulse_speed", 0)
+            if p.special_type == "pixel_painter":
+                self.tx[row], self.ty[row] = extra.target_x, extra.target_y
+            self.aux[row] = getattr(extra, "initial_speed", getattr(extra, "initial_y", getattr(extra, "base_size", 0)))
+            self.max_trail[row] = p.max_trail
+            points = len(p.trail) // 2 # Both are rings with the same layout, so the trail copies over as is
+            self.trail_len[row] = points
+            self.trail_head[row] = (p.trail_head // 2 or points) % p.max_trail
+            self.trail[row, :points] = np.reshape(p.trail, (points, 2))
+        self.count = end
+
+    def load_columns(self, columns):
+        # Replace the live rows with the given column arrays (as from read_snapshot); columns missing from
+        # them are zeroed
+        n = len(columns["x"])
+        if n > self.capacity:
+            self.allocate(n)
+        for name in self.columns:
+            column = getattr(self, name)
+            if name in columns:
+                column[:n] = columns[name]
+            else:
+                column[:n] = 0
+        self.count = n
+
+    def to_particles(self, pool):
+        # The live rows as Particle objects spawning from pool, the inverse of extend_from_particles; sets every
+        # slot directly instead of running Particle.__init__, which would draw random numbers and reset the state
+        n = self.count
+        fields = [getattr(self, name)[:n].tolist() for name in ("x", "y", "px", "py", "vx", "vy", "life", "max_life",
+                                                                 "size", "age", "rotation", "spin_speed", "initial_size",
+                                                                 "cur_size", "max_trail", "tx", "ty", "phase", "rate",
+                                                                 "aux", "timer")]
+        colors = [tuple(c) for c in self.color[:n].tolist()]
+        current_colors = [tuple(c) for c in self.cur_color[:n].tolist()]
+        kinds, has_target, branched = self.kind[:n].tolist(), self.has_target[:n].tolist(), self.branched[:n].tolist()
+        particles = []
+        for row, (x, y, px, py, vx, vy, life, max_life, size, age, rotation, spin_speed, initial_size, current_size,
+                  max_trail, tx, ty, phase, rate, aux, timer) in enumerate(zip(*fields)):
+            p = Particle.__new__(Particle)
+            p.pool = pool
+            p.x, p.y, p.prev_x, p.prev_y, p.vx, p.vy = x, y, px, py, vx, vy
+            p.life, p.max_life, p.size, p.age, p.rotation, p.spin_speed = life, max_life, size, age, rotation, spin_speed
+            p.initial_size, p.current_size, p.max_trail = initial_size, current_size, max_trail
+            p.color, p.current_color = colors[row], current_colors[row]
+            p.ramp = palette.ramp(p.color)
+            p.special_type = special_type = PARTICLE_TYPES[kinds[row]]
+            p.behavior = BEHAVIORS[special_type]
+            p.target_pos = (tx, ty) if has_target[row] else None
+            length = self.trail_len[row]
+            p.trail = self.trail[row, :length].ravel().tolist()
+            p.trail_head = 2 * int(self.trail_head[row]) if length == max_trail else 0
+            p.extra = None
+            if special_type in ("lightning", "firefly", "solar", "geyser", "pixel_painter", "sound_visualizer"):
+                extra = p.extra = ParticleExtras()
+                if special_type == "lightning":
+                    extra.branch_timer, extra.branched = int(timer), branched[row]
+                elif special_type == "firefly":
+                    extra.pulse_offset, extra.pulse_speed = phase, rate
+                elif special_type == "solar":
+                    extra.initial_speed = aux
+                elif special_type == "geyser":
+                    extra.initial_y = aux
+                elif special_type == "pixel_painter":
+                    extra.target_x, extra.target_y = tx, ty
+                else:
+                    extra.base_size, extra.pulse_offset = aux, phase
+            particles.append(p)
+        return particles
+
+    def compact(self, keep=None):
+        # Drop dead rows (or keep just the given rows), keeping survivors in spawn order
+        n = self.count
+        if keep is None:
+            keep = np.flatnonzero(self.life[:n] > 0)
+        if len(keep) == n:
+            return
+        for name in self.columns:
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        self.count = len(keep)
+
+    def copy_to(self, other):
+        # Copy the live rows into another store, e.g. to draw them while this one carries on updating
+        n = self.count
+        if other.capacity < n:
+            other.allocate(self.capacity)
+        for name in self.columns:
+            getattr(other, name)[:n] = getattr(self, name)[:n]
+        other.count = n
+
+    def keep_newest(self, limit):
+        extra = self.count - limit
+        if extra > 0:
+            for name in self.columns:
+                column = getattr(self, name)
+                column[:limit] = column[extra:self.count]
+            self.count = limit
+
+    def enforce_cap(self, limit, policy="oldest"):
+        # Evict rows down to limit; see EVICTION. Ties and each type's own evictions go oldest first.
+        n = self.count
+        extra = n - limit
+        if extra <= 0:
+            return
+        if policy == "oldest":
+            self.keep_newest(limit)
+            return
+        keep = np.ones(n, bool)
+        if policy == "lowest_life":
+            keep[np.argsort(self.life[:n], kind="stable")[:extra]] = False
+        else:
+            kinds = self.kind[:n]
+            counts = np.bincount(kinds)
+            shares = fair_shares({code: int(count) for code, count in enumerate(counts) if count}, limit)
+            for code, share in shares.items():
+                if counts[code] > share:
+                    keep[np.flatnonzero(kinds == code)[:counts[code] - share]] = False
+        self.compact(np.flatnonzero(keep))
+
+    def update(self, mouse_pos=None, mouse_buttons=None, simulated_beat=0, spatial_index=None, profiler=None):
+        # Advance every live particle in one pass of batched NumPy operations grouped by type.
+        # Returns nothing: particles spawned this frame (lightning branches, lava smoke, chain bursts)
+        # are appended to the store before it returns.
+        # spatial_index, if given, holds this frame's spring_attraction rows (see ParticleSystem.update).
+        # profiler, if given, gets each type's behavior time; the batched steps all types share go under "(shared)".
+        if self.count == 0:
+            return
+        start = time.perf_counter()
+        self.finish(self.advance(mouse_pos, mouse_buttons, simulated_beat, spatial_index, profiler))
+        if profiler:
+            profiler.add("update", "(shared)", time.perf_counter() - start - self.behavior_time)
+
+    def advance(self, mouse_pos=None, mouse_buttons=None, simulated_beat=0, spatial_index=None, profiler=None):
+        # Everything update does except removing the dead and appending spawns, which it returns instead
+        # as (special_type, x, y, vx, vy, color, size, initial_life) batches for finish
+        n = self.count
+        self.behavior_time = 0
+        kind = self.kind[:n]
+        x, y, vx, vy = self.x[:n], self.y[:n], self.vx[:n], self.vy[:n]
+        self.px[:n] = x
+        self.py[:n] = y
+        self.age[:n] += 1
+        self.rotation[:n] += self.spin_speed[:n]
 
-    def create_solar(self, x, y):
-        for _ in range(5):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(5, 15)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            colors = [(255, 200, 0), (255, 150, 0), (255, 100, 0), (255, 255, 0)]
-            color = random.choice(colors)
-            
-            size = random.randint(4, 8)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "solar", (x,y)))
-
-    def create_vortex(self, x, y):
-        for _ in range(10):
-            offset_angle = random.uniform(0, 2 * math.pi)
-            offset_distance = random.uniform(10, 50)
-            start_x = x + math.cos(offset_angle) * offset_distance
-            start_y = y + math.sin(offset_angle) * offset_distance
-            
-            vx = -math.sin(offset_angle) * 2 + random.uniform(-1, 1)
-            vy = math.cos(offset_angle) * 2 + random.uniform(-1, 1)
-            
-            colors = [(0, 50, 100), (0, 100, 150), (50, 0, 100), (0, 80, 80)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "vortex", (x,y)))
+        # Default gravity application
+        vy[GRAVITY_MASK[kind]] += GRAVITY
+
+        # Special behaviors, one batch per type present this frame
+        self.skip = np.zeros(n, bool) # Rows that returned early from their behavior (lightning branch, lava smoke)
+        self.spawns = []
+        self.mouse_pos, self.mouse_buttons, self.simulated_beat = mouse_pos, mouse_buttons, simulated_beat
+        self.spatial_index = spatial_index
+        forces_start = time.perf_counter()
+        self.apply_forces(kind)
+        if profiler:
+            elapsed = time.perf_counter() - forces_start
+            profiler.add("update", "(forces)", elapsed)
+            self.behavior_time += elapsed
+        for code in np.flatnonzero(np.bincount(kind, minlength=len(PARTICLE_TYPES))):
+            behavior = self.behaviors.get(code)
+            if behavior and profiler:
+                behavior_start = time.perf_counter()
+                behavior(np.flatnonzero(kind == code))
+                elapsed = time.perf_counter() - behavior_start
+                profiler.add("update", PARTICLE_TYPES[code], elapsed)
+                self.behavior_time += elapsed
+            elif behavior:
+                behavior(np.flatnonzero(kind == code))
+
+        active = np.flatnonzero(~self.skip)
+        kind = kind[active]
 
-    def create_aurora(self, x, y):
-        for _ in range(3):
-            start_x = random.uniform(0, WIDTH)
-            start_y = HEIGHT + random.uniform(0, 20)
-            
-            vx = random.uniform(-0.5, 0.5)
-            vy = random.uniform(-1, -0.5)
-            
-            colors = [(50, 200, 50), (100, 255, 100), (0, 150, 200), (50, 50, 200), (150, 0, 200)]
-            color = random.choice(colors)
-            
-            size = random.randint(10, 30)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "aurora", initial_life=300))
+        # Apply general damping (if not overridden by specific type)
+        damped = active[DAMPING_MASK[kind]]
+        vx[damped] *= DAMPING
+        vy[damped] *= DAMPING
 
-    def create_geyser(self, x, y):
-        for _ in range(15):
-            vx = random.uniform(-3, 3)
-            vy = random.uniform(-20, -10)
-            
-            colors = [(150, 200, 255), (200, 220, 255), (255, 255, 255), (100, 150, 200)]
-            color = random.choice(colors)
-            
-            size = random.randint(3, 6)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "geyser", initial_life=90))
-
-    def create_swarm(self, x, y):
-        for _ in range(5):
-            offset_x = random.uniform(-10, 10)
-            offset_y = random.uniform(-10, 10)
-            start_x = x + offset_x
-            start_y = y + offset_y
-
-            vx = random.uniform(-1, 1)
-            vy = random.uniform(-1, 1)
-            
-            colors = [(100, 100, 100), (80, 80, 80), (120, 120, 120), (50, 50, 50)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "swarm", initial_life=PARTICLE_LIFE))
-
-    def create_gravity_field(self, x, y):
-        for _ in range(8):
-            start_x = random.uniform(0, WIDTH)
-            start_y = random.uniform(0, HEIGHT)
-            vx = random.uniform(-3, 3)
-            vy = random.uniform(-3, 3)
-            
-            colors = [(50, 50, 150), (80, 80, 180), (100, 100, 200), (150, 50, 150), (180, 80, 180)]
-            color = random.choice(colors)
-            
-            size = random.randint(3, 6)
-            self.particles.append(Particle(start_x, start_y, vx, vy, color, size, "gravity_field"))
+        # Update position
+        x[active] += vx[active]
+        y[active] += vy[active]
 
-    def create_flowing_stream(self, x, y, mouse_vel):
-        for _ in range(3):
-            vx = random.uniform(-1, 1) + mouse_vel[0] * 0.2
-            vy = random.uniform(-1, 1) + mouse_vel[1] * 0.2
-            
-            colors = [(150, 200, 255), (200, 220, 255), (255, 255, 255), (180, 220, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 5)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "flowing_stream", initial_life=120))
+        # Bounce off walls (except for specific types that pass through or dissipate)
+        self.bounce(active[BOUNCE_MASK[kind]])
+        culled = active[CULL_MASK[kind]]
+        offscreen = (y[culled] > HEIGHT + 50) | (y[culled] < -50) | (x[culled] > WIDTH + 50) | (x[culled] < -50)
+        self.life[culled[offscreen]] = 0
+        if mouse_pos:
+            holes = active[kind == TYPE_CODES["blackhole"]]
+            self.life[holes[np.hypot(mouse_pos[0] - x[holes], mouse_pos[1] - y[holes]) < 5]] = 0
 
-    def create_bouncing_collision(self, x, y):
-        for _ in range(5):
-            vx = random.uniform(-8, 8)
-            vy = random.uniform(-10, -5)
-            
-            hue = random.random()
-            rgb = colorsys.hsv_to_rgb(hue, 0.9, 1.0)
-            color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-            
-            size = random.randint(8, 15)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "bouncing_collision"))
+        self.push_trail(active)
 
-    def create_explosion_implosion(self, x, y, is_implosion):
-        for _ in range(20):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(5, 15)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            colors = [(255, 100, 0), (255, 200, 50), (255, 50, 50), (200, 0, 0), (255, 255, 100)]
-            color = random.choice(colors)
-            
-            size = random.randint(4, 8)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "explosion_implosion", target_pos=(x,y) if is_implosion else None, initial_life=60))
+        # Decrease life
+        self.life[active] -= 1
+        self.fade(active, kind, mouse_pos)
+
+        # New particles generated at the end of the update (branching lightning, chain reaction)
+        lightning = active[(kind == TYPE_CODES["lightning"]) & self.branched[active]]
+        self.branched[lightning] = False # Reset to prevent continuous branching from one particle
+        self.spawn_lightning(lightning)
+        starters = active[kind == TYPE_CODES["chain_starter"]]
+        self.life[starters] = 0 # This particle immediately triggers an explosion and then dies
+        for row in starters:
+            burst = int(self.rng.integers(10, 21))
+            angle = self.rng.uniform(0, 2 * math.pi, burst)
+            speed = self.rng.uniform(5, 10, burst)
+            self.spawns.append(("chain_explosion", self.x[row], self.y[row], np.cos(angle) * speed, np.sin(angle) * speed,
+                                self.color[row], self.rng.integers(3, 7, burst), self.rng.integers(20, 41, burst)))
+
+        spawns = self.spawns
+        self.spawns = None
+        return spawns
+
+    def finish(self, spawns):
+        self.compact()
+        for special_type, sx, sy, svx, svy, color, size, initial_life in spawns:
+            self.append(special_type, np.broadcast_to(sx, np.shape(svx)), sy, svx, svy, color, size, initial_life)
+
+    def bounce(self, rows, restitution=-0.8):
+        x, y, vx, vy = self.x, self.y, self.vx, self.vy
+        for pos, vel, limit in ((x, vx, WIDTH), (y, vy, HEIGHT)):
+            low = rows[pos[rows] < 0]
+            pos[low] = 0
+            vel[low] *= restitution
+            high = rows[pos[rows] > limit]
+            pos[high] = limit
+            vel[high] *= restitution
+
+    def push_trail(self, rows):
+        # Write each row's position at its ring head; once a ring is full this overwrites the oldest point
+        head = self.trail_head[rows]
+        self.trail[rows, head, 0] = self.x[rows]
+        self.trail[rows, head, 1] = self.y[rows]
+        self.trail_head[rows] = (head + 1) % self.max_trail[rows]
+        self.trail_len[rows] = np.minimum(self.trail_len[rows] + 1, self.max_trail[rows])
+
+    def trail_circles(self, n, stride=1):
+        # Every trail circle of rows [0, n) in one batch, the same circles draw_trail would draw.
+        # Returns per-row offsets into the circle arrays plus positions, colors and radii.
+        lengths = self.trail_len[:n].astype(np.int64)
+        counts = np.maximum(lengths - 1, 0) # The newest point is the particle itself
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        rows = np.repeat(np.arange(n), counts)
+        i = np.arange(offsets[-1]) - offsets[rows] # Age order within the trail, 0 = oldest
+        if stride > 1:
+            sampled = (counts[rows] - 1 - i) % stride == 0
+            rows, i = rows[sampled], i[sampled]
+        limit = self.max_trail[rows].astype(np.int64)
+        oldest = (self.trail_head[rows] - lengths[rows]) % limit
+        points = self.trail[rows, (oldest + i) % limit].astype(np.int32)
+        alpha = i / lengths[rows] * (self.life[rows] / self.max_life[rows])
+        colors = (self.color[rows] * (alpha * 0.5)[:, None]).astype(np.int32)
+        radii = np.maximum(1, (self.cur_size[rows] * alpha * 0.5).astype(np.int32)) # Thinner trail
+        drawn = alpha > 0
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(rows[drawn], minlength=n))))
+        return offsets, points[drawn], colors[drawn], radii[drawn]
+
+    def fade(self, rows, kind, mouse_pos):
+        # Fade out: compute current_color/current_size like the end of Particle.update
+        alpha = self.life[rows] / self.max_life[rows]
+        current_alpha = alpha * FADE_TABLE[kind]
+        current_size = np.maximum(1, (self.size[rows] * np.where(SIZE_FADES[kind], alpha, 1)).astype(np.int32))
+
+        fireflies = kind == TYPE_CODES["firefly"]
+        if fireflies.any():
+            r = rows[fireflies]
+            pulse_factor = (np.sin(self.age[r] * self.rate[r] + self.phase[r]) + 1) / 2
+            current_alpha[fireflies] = alpha[fireflies] * (0.5 + pulse_factor * 0.5)
+            current_size[fireflies] = np.maximum(1, (self.initial_size[r] * (0.8 + pulse_factor * 0.2)).astype(np.int32))
+        solar = kind == TYPE_CODES["solar"]
+        if solar.any() and mouse_pos:
+            r = rows[solar]
+            distance_ratio = np.hypot(self.x[r] - mouse_pos[0], self.y[r] - mouse_pos[1]) / (self.max_life[r] * np.maximum(self.aux[r], 1e-6))
+            current_alpha[solar] = np.maximum(0, alpha[solar] - distance_ratio * 0.5)
+            current_size[solar] = np.maximum(1, (self.size[r] * current_alpha[solar]).astype(np.int32))
+        sound = kind == TYPE_CODES["sound_visualizer"]
+        if sound.any():
+            r = rows[sound]
+            pulse_color_factor = (np.sin(self.age[r] * 0.1 + self.phase[r]) + 1) / 2
+            current_alpha[sound] = alpha[sound] * (0.5 + pulse_color_factor * 0.5)
+            current_size[sound] = self.cur_size[r] # Size is handled in update_sound_visualizer
+
+        self.cur_color[rows] = np.clip(self.color[rows] * current_alpha[:, None], 0, 255).astype(np.uint8)
+        self.cur_size[rows] = current_size
+
+    def spawn_lightning(self, rows):
+        for row in rows:
+            self.spawns.append(("lightning", self.x[row], self.y[row], self.rng.uniform(-5, 5, 2), self.rng.uniform(-5, 5, 2),
+                                self.color[row], self.size[row], self.rng.integers(20, 41, 2)))
+
+    def apply_forces(self, kind):
+        # Every FORCE_LAWS row in one batch; kind is the type code of each live row
+        if not self.mouse_pos:
+            return
+        rows = np.flatnonzero(FORCE_MASK[kind])
+        if self.mouse_buttons is None:
+            rows = rows[FORCE_TABLE[kind[rows], FORCE_BUTTONS] == 0]
+        if len(rows) == 0:
+            return
+        repel = bool(self.mouse_buttons and self.mouse_buttons[2])
+        if force_field_jit:
+            force_field_jit(rows, kind, FORCE_TABLE, self.x, self.y, self.vx, self.vy, self.life,
+                            float(self.mouse_pos[0]), float(self.mouse_pos[1]), repel)
+            return
+        # The mouse delta is shared; each law present then runs on its rows with scalar parameters, which
+        # beats gathering parameters per row (dist ** exponent with a scalar exponent has fast paths)
+        dx, dy, dist = self.mouse_delta(rows)
+        codes = kind[rows]
+        present = np.flatnonzero(np.bincount(codes, minlength=len(PARTICLE_TYPES)))
+        for code in present:
+            r, rdx, rdy, rdist = rows, dx, dy, dist
+            if len(present) > 1:
+                mine = codes == code
+                r, rdx, rdy, rdist = rows[mine], dx[mine], dy[mine], dist[mine]
+            (min_dist, max_dist, strength, repel_strength, exponent, swirl, swirl_ratio,
+             inner_damping, inner_life, damping, _) = FORCE_TABLE[code].tolist()
+            inner = rdist <= min_dist
+            pull = ~inner & (rdist < max_dist)
+            p, pdx, pdy, pdist = r[pull], rdx[pull], rdy[pull], rdist[pull]
+            force = repel_strength if repel else strength
+            if exponent:
+                force = force / pdist ** exponent
+            swirl = swirl + swirl_ratio * force
+            self.vx[p] += pdx / pdist * force - pdy / pdist * swirl
+            self.vy[p] += pdy / pdist * force + pdx / pdist * swirl
+            if inner_damping != 1:
+                self.damp(r[inner], inner_damping)
+            if inner_life:
+                self.life[r[inner]] -= inner_life
+            if damping != 1:
+                self.damp(r, damping)
+
+    def mouse_delta(self, rows):
+        dx = self.mouse_pos[0] - self.x[rows]
+        dy = self.mouse_pos[1] - self.y[rows]
+        return dx, dy, np.hypot(dx, dy)
+
+    def uniform(self, low, high, rows):
+        return self.rng.uniform(low, high, len(rows)).astype(np.float32)
+
+    def damp(self, rows, factor):
+        self.vx[rows] *= factor
+        self.vy[rows] *= factor
+
+    # Per-type behaviors, each advancing all rows of one special_type (see Particle.update)
+    def update_electric(self, rows):
+        self.vx[rows] += self.uniform(-1, 1, rows)
+        self.vy[rows] += self.uniform(-0.5, 0.5, rows)
+
+    def update_magnetic(self, rows):
+        self.vx[rows] += np.sin(self.age[rows] * 0.1) * 0.5
+        self.vy[rows] += np.cos(self.age[rows] * 0.1) * 0.3
+
+    def update_bubble(self, rows):
+        self.vy[rows] -= 0.3
+        self.vx[rows] += self.uniform(-0.2, 0.2, rows)
+
+    def update_snow(self, rows):
+        self.vx[rows] += np.sin(self.age[rows] * 0.05) * 0.2
+        self.vy[rows] = np.abs(self.vy[rows]) * 0.3
+
+    def update_spiral(self, rows):
+        angle = self.age[rows] * 0.2
+        self.vx[rows] += np.cos(angle) * 0.3
+        self.vy[rows] += np.sin(angle) * 0.3
+
+    def update_rain(self, rows):
+        self.vy[rows] += GRAVITY * 0.5
+        self.vx[rows] += self.uniform(-0.1, 0.1, rows)
+        self.damp(rows, 0.98)
+
+    def update_smoke(self, rows):
+        self.vy[rows] -= 0.15
+        self.vx[rows] += self.uniform(-0.1, 0.1, rows)
+        self.size[rows] += 0.05
+        self.damp(rows, 0.95)
+
+    def update_confetti(self, rows):
+        self.vy[rows] += GRAVITY * 0.8
+        self.vx[rows] += np.sin(self.age[rows] * 0.1) * 0.5
+        self.spin_speed[rows] = self.uniform(-0.5, 0.5, rows)
+
+    def update_fluid(self, rows):
+        self.vy[rows] += GRAVITY * 0.1
+        self.damp(rows, 0.95)
+        self.spin_speed[rows] = 0
+
+    def update_crystal(self, rows):
+        self.vy[rows] += GRAVITY * 0.5
+        self.spin_speed[rows] = self.uniform(-0.1, 0.1, rows)
+
+    def update_lightning(self, rows):
+        self.vx[rows] += self.uniform(-5, 5, rows)
+        self.vy[rows] += self.uniform(-5, 5, rows)
+        self.life[rows] -= 1.65
+        self.timer[rows] -= 1
+        branching = rows[(self.timer[rows] <= 0) & ~self.branched[rows]]
+        self.branched[branching] = True
+        self.skip[branching] = True
+        self.spawn_lightning(branching)
+
+    def update_lava(self, rows):
+        self.vy[rows] += GRAVITY * 0.5
+        self.damp(rows, 0.98)
+        smoking = rows[self.age[rows] % 10 == 0] # Emit smoke periodically
+        self.skip[smoking] = True
+        k = len(smoking)
+        if k:
+            self.spawns.append(("smoke", self.x[smoking], self.y[smoking], self.rng.uniform(-0.5, 0.5, k), self.rng.uniform(-1, -0.2, k),
+                                (100, 100, 100), self.rng.integers(3, 7, k), None))
+
+    def update_firefly(self, rows):
+        self.vx[rows] += self.uniform(-0.1, 0.1, rows)
+        self.vy[rows] += self.uniform(-0.1, 0.1, rows)
+        self.damp(rows, 0.99)
+        x, y = self.x[rows], self.y[rows]
+        self.vx[rows[(x < 0) | (x > WIDTH)]] *= -1
+        self.vy[rows[(y < 0) | (y > HEIGHT)]] *= -1
+
+    def update_nebula(self, rows):
+        self.damp(rows, 0.99)
+        self.size[rows] += 0.1
+        self.life[rows] -= 0.5
+
+    def update_aurora(self, rows):
+        self.vy[rows] -= 0.05
+        self.vx[rows] += np.sin(self.age[rows] * 0.02) * 0.1
+        self.damp(rows, 0.99)
+        self.size[rows] += 0.02
+        self.life[rows] -= 0.2
+
+    def update_geyser(self, rows):
+        self.vy[rows[self.age[rows] < 10]] -= 0.5 # Initial burst
+        self.vy[rows] += GRAVITY * 0.8
+        self.life[rows[self.y[rows] > self.aux[rows] + 10]] = 0 # Splashed below its initial point
+
+    def update_swarm(self, rows):
+        if not self.mouse_pos:
+            return
+        dx, dy, dist = self.mouse_delta(rows)
+        near = (dist < 20) & (dist > 0)
+        self.vx[rows[near]] -= dx[near] / dist[near] * 0.05
+        self.vy[rows[near]] -= dy[near] / dist[near] * 0.05
+        self.vx[rows] += self.uniform(-0.1, 0.1, rows)
+        self.vy[rows] += self.uniform(-0.1, 0.1, rows)
+        self.damp(rows, 0.98)
+
+    def update_flowing_stream(self, rows):
+        self.vy[rows] += GRAVITY * 0.05
+        self.damp(rows, 0.995)
+        self.size[rows] += 0.01
+        self.life[rows] -= 0.5
+
+    def update_bouncing_collision(self, rows):
+        self.vy[rows] += GRAVITY
+        self.bounce(rows)
+        self.damp(rows, DAMPING)
+
+    def update_explosion_implosion(self, rows):
+        imploding = rows[self.has_target[rows]]
+        dx = self.tx[imploding] - self.x[imploding]
+        dy = self.ty[imploding] - self.y[imploding]
+        dist = np.hypot(dx, dy)
+        far = dist > 1
+        r, dx, dy, dist = imploding[far], dx[far], dy[far], dist[far]
+        force_strength = 200 / dist ** 2
+        self.vx[r] += dx / dist * force_strength
+        self.vy[r] += dy / dist * force_strength
+        self.life[imploding[~far]] -= 10
+        self.damp(rows, 0.95)
+        self.size[rows] -= 0.05
+
+    def update_wave_ripple(self, rows):
+        self.size[rows] += 0.1
+        self.life[rows] -= 1
+        self.damp(rows, 0.99)
+
+    def update_spring_attraction(self, rows):
+        if not self.mouse_pos:
+            return
+
+        # Slight repulsion from other spring particles, using pairs found through the spatial index
+        index = self.spatial_index
+        if index is None: # Store used on its own: index the spring particles here
+            index = SpatialHash(SPRING_REPULSION_RADIUS)
+            index.rebuild(self.x[rows], self.y[rows], rows)
+        first, second, odx, ody, odist = index.pairs(SPRING_REPULSION_RADIUS)
+        apart = odist > 0
+        first, second, odx, ody, odist = first[apart], second[apart], odx[apart], ody[apart], odist[apart]
+        weight = 0.1 / (odist * np.sqrt(odist)) # Inverse square root repulsion, divided by odist to normalize
+        m = len(index)
+        self.vx[index.items] += np.bincount(first, odx * weight, m) - np.bincount(second, odx * weight, m)
+        self.vy[index.items] += np.bincount(first, ody * weight, m) - np.bincount(second, ody * weight, m)
+        self.damp(rows, 0.95)
+
+    def update_pixel_painter(self, rows):
+        dx = self.tx[rows] - self.x[rows]
+        dy = self.ty[rows] - self.y[rows]
+        self.damp(rows, 0.8)
+        self.vx[rows] += dx * 0.05
+        self.vy[rows] += dy * 0.05
+        settled = rows[np.hypot(dx, dy) < 1]
+        self.x[settled] = self.tx[settled]
+        self.y[settled] = self.ty[settled]
+        self.vx[settled] = 0
+        self.vy[settled] = 0
+
+    def update_chain_explosion(self, rows):
+        self.life[rows] -= 5
+        self.damp(rows, 0.98)
+
+    def update_light_tracer(self, rows):
+        self.vy[rows] += GRAVITY * 0.01
+        self.damp(rows, 0.999)
+
+    def update_sound_visualizer(self, rows):
+        pulse_factor = (np.sin(self.age[rows] * 0.1 + self.phase[rows]) + 1) / 2
+        self.cur_size[rows] = np.maximum(1, (self.aux[rows] * (1 + pulse_factor * 0.5 + self.simulated_beat * 0.8)).astype(np.int32))
+        self.vx[rows] += self.uniform(-0.05, 0.05, rows)
+        self.vy[rows] += self.uniform(-0.05, 0.05, rows)
+        self.damp(rows, 0.99)
+
+    def update_constellation(self, rows):
+        self.damp(rows, 0.995)
+        self.vx[rows] += self.uniform(-0.02, 0.02, rows)
+        self.vy[rows] += self.uniform(-0.02, 0.02, rows)
+
+    def draw_columns(self, alpha=1.0, trail_stride=1):
+        # Everything the renderers read, pulled into Python lists once; indexing NumPy scalars per particle is slow.
+        # alpha places the particles between their previous and current positions (see FixedTimestep).
+        n = self.count
+        x, y = self.x[:n], self.y[:n]
+        if alpha != 1:
+            x = x + (x - self.px[:n]) * (alpha - 1)
+            y = y + (y - self.py[:n]) * (alpha - 1)
+        return ([PARTICLE_TYPES[kind] for kind in self.kind[:n].tolist()],
+                x.astype(np.int32).tolist(), y.astype(np.int32).tolist(),
+                self.cur_size[:n].tolist(), self.cur_color[:n].tolist(), self.color[:n].tolist(),
+                self.rotation[:n].tolist(), self.vx[:n].tolist(), self.vy[:n].tolist(),
+                (self.life[:n] > 0).tolist(), self.trail_circles(n, trail_stride))
+
+    def draw_boxes(self):
+        # draw_boxes for every live row, spanning its previous position, current position and trail
+        n = self.count
+        x, y, px, py = self.x[:n], self.y[:n], self.px[:n], self.py[:n]
+        left, right = np.minimum(x, px), np.maximum(x, px)
+        top, bottom = np.minimum(y, py), np.maximum(y, py)
+        longest = int(self.trail_len[:n].max()) if n else 0
+        if longest > 1:
+            # One axis at a time: reducing the (rows, points, 2) block at once is several times slower
+            filled = np.arange(longest) < self.trail_len[:n, None]
+            xs, ys = self.trail[:n, :longest, 0], self.trail[:n, :longest, 1]
+            left = np.minimum(left, np.where(filled, xs, np.inf).min(axis=1))
+            top = np.minimum(top, np.where(filled, ys, np.inf).min(axis=1))
+            right = np.maximum(right, np.where(filled, xs, -np.inf).max(axis=1))
+            bottom = np.maximum(bottom, np.where(filled, ys, -np.inf).max(axis=1))
+        return draw_boxes(self.kind[:n], left, top, right, bottom, self.cur_size[:n].astype(np.float32),
+                          self.vx[:n], self.vy[:n])
+
+    def draw(self, screen, profiler=None, alpha=1.0, detail=None):
+        if self.count == 0:
+            return
+        kinds, xs, ys, sizes, current_colors, colors, rotations, vxs, vys, alive, trails = self.draw_columns(
+            alpha, detail.trail_stride if detail else 1)
+        offsets, trail_points, trail_colors, trail_radii = [a.tolist() for a in trails]
+        circle = pygame.draw.circle
+        for i in range(self.count):
+            if profiler:
+                start = time.perf_counter()
+            for c in range(offsets[i], offsets[i + 1]):
+                circle(screen, trail_colors[c], trail_points[c], trail_radii[c])
+            if alive[i]:
+                if detail:
+                    draw_body_at_detail(screen, detail, kinds[i], xs[i], ys[i], sizes[i],
+                                        current_colors[i], colors[i], rotations[i], vxs[i], vys[i])
+                else:
+                    draw_particle_body(screen, kinds[i], xs[i], ys[i], sizes[i],
+                                       current_colors[i], colors[i], rotations[i], vxs[i], vys[i])
+            if profiler:
+                profiler.add("draw", kinds[i], time.perf_counter() - start)
+
+    def rows_of_type(self, special_type):
+        return np.flatnonzero(self.kind[:self.count] == TYPE_CODES[special_type])
+
+    def constellation_points(self):
+        rows = self.rows_of_type("constellation")
+        return self.x[rows], self.y[rows], self.color[rows], self.life[rows] / self.max_life[rows]
+
+worker_block = None # The shared store block this worker process has mapped, see advance_chunk
+
+def advance_chunk(task):
+    # ParallelUpdater worker: advance rows [start, end) of the shared store in place and return their spawns
+    global worker_block
+    block_name, capacity, start, end, seed, mouse_pos, mouse_buttons, simulated_beat = task
+    if worker_block is None or worker_block.name != block_name:
+        if worker_block is not None:
+            worker_block.close() # The store was reallocated
+        worker_block = shared_memory.SharedMemory(block_name)
+    columns = store_columns(capacity, worker_block.buf)
+    chunk = ParticleStore(rng=np.random.default_rng([seed, start]),
+                          columns={name: column[start:end] for name, column in columns.items()})
+    spawns = chunk.advance(mouse_pos, mouse_buttons, simulated_beat)
+    chunk.behaviors.clear() # Break the store <-> bound method cycle so the views into the block die right away
+    return spawns
+
+class ParallelUpdater:
+    # Advances a shared ParticleStore on a process pool, PARALLEL_CHUNK rows per task. Workers map the
+    # store's shared memory block and get only row ranges, never particles. Chunks do not depend on the
+    # worker count, each draws from its own random stream seeded from the store's, and spawns are merged
+    # in row order, so a run comes out the same on any number of cores.
+    # Particles must not interact: spring_attraction needs every spring row and is left to ParticleStore.update.
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers)
+
+    def update(self, store, mouse_pos=None, mouse_buttons=None, simulated_beat=0):
+        n = store.count
+        seed = int(store.rng.integers(2 ** 63))
+        tasks = [(store.block.name, store.capacity, start, min(start + PARALLEL_CHUNK, n), seed,
+                  mouse_pos, mouse_buttons, simulated_beat) for start in range(0, n, PARALLEL_CHUNK)]
+        spawns = []
+        for chunk_spawns in self.pool.map(advance_chunk, tasks): # Results come back in task order
+            spawns.extend(chunk_spawns)
+        store.finish(spawns)
+
+    def close(self):
+        # Let the workers finish and exit; terminate() signals them, and SDL's SIGTERM handler, which
+        # forked workers inherit, turns that into a quit event instead of exiting
+        self.pool.close()
+        self.pool.join()
+
+# Every value ParticleSystem.mode accepts
+MODES = ["fountain", "fireworks", "paint", "electric", "bubbles", "snow", "spiral", "galaxy", "tornado", "rain",
+         "smoke", "confetti", "attractor", "blackhole", "fluid", "crystal", "lightning", "lava", "firefly", "nebula",
+         "solar", "vortex", "aurora", "geyser", "swarm", "gravity_field", "flowing_stream", "bouncing_collision",
+         "explosion_implosion", "wave_ripple", "path_follower", "spring_attraction", "pixel_painter",
+         "chain_reaction", "light_tracer", "sound_visualizer", "constellation"]
+
+# Particles one create_* call emits per simulation step at the full rate, by mode. Modes in
+# EMISSION_CHANCES emit this many only on the steps that pass their draw.
+EMISSION_RATES = {"fountain": 5, "fireworks": 20, "paint": 8, "electric": 3, "bubbles": 4, "snow": 6, "spiral": 3,
+                  "galaxy": 8, "tornado": 6, "rain": 3, "smoke": 2, "confetti": 5, "attractor": 5, "blackhole": 8,
+                  "fluid": 10, "crystal": 4, "lightning": 1, "lava": 3, "firefly": 2, "nebula": 1, "solar": 5,
+                  "vortex": 10, "aurora": 3, "geyser": 15, "swarm": 5, "gravity_field": 8, "flowing_stream": 3,
+                  "bouncing_collision": 5, "explosion_implosion": 20, "wave_ripple": 10, "path_follower": 3,
+                  "spring_attraction": 8, "pixel_painter": 1, "chain_reaction": 1, "light_tracer": 1,
+                  "sound_visualizer": 5, "constellation": 1}
+EMISSION_CHANCES = {"fireworks": 0.1, "galaxy": 0.3, "lightning": 0.2, "firefly": 0.1, "nebula": 0.05, "aurora": 0.05}
+
+class Emitter:
+    # A particle source that runs without the mouse. Every simulation step it emits rate particles of its mode
+    # at (x, y) (EMISSION_RATES by default, scaled and gated like mouse emission, fractions carried over), plus
+    # burst particles every burst_interval steps, until lifetime steps have passed (None: until removed).
+    # velocity and buttons stand in for the mouse's in the modes that read them.
+    def __init__(self, mode, x, y, rate=None, burst=0, burst_interval=0, lifetime=None, velocity=(0, 0),
+                 buttons=(True, False, False)):
+        self.mode = mode
+        self.x = x
+        self.y = y
+        self.rate = EMISSION_RATES[mode] if rate is None else rate
+        self.burst = burst
+        self.burst_interval = burst_interval
+        self.lifetime = lifetime
+        self.velocity = tuple(velocity)
+        self.buttons = tuple(buttons)
+        self.age = 0 # Steps run
+        self.credit = 0.0 # Fractional particles carried to the next step
+
+    def step(self, scale, emitting):
+        # Particles to emit this step: the scaled rate if emitting (its EMISSION_CHANCES draw passed), plus a
+        # burst if one is due
+        count = 0
+        if emitting:
+            credit = self.credit + self.rate * scale
+            count = int(credit)
+            self.credit = credit - count
+        if self.burst_interval and self.age % self.burst_interval == 0:
+            count += self.burst
+        self.age += 1
+        return count
 
-    def create_wave_ripple(self, x, y):
-        for _ in range(10):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(1, 3)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            colors = [(50, 150, 255), (100, 200, 255), (150, 220, 255), (200, 240, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(5, 10)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "wave_ripple", initial_life=90))
+    def alive(self):
+        return self.lifetime is None or self.age < self.lifetime
 
-    def create_path_follower(self, x, y, mouse_vel):
-        for _ in range(3):
-            vx = random.uniform(-0.5, 0.5) + mouse_vel[0] * 0.5
-            vy = random.uniform(-0.5, 0.5) + mouse_vel[1] * 0.5
-            
-            hue = random.random()
-            rgb = colorsys.hsv_to_rgb(hue, 0.5, 0.8)
-            color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "path_follower", initial_life=150))
+class ParticleSystem:
+    def __init__(self, engine=ENGINE, eviction=EVICTION, workers=WORKERS, max_particles=MAX_PARTICLES, pipelined=PIPELINED,
+                 seed=None):
+        self.engine = engine
+        self.eviction = eviction # Policy for the particles dropped past max_particles
+        self.max_particles = max_particles
+        self.particles = [] # Used by the "object" engine
+        self.pool = ParticlePool() # Dead object-engine particles, recycled only into this system
+        self.spawned = [] # Particles spawned by others during an object-engine update, reused every frame
+        parallel = workers > 0 and engine != "object"
+        self.store = ParticleStore(shared=parallel) # Used by the "array" engine
+        self.parallel = ParallelUpdater(workers) if parallel else None
+        # Pipelined mode (array engine only): start_update advances self.store on a background thread while
+        # draw() reads self.front, the copy of the store taken when the update started
+        self.pipelined = pipelined and engine != "object"
+        self.front = ParticleStore(capacity=0)
+        self.simulation_thread = None # ThreadPoolExecutor, created on first use
+        self.pending = None # Future of the update running in the background
+        self.spatial_index = SpatialHash(SPRING_REPULSION_RADIUS) # Spring particles, rebuilt every update
+        self.constellation_renderer = ConstellationRenderer()
+        self.renderer = RENDERER
+        self.batch_renderer = BatchRenderer()
+        self.lod = 0 # Index into LOD_LEVELS to draw at
+        self.profiler = None # FrameProfiler to report per-type update and draw times to, if any
+        self.emitters = [] # Emitters ticked at the start of every update
+        self.emission_scale = 1.0 # Fraction of EMISSION_RATES to emit, set per frame from an EmissionGovernor
+        self.emission_credit = {} # Fractional particles carried to the next emission, by mode
+        self.mode = "fountain"  # All modes: fountain, fireworks, paint, electric, bubbles, snow, spiral, galaxy, tornado, rain, smoke, confetti, attractor, blackhole, fluid, crystal, lightning, lava, firefly, nebula, solar, vortex, aurora, geyser, swarm, gravity_field, flowing_stream, bouncing_collision, explosion_implosion, wave_ripple, path_follower, spring_attraction, pixel_painter, chain_reaction, light_tracer, sound_visualizer, constellation
+        self.pixel_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255), (255, 0, 255)]
+        self.pixel_color_index = 0
+        self.simulated_beat_timer = 0
+        self.simulated_beat_frequency = 0.05 # How fast the beat pulses (higher = faster)
+        self.simulated_beat_strength = 0 # Current strength of the beat (0 to 1)
+        self.seed = None
+        self.random_state = None # The system's random module state while it is swapped out, see swap_random
+        self.spawn_rng = None # NumPy generator the create_* methods draw from
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        # Restart the system's random streams from seed (a fresh random one if None). Spawning and both
+        # engines' behaviors draw only from these, so the same seed and input reproduce a run exactly.
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.random_state = random.Random(self.seed).getstate()
+        self.store.rng = np.random.default_rng(self.seed)
+        self.spawn_rng = np.random.default_rng([self.seed, 1]) # A stream of its own, so both engines spawn alike
+
+    def restart(self, seed=None):
+        # Back to the state of a new ParticleSystem(seed=seed), keeping the engine and settings
+        self.finish_update()
+        self.clear()
+        self.reseed(seed)
+        self.pixel_color_index = 0
+        self.simulated_beat_timer = 0
+        self.simulated_beat_strength = 0
+        self.emission_credit = {}
+        self.emitters = []
 
-    def create_spring_attraction(self, x, y):
-        for _ in range(8):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(2, 5)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            # Gentle, pastel colors for spring effect
-            hue = random.random()
-            rgb = colorsys.hsv_to_rgb(hue, 0.6, 0.9)
-            color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-            
-            size = random.randint(3, 6)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "spring_attraction"))
-
-    def create_pixel_painter(self, x, y):
-        # Create a single particle that acts as a "pixel"
-        color = self.get_next_pixel_color()
-        self.particles.append(Particle(x, y, 0, 0, color, special_type="pixel_painter"))
-
-    def create_chain_reaction(self, x, y):
-        # Create a single "starter" particle that immediately triggers an explosion
-        color = (255, 100, 0) # Fiery color for the explosion
-        size = random.randint(5, 8)
-        self.particles.append(Particle(x, y, 0, 0, color, size, "chain_starter", initial_life=1)) # Very short life for starter
-
-    def create_light_tracer(self, x, y, mouse_vel):
-        # Create a single light tracer particle with velocity influenced by mouse
-        vx = random.uniform(-1, 1) + mouse_vel[0] * 0.5
-        vy = random.uniform(-1, 1) + mouse_vel[1] * 0.5
-        
-        # Bright, vibrant colors
-        hue = random.random()
-        rgb = colorsys.hsv_to_rgb(hue, 0.9, 1.0)
-        color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-        
-        self.particles.append(Particle(x, y, vx, vy, color, size=2, special_type="light_tracer"))
+    def save(self, path):
+        # Write the particles (trails and per-type state included) and everything else a resumed run needs,
+        # see write_snapshot. Object-engine particles go through a store, so they are saved as float32.
+        self.finish_update()
+        store = self.store
+        if self.engine == "object":
+            store = ParticleStore(capacity=len(self.particles))
+            store.extend_from_particles(self.particles)
+        state = {"engine": self.engine, "mode": self.mode, "seed": self.seed, "random_state": self.random_state,
+                 "rng_state": self.store.rng.bit_generator.state,
+                 "spawn_rng_state": self.spawn_rng.bit_generator.state, "pixel_color_index": self.pixel_color_index,
+                 "simulated_beat_timer": self.simulated_beat_timer,
+                 "simulated_beat_strength": self.simulated_beat_strength, "emission_credit": self.emission_credit,
+                 "emitters": [vars(emitter) for emitter in self.emitters]}
+        write_snapshot(path, store, state)
+
+    def load(self, path):
+        # Replace the whole simulation with a snapshot written by save, in this system's engine. The rows are
+        # copied straight out of a memory map of the file.
+        state, columns = read_snapshot(path)
+        self.finish_update()
+        self.clear()
+        if self.engine == "object":
+            store = ParticleStore(capacity=0)
+            store.load_columns(columns)
+            self.particles.extend(store.to_particles(self.pool))
+        else:
+            self.store.load_columns(columns)
+        del columns # Unmaps the file
+        self.mode = state["mode"]
+        self.seed = state["seed"]
+        version, internal, gauss = state["random_state"]
+        self.random_state = (version, tuple(internal), gauss)
+        self.store.rng.bit_generator.state = state["rng_state"]
+        self.spawn_rng.bit_generator.state = state["spawn_rng_state"]
+        self.pixel_color_index = state["pixel_color_index"]
+        self.simulated_beat_timer = state["simulated_beat_timer"]
+        self.simulated_beat_strength = state["simulated_beat_strength"]
+        self.emission_credit = state["emission_credit"]
+        self.emitters = []
+        for values in state["emitters"]:
+            emitter = Emitter(values["mode"], values["x"], values["y"])
+            emitter.__dict__.update(values, velocity=tuple(values["velocity"]), buttons=tuple(values["buttons"]))
+            self.emitters.append(emitter)
+
+    def swap_random(self):
+        # Swap the system's random state with the random module's. Particle code (the object engine's
+        # constructor too) calls the module functions, so create_for_mode and update run it between two swaps.
+        outside = random.getstate()
+        random.setstate(self.random_state)
+        self.random_state = outside
+
+    def emit(self, count, x, y, vx, vy, color, size, special_type=None, target_pos=None, initial_life=None):
+        # Add count particles that share a type, target and life. Positions, velocities and sizes are arrays
+        # of count values or one value for all of them, color count RGB rows or one RGB tuple.
+        if count <= 0:
+            return
+        if self.engine != "object":
+            # The store takes its row count from x and broadcasts everything else
+            self.store.append(special_type, x if np.ndim(x) else np.full(count, x, np.float32), y, vx, vy, color, size,
+                              initial_life, target_pos)
+            return
+        def values(column):
+            return column.tolist() if isinstance(column, np.ndarray) else [column] * count
+        colors = [tuple(row) for row in color.tolist()] if isinstance(color, np.ndarray) else [color] * count
+        if target_pos is not None and np.ndim(target_pos[0]): # One target per particle, from a batch of emitters
+            targets = list(zip(values(target_pos[0]), values(target_pos[1])))
+        else:
+            targets = [target_pos] * count
+        acquire = self.pool.acquire
+        self.particles.extend(acquire(x, y, vx, vy, color, size, special_type, target_pos, initial_life)
+                              for x, y, vx, vy, color, size, target_pos in zip(values(x), values(y), values(vx),
+                                                                               values(vy), colors, values(size), targets))
+
+    def emission_count(self):
+        # Particles the current mode emits this step: its EMISSION_RATES count scaled by emission_scale and,
+        # once fewer than EMIT_HEADROOM of max_particles are left, by how much room is left. Fractions carry
+        # over per mode, so a low scale still emits every few steps.
+        credit = self.emission_credit.get(self.mode, 0) + EMISSION_RATES[self.mode] * self.emission_factor()
+        count = int(credit)
+        self.emission_credit[self.mode] = credit - count
+        return count
+
+    def emission_factor(self):
+        # emission_scale, further scaled down once fewer than EMIT_HEADROOM of max_particles are left
+        room = 1 - self.particle_count() / self.max_particles
+        return self.emission_scale * min(1, max(EMIT_MIN_SCALE, room / EMIT_HEADROOM))
+
+    def add_emitter(self, emitter):
+        self.finish_update() # A pipelined update may be ticking the list
+        self.emitters.append(emitter)
+        return emitter
+
+    def clear_emitters(self):
+        self.finish_update()
+        self.emitters = []
 
-    def create_sound_visualizer(self, x, y):
+    def tick_emitters(self):
+        # One step of every emitter: a single create_batch per mode (and buttons, for explosion_implosion) with
+        # each particle at its own emitter's position, then the emitters whose lifetime is over are dropped
+        groups = {}
+        for emitter in self.emitters:
+            groups.setdefault((emitter.mode, emitter.buttons), []).append(emitter)
+        scale = self.emission_factor()
+        for (mode, buttons), group in groups.items():
+            chance = EMISSION_CHANCES.get(mode)
+            emitting = self.spawn_rng.random(len(group)) < chance if chance is not None else [True] * len(group)
+            counts = [emitter.step(scale, gate) for emitter, gate in zip(group, emitting)]
+            total = sum(counts)
+            if total:
+                x, y, vx, vy = np.repeat([(e.x, e.y, e.velocity[0], e.velocity[1]) for e in group], counts, axis=0).T
+                self.create_batch(mode, x, y, total, (vx, vy), buttons)
+        self.emitters = [emitter for emitter in self.emitters if emitter.alive()]
+
+    def particle_count(self):
+        return len(self.particles) if self.engine == "object" else len(self.store)
+
+    def clear(self):
+        self.pool.release(self.particles)
+        self.particles.clear()
+        self.store.clear()
+
+    def close(self):
+        # Stop the background thread and worker processes and free the shared store, if there are any
+        self.finish_update()
+        if self.simulation_thread:
+            self.simulation_thread.shutdown()
+        if self.parallel:
+            self.parallel.close()
+        self.store.release_block()
+
+    def get_next_pixel_colors(self, count):
+        # The next count colors of the pixel painter's cycle
+        indexes = (self.pixel_color_index + np.arange(count)) % len(self.pixel_colors)
+        self.pixel_color_index = (self.pixel_color_index + count) % len(self.pixel_colors)
+        return np.array(self.pixel_colors)[indexes]
+
+    def choose(self, colors, count):
+        # count colors picked at random from a list of RGB tuples
+        return np.array(colors)[self.spawn_rng.integers(len(colors), size=count)]
+
+    def create_fountain(self, x, y, count=EMISSION_RATES["fountain"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(-2*math.pi/3, -math.pi/3, count)
+        speed = rng.uniform(5, 15, count)
+        color = palette.hues(0.8, 1.0)[rng.integers(PALETTE_HUES, size=count)] # Rainbow colors
+        size = rng.integers(2, 6, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size)
+
+    def create_firework(self, x, y, count=EMISSION_RATES["fireworks"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(8, 20, count)
+        # Warm explosion colors
+        color = self.choose([(255, 100, 100), (255, 200, 100), (255, 255, 100), (255, 150, 200), (200, 100, 255)], count)
+        size = rng.integers(3, 7, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size)
+
+    def create_paint_splash(self, x, y, mouse_vel, count=EMISSION_RATES["paint"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(-math.pi/4, math.pi/4, count)
+        speed = rng.uniform(3, 12, count)
+        vx = np.cos(angle) * speed + mouse_vel[0] * 0.3
+        vy = np.sin(angle) * speed + mouse_vel[1] * 0.3
+        # Cool paint colors
+        color = self.choose([(100, 150, 255), (150, 100, 255), (100, 255, 150), (255, 100, 150), (255, 255, 100)], count)
+        size = rng.integers(4, 9, count)
+        self.emit(count, x, y, vx, vy, color, size)
+
+    def create_electric_storm(self, x, y, count=EMISSION_RATES["electric"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(5, 15, count)
+        color = self.choose([(40, 0, 80), (80, 0, 120), (30, 30, 30)], count) # Electric colors
+        size = rng.integers(2, 5, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "electric")
+
+    def create_bubbles(self, x, y, count=EMISSION_RATES["bubbles"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-2, 2, count)
+        vy = rng.uniform(-5, -1, count)
+        color = self.choose([(100, 200, 255), (150, 220, 255), (200, 240, 255), (255, 255, 255)], count) # Bubble colors
+        size = rng.integers(5, 13, count)
+        self.emit(count, x, y, vx, vy, color, size, "bubble")
+
+    def create_snow(self, x, y, count=EMISSION_RATES["snow"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count)
+        vy = rng.uniform(0.5, 3, count)
+        color = self.choose([(255, 255, 255), (240, 240, 255), (220, 220, 255)], count) # Snow colors
+        size = rng.integers(3, 7, count)
+        self.emit(count, x, y, vx, vy, color, size, "snow")
+
+    def create_spiral(self, x, y, count=EMISSION_RATES["spiral"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(3, 8, count)
+        color = self.choose([(255, 100, 255), (255, 150, 100), (100, 255, 255), (255, 255, 100)], count) # Spiral colors
+        size = rng.integers(3, 6, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "spiral")
+
+    def create_galaxy(self, x, y, count=EMISSION_RATES["galaxy"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        distance = rng.uniform(0, 50, count)
+        start_x = x + np.cos(angle) * distance
+        start_y = y + np.sin(angle) * distance
+        vx = -np.sin(angle) * 3 + rng.uniform(-1, 1, count)
+        vy = np.cos(angle) * 3 + rng.uniform(-1, 1, count)
+        color = self.choose([(150, 100, 255), (100, 150, 255), (255, 200, 100), (255, 100, 200)], count)
+        size = rng.integers(2, 5, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "magnetic")
+
+    def create_tornado(self, x, y, count=EMISSION_RATES["tornado"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        radius = rng.uniform(5, 25, count)
+        start_x = x + np.cos(angle) * radius
+        start_y = y + rng.uniform(0, 30, count)
+        vx = -np.sin(angle) * 4
+        vy = rng.uniform(-8, -3, count)
+        color = self.choose([(200, 200, 200), (150, 150, 150), (180, 180, 180), (220, 220, 220)], count)
+        size = rng.integers(2, 6, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "spiral")
+
+    def create_rain(self, x, y, count=EMISSION_RATES["rain"]):
+        rng = self.spawn_rng
+        start_x = x + rng.uniform(-20, 20, count)
+        start_y = y - rng.uniform(50, 100, count)
+        vx = rng.uniform(-0.5, 0.5, count)
+        vy = rng.uniform(5, 10, count)
+        color = self.choose([(100, 150, 200), (120, 170, 220), (150, 180, 230), (180, 200, 240)], count)
+        size = rng.integers(1, 4, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "rain")
+
+    def create_smoke(self, x, y, count=EMISSION_RATES["smoke"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count)
+        vy = rng.uniform(-2, -0.5, count)
+        color = self.choose([(100, 100, 100), (150, 150, 150), (200, 200, 200), (230, 230, 230)], count)
+        size = rng.integers(5, 11, count)
+        self.emit(count, x, y, vx, vy, color, size, "smoke")
+
+    def create_confetti(self, x, y, count=EMISSION_RATES["confetti"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-3, 3, count)
+        vy = rng.uniform(-5, 0, count)
+        color = palette.hues(0.9, 1.0)[rng.integers(PALETTE_HUES, size=count)]
+        size = rng.integers(4, 8, count)
+        self.emit(count, x, y, vx, vy, color, size, "confetti")
+
+    def create_attractor(self, x, y, count=EMISSION_RATES["attractor"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(2, 5, count)
+        color = self.choose([(50, 0, 50), (0, 50, 50), (50, 50, 0), (20, 20, 20)], count)
+        size = rng.integers(2, 5, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "attractor", (x, y))
+
+    def create_blackhole(self, x, y, count=EMISSION_RATES["blackhole"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        distance = rng.uniform(50, 150, count)
+        start_x = x + np.cos(angle) * distance
+        start_y = y + np.sin(angle) * distance
+        speed = rng.uniform(0.5, 2, count)
+        vx = -np.cos(angle) * speed * 0.5 - np.sin(angle) * speed * 0.5
+        vy = -np.sin(angle) * speed * 0.5 + np.cos(angle) * speed * 0.5
+        color = self.choose([(40, 0, 80), (80, 0, 120), (30, 30, 30)], count)
+        size = rng.integers(2, 6, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "blackhole", (x, y))
+
+    def create_fluid(self, x, y, count=EMISSION_RATES["fluid"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count)
+        vy = rng.uniform(-1, 1, count)
+        color = self.choose([(50, 100, 200), (70, 120, 220), (90, 140, 240)], count)
+        size = rng.integers(6, 11, count)
+        self.emit(count, x, y, vx, vy, color, size, "fluid")
+
+    def create_crystal(self, x, y, count=EMISSION_RATES["crystal"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-2, 2, count)
+        vy = rng.uniform(-3, 0, count)
+        color = self.choose([(150, 200, 255), (200, 255, 255), (255, 255, 255), (100, 150, 200)], count)
+        size = rng.integers(5, 9, count)
+        self.emit(count, x, y, vx, vy, color, size, "crystal")
+
+    def create_lightning(self, x, y, count=EMISSION_RATES["lightning"]):
+        rng = self.spawn_rng
+        size = rng.integers(2, 5, count)
+        vx = rng.uniform(-5, 5, count)
+        vy = rng.uniform(-5, 5, count)
+        self.emit(count, x, y, vx, vy, (255, 255, 150), size, "lightning", initial_life=60)
+
+    def create_lava(self, x, y, count=EMISSION_RATES["lava"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count)
+        vy = rng.uniform(-3, -1, count)
+        color = self.choose([(255, 50, 0), (255, 100, 0), (255, 150, 0), (200, 50, 0)], count)
+        size = rng.integers(8, 16, count)
+        self.emit(count, x, y, vx, vy, color, size, "lava")
+
+    def create_firefly(self, x, y, count=EMISSION_RATES["firefly"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-0.5, 0.5, count)
+        vy = rng.uniform(-0.5, 0.5, count)
+        color = self.choose([(150, 255, 150), (200, 255, 200), (255, 255, 150), (100, 200, 255)], count)
+        size = rng.integers(3, 7, count)
+        self.emit(count, x, y, vx, vy, color, size, "firefly")
+
+    def create_nebula(self, x, y, count=EMISSION_RATES["nebula"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-0.1, 0.1, count)
+        vy = rng.uniform(-0.1, 0.1, count)
+        color = self.choose([(100, 0, 150), (0, 100, 150), (150, 50, 0), (0, 150, 100), (100, 100, 200)], count)
+        size = rng.integers(20, 51, count)
+        self.emit(count, x, y, vx, vy, color, size, "nebula")
+
+    def create_solar(self, x, y, count=EMISSION_RATES["solar"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(5, 15, count)
+        color = self.choose([(255, 200, 0), (255, 150, 0), (255, 100, 0), (255, 255, 0)], count)
+        size = rng.integers(4, 9, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "solar", (x,y))
+
+    def create_vortex(self, x, y, count=EMISSION_RATES["vortex"]):
+        rng = self.spawn_rng
+        offset_angle = rng.uniform(0, 2 * math.pi, count)
+        offset_distance = rng.uniform(10, 50, count)
+        start_x = x + np.cos(offset_angle) * offset_distance
+        start_y = y + np.sin(offset_angle) * offset_distance
+        vx = -np.sin(offset_angle) * 2 + rng.uniform(-1, 1, count)
+        vy = np.cos(offset_angle) * 2 + rng.uniform(-1, 1, count)
+        color = self.choose([(0, 50, 100), (0, 100, 150), (50, 0, 100), (0, 80, 80)], count)
+        size = rng.integers(2, 5, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "vortex", (x,y))
+
+    def create_aurora(self, x, y, count=EMISSION_RATES["aurora"]):
+        rng = self.spawn_rng
+        start_x = rng.uniform(0, WIDTH, count)
+        start_y = HEIGHT + rng.uniform(0, 20, count)
+        vx = rng.uniform(-0.5, 0.5, count)
+        vy = rng.uniform(-1, -0.5, count)
+        color = self.choose([(50, 200, 50), (100, 255, 100), (0, 150, 200), (50, 50, 200), (150, 0, 200)], count)
+        size = rng.integers(10, 31, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "aurora", initial_life=300)
+
+    def create_geyser(self, x, y, count=EMISSION_RATES["geyser"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-3, 3, count)
+        vy = rng.uniform(-20, -10, count)
+        color = self.choose([(150, 200, 255), (200, 220, 255), (255, 255, 255), (100, 150, 200)], count)
+        size = rng.integers(3, 7, count)
+        self.emit(count, x, y, vx, vy, color, size, "geyser", initial_life=90)
+
+    def create_swarm(self, x, y, count=EMISSION_RATES["swarm"]):
+        rng = self.spawn_rng
+        start_x = x + rng.uniform(-10, 10, count)
+        start_y = y + rng.uniform(-10, 10, count)
+        vx = rng.uniform(-1, 1, count)
+        vy = rng.uniform(-1, 1, count)
+        color = self.choose([(100, 100, 100), (80, 80, 80), (120, 120, 120), (50, 50, 50)], count)
+        size = rng.integers(2, 5, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "swarm", initial_life=PARTICLE_LIFE)
+
+    def create_gravity_field(self, x, y, count=EMISSION_RATES["gravity_field"]):
+        rng = self.spawn_rng
+        start_x = rng.uniform(0, WIDTH, count)
+        start_y = rng.uniform(0, HEIGHT, count)
+        vx = rng.uniform(-3, 3, count)
+        vy = rng.uniform(-3, 3, count)
+        color = self.choose([(50, 50, 150), (80, 80, 180), (100, 100, 200), (150, 50, 150), (180, 80, 180)], count)
+        size = rng.integers(3, 7, count)
+        self.emit(count, start_x, start_y, vx, vy, color, size, "gravity_field")
+
+    def create_flowing_stream(self, x, y, mouse_vel, count=EMISSION_RATES["flowing_stream"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count) + mouse_vel[0] * 0.2
+        vy = rng.uniform(-1, 1, count) + mouse_vel[1] * 0.2
+        color = self.choose([(150, 200, 255), (200, 220, 255), (255, 255, 255), (180, 220, 255)], count)
+        size = rng.integers(2, 6, count)
+        self.emit(count, x, y, vx, vy, color, size, "flowing_stream", initial_life=120)
+
+    def create_bouncing_collision(self, x, y, count=EMISSION_RATES["bouncing_collision"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-8, 8, count)
+        vy = rng.uniform(-10, -5, count)
+        color = palette.hues(0.9, 1.0)[rng.integers(PALETTE_HUES, size=count)]
+        size = rng.integers(8, 16, count)
+        self.emit(count, x, y, vx, vy, color, size, "bouncing_collision")
+
+    def create_explosion_implosion(self, x, y, is_implosion, count=EMISSION_RATES["explosion_implosion"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(5, 15, count)
+        color = self.choose([(255, 100, 0), (255, 200, 50), (255, 50, 50), (200, 0, 0), (255, 255, 100)], count)
+        size = rng.integers(4, 9, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "explosion_implosion",
+                  target_pos=(x,y) if is_implosion else None, initial_life=60)
+
+    def create_wave_ripple(self, x, y, count=EMISSION_RATES["wave_ripple"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(1, 3, count)
+        color = self.choose([(50, 150, 255), (100, 200, 255), (150, 220, 255), (200, 240, 255)], count)
+        size = rng.integers(5, 11, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "wave_ripple", initial_life=90)
+
+    def create_path_follower(self, x, y, mouse_vel, count=EMISSION_RATES["path_follower"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-0.5, 0.5, count) + mouse_vel[0] * 0.5
+        vy = rng.uniform(-0.5, 0.5, count) + mouse_vel[1] * 0.5
+        color = palette.hues(0.5, 0.8)[rng.integers(PALETTE_HUES, size=count)]
+        size = rng.integers(2, 5, count)
+        self.emit(count, x, y, vx, vy, color, size, "path_follower", initial_life=150)
+
+    def create_spring_attraction(self, x, y, count=EMISSION_RATES["spring_attraction"]):
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(2, 5, count)
+        color = palette.hues(0.6, 0.9)[rng.integers(PALETTE_HUES, size=count)] # Gentle, pastel colors for spring effect
+        size = rng.integers(3, 7, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "spring_attraction")
+
+    def create_pixel_painter(self, x, y, count=EMISSION_RATES["pixel_painter"]):
+        # Create particles that act as "pixels", each in the next color
+        self.emit(count, x, y, 0, 0, self.get_next_pixel_colors(count), 3, "pixel_painter")
+
+    def create_chain_reaction(self, x, y, count=EMISSION_RATES["chain_reaction"]):
+        # Create "starter" particles that immediately trigger an explosion
+        size = self.spawn_rng.integers(5, 9, count)
+        # Fiery color for the explosion, very short life for starters
+        self.emit(count, x, y, 0, 0, (255, 100, 0), size, "chain_starter", initial_life=1)
+
+    def create_light_tracer(self, x, y, mouse_vel, count=EMISSION_RATES["light_tracer"]):
+        # Create light tracer particles with velocity influenced by mouse
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count) + mouse_vel[0] * 0.5
+        vy = rng.uniform(-1, 1, count) + mouse_vel[1] * 0.5
+        color = palette.hues(0.9, 1.0)[rng.integers(PALETTE_HUES, size=count)] # Bright, vibrant colors
+        self.emit(count, x, y, vx, vy, color, 2, "light_tracer")
+
+    def create_sound_visualizer(self, x, y, count=EMISSION_RATES["sound_visualizer"]):
         # Create particles that will pulse
-        for _ in range(5):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(1, 3)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            
-            # Bright, varied colors
-            hue = random.random()
-            rgb = colorsys.hsv_to_rgb(hue, 0.8, 1.0)
-            color = (int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255))
-            
-            size = random.randint(4, 8)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "sound_visualizer"))
+        rng = self.spawn_rng
+        angle = rng.uniform(0, 2 * math.pi, count)
+        speed = rng.uniform(1, 3, count)
+        color = palette.hues(0.8, 1.0)[rng.integers(PALETTE_HUES, size=count)] # Bright, varied colors
+        size = rng.integers(4, 9, count)
+        self.emit(count, x, y, np.cos(angle) * speed, np.sin(angle) * speed, color, size, "sound_visualizer")
+
+    def create_constellation(self, x, y, count=EMISSION_RATES["constellation"]):
+        rng = self.spawn_rng
+        vx = rng.uniform(-1, 1, count)
+        vy = rng.uniform(-1, 1, count)
+        # Subtle, star-like colors (whites, light blues, purples)
+        color = self.choose([(255, 255, 255), (200, 220, 255), (180, 200, 255), (220, 200, 255)], count)
+        size = rng.integers(2, 5, count)
+        self.emit(count, x, y, vx, vy, color, size, "constellation")
+
+    def create_for_mode(self, x, y, mouse_vel=(0, 0), mouse_buttons=(True, False, False)):
+        if self.engine != "object": # Only Particle's constructor still draws from the random module
+            self.spawn_for_mode(x, y, mouse_vel, mouse_buttons)
+            return
+        self.swap_random()
+        try:
+            self.spawn_for_mode(x, y, mouse_vel, mouse_buttons)
+        finally:
+            self.swap_random()
+
+    def spawn_for_mode(self, x, y, mouse_vel=(0, 0), mouse_buttons=(True, False, False)):
+        # Emit one step's worth of particles for the current mode at (x, y), as many as emission_count allows.
+        # Gated modes emit only on the steps that pass their EMISSION_CHANCES draw.
+        chance = EMISSION_CHANCES.get(self.mode)
+        if chance is None or self.spawn_rng.random() < chance:
+            self.create_batch(self.mode, x, y, self.emission_count(), mouse_vel, mouse_buttons)
+
+    def create_batch(self, mode, x, y, count, mouse_vel=(0, 0), mouse_buttons=(True, False, False)):
+        # Emit count particles of a mode at (x, y) in one batch
+        if mode == "fountain":
+            self.create_fountain(x, y, count)
+        elif mode == "fireworks":
+            self.create_firework(x, y, count)
+        elif mode == "paint":
+            self.create_paint_splash(x, y, mouse_vel, count)
+        elif mode == "electric":
+            self.create_electric_storm(x, y, count)
+        elif mode == "bubbles":
+            self.create_bubbles(x, y, count)
+        elif mode == "snow":
+            self.create_snow(x, y, count)
+        elif mode == "spiral":
+            self.create_spiral(x, y, count)
+        elif mode == "galaxy":
+            self.create_galaxy(x, y, count)
+        elif mode == "tornado":
+            self.create_tornado(x, y, count)
+        elif mode == "rain":
+            self.create_rain(x, y, count)
+        elif mode == "smoke":
+            self.create_smoke(x, y, count)
+        elif mode == "confetti":
+            self.create_confetti(x, y, count)
+        elif mode == "attractor":
+            self.create_attractor(x, y, count)
+        elif mode == "blackhole":
+            self.create_blackhole(x, y, count)
+        elif mode == "fluid":
+            self.create_fluid(x, y, count)
+        elif mode == "crystal":
+            self.create_crystal(x, y, count)
+        elif mode == "lightning":
+            self.create_lightning(x, y, count)
+        elif mode == "lava":
+            self.create_lava(x, y, count)
+        elif mode == "firefly":
+            self.create_firefly(x, y, count)
+        elif mode == "nebula":
+            self.create_nebula(x, y, count)
+        elif mode == "solar":
+            self.create_solar(x, y, count)
+        elif mode == "vortex":
+            self.create_vortex(x, y, count)
+        elif mode == "aurora":
+            self.create_aurora(x, y, count)
+        elif mode == "geyser":
+            self.create_geyser(x, y, count)
+        elif mode == "swarm":
+            self.create_swarm(x, y, count)
+        elif mode == "gravity_field":
+            self.create_gravity_field(x, y, count)
+        elif mode == "flowing_stream":
+            self.create_flowing_stream(x, y, mouse_vel, count)
+        elif mode == "bouncing_collision":
+            self.create_bouncing_collision(x, y, count)
+        elif mode == "explosion_implosion":
+            if mouse_buttons[0]: # Left click for explosion
+                self.create_explosion_implosion(x, y, False, count)
+            elif mouse_buttons[2]: # Right click for implosion
+                self.create_explosion_implosion(x, y, True, count)
+        elif mode == "wave_ripple":
+            self.create_wave_ripple(x, y, count)
+        elif mode == "path_follower":
+            self.create_path_follower(x, y, mouse_vel, count)
+        elif mode == "spring_attraction":
+            self.create_spring_attraction(x, y, count)
+        elif mode == "pixel_painter":
+            self.create_pixel_painter(x, y, count)
+        elif mode == "chain_reaction":
+            self.create_chain_reaction(x, y, count)
+        elif mode == "light_tracer":
+            self.create_light_tracer(x, y, mouse_vel, count)
+        elif mode == "sound_visualizer":
+            self.create_sound_visualizer(x, y, count)
+        elif mode == "constellation":
+            self.create_constellation(x, y, count)
+
+    def simulate(self, steps, mouse_pos, mouse_velocity, mouse_buttons, emit):
+        # steps simulation steps as main() runs them: emit (while the mouse is held) then update
+        for _ in range(steps):
+            if emit:
+                self.create_for_mode(mouse_pos[0], mouse_pos[1], mouse_velocity, mouse_buttons)
+            self.update(mouse_pos, mouse_buttons)
+
+    def start_update(self, steps, mouse_pos, mouse_velocity, mouse_buttons, emit):
+        # Pipelined mode: publish the current state to self.front for drawing, then simulate on the background
+        # thread. Nothing else may touch the system until finish_update() returns. NumPy releases the GIL in
+        # its array loops, so the update overlaps with drawing, UI and the display flip.
+        self.finish_update()
+        self.store.copy_to(self.front)
+        if self.simulation_thread is None:
+            self.simulation_thread = ThreadPoolExecutor(max_workers=1)
+        self.pending = self.simulation_thread.submit(self.simulate, steps, mouse_pos, mouse_velocity, mouse_buttons, emit)
+
+    def finish_update(self):
+        # Wait for the background update, re-raising anything it raised
+        if self.pending:
+            pending, self.pending = self.pending, None
+            pending.result()
 
-    def create_constellation(self, x, y):
-        for _ in range(1): # Only 1 per click
-            vx = random.uniform(-1, 1)
-            vy = random.uniform(-1, 1)
-            
-            # Subtle, star-like colors (whites, light blues, purples)
-            colors = [(255, 255, 255), (200, 220, 255), (180, 200, 255), (220, 200, 255)]
-            color = random.choice(colors)
-            
-            size = random.randint(2, 4)
-            self.particles.append(Particle(x, y, vx, vy, color, size, "constellation"))
-    
     def update(self, mouse_pos=None, mouse_buttons=None): # Added mouse_buttons parameter
+        self.swap_random()
+        try:
+            if self.emitters:
+                self.tick_emitters()
+            self.advance(mouse_pos, mouse_buttons)
+        finally:
+            self.swap_random()
+
+    def advance(self, mouse_pos=None, mouse_buttons=None):
         # Update simulated beat for sound visualizer
         self.simulated_beat_timer += self.simulated_beat_frequency
         self.simulated_beat_strength = (math.sin(self.simulated_beat_timer) + 1) / 2 # 0 to 1 pulse
 
-        # Update particles and collect any new particles generated by them
-        new_particles = []
-        # Create a copy of the list to iterate over, as particles might be added/removed during the loop
-        current_particles = list(self.particles) 
-        for particle in current_particles:
+        if self.engine != "object":
+            springs = self.store.rows_of_type("spring_attraction")
+            if self.parallel and len(springs) == 0 and len(self.store) >= PARALLEL_MIN_ROWS:
+                start = time.perf_counter()
+                self.parallel.update(self.store, mouse_pos, mouse_buttons, self.simulated_beat_strength)
+                if self.profiler:
+                    self.profiler.add("update", "(parallel)", time.perf_counter() - start)
+            else:
+                self.spatial_index.rebuild(self.store.x[springs], self.store.y[springs], springs)
+                self.store.update(mouse_pos, mouse_buttons, self.simulated_beat_strength, self.spatial_index, self.profiler)
+            self.store.enforce_cap(self.max_particles, self.eviction) # Limit particle count
+            return
+
+        springs = [p for p in self.particles if p.special_type == "spring_attraction"]
+        self.spatial_index.rebuild([p.x for p in springs], [p.y for p in springs], springs)
+
+        # Update particles and collect any new particles generated by them. New particles are held back in
+        # self.spawned until every particle has moved, so the loop can walk self.particles itself.
+        particles = self.particles
+        spawned = self.spawned
+        profiler = self.profiler
+        alive = 0
+        for particle in particles:
+            if profiler:
+                start = time.perf_counter()
             # Pass all_particles for inter-particle forces (e.g., spring_attraction repulsion, constellation connections)
             # Pass simulated_beat_strength for sound visualizer
-            result = particle.update(mouse_pos, mouse_buttons, self.particles, self.simulated_beat_strength) 
+            result = particle.update(mouse_pos, mouse_buttons, particles, self.simulated_beat_strength, self.spatial_index)
+            if profiler:
+                profiler.add("update", particle.special_type, time.perf_counter() - start)
             if isinstance(result, list): # If particle returned a list of new particles
-                new_particles.extend(result)
-            
-        self.particles.extend(new_particles) # Add new particles to the system
-        self.particles = [p for p in self.particles if p.life > 0] # Filter out dead particles
-            
-        # Limit particle count
-        if len(self.particles) > MAX_PARTICLES:
-            self.particles = self.particles[-MAX_PARTICLES:] # Keep the newest particles
+                spawned.extend(result)
+            alive += particle.life > 0
+        for particle in spawned:
+            alive += particle.life > 0
+        particles.extend(spawned) # Add new particles to the system
+        spawned.clear()
+        self.compact(alive)
+
+    def compact(self, alive):
+        # Object engine: filter out dead particles and, past max_particles, the ones the eviction policy picks,
+        # in one in-place pass that keeps survivors in spawn order. Everything dropped goes back to the pool.
+        # alive is the number of particles with life left.
+        particles = self.particles
+        excess = alive - self.max_particles
+        evict = self.evictions(excess) if excess > 0 else None
+        key = EVICTION_KEYS[self.eviction]
+        recycle = self.pool.recycle
+        write = 0
+        for particle in particles:
+            if particle.life <= 0:
+                recycle(particle)
+                continue
+            if evict:
+                value = key(particle)
+                left = evict.get(value)
+                if left:
+                    # Evict this one; drop the entry once its count runs out so the check above stays cheap
+                    if left == 1:
+                        del evict[value]
+                    else:
+                        evict[value] = left - 1
+                    recycle(particle)
+                    continue
+            particles[write] = particle
+            write += 1
+        del particles[write:]
+
+    def evictions(self, excess):
+        # How many live particles to evict per EVICTION_KEYS value, taken oldest first within each value
+        if self.eviction == "lowest_life":
+            return Counter(heapq.nsmallest(excess, (p.life for p in self.particles if p.life > 0)))
+        if self.eviction == "type_quota":
+            counts = Counter(p.special_type for p in self.particles if p.life > 0)
+            shares = fair_shares(counts, self.max_particles)
+            return {special_type: count - shares[special_type] for special_type, count in counts.items()
+                    if count > shares[special_type]}
+        return {None: excess}
     
-    def draw(self, screen):
+    def draw(self, screen, alpha=1.0):
+        # alpha: where between the last two updates to draw particles, 1 being the latest (see FixedTimestep)
+        profiler = self.profiler
+        store = self.front if self.pipelined else self.store
+        detail = LOD_LEVELS[self.lod] if self.lod else None # Level 0 takes the full-detail paths
+        stride = detail.trail_stride if detail else 1
         # Draw constellation lines before particles for layering
         if self.mode == "constellation":
-            for i, p1 in enumerate(self.particles):
-                for j, p2 in enumerate(self.particles):
-                    if i < j and p1.special_type == "constellation" and p2.special_type == "constellation":
-                        dist = math.hypot(p1.x - p2.x, p1.y - p2.y)
-                        if dist < 100: # Connect if within a certain distance
-                            line_alpha = int(255 * (1 - dist / 100) * (p1.life / p1.max_life) * (p2.life / p2.max_life))
-                            if line_alpha > 0:
-                                line_color = (min(255, p1.color[0] + p2.color[0]) // 2,
-                                              min(255, p1.color[1] + p2.color[1]) // 2,
-                                              min(255, p1.color[2] + p2.color[2]) // 2,
-                                              line_alpha)
-                                # Pygame draw.line doesn't support alpha, draw on a surface
-                                s = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
-                                pygame.draw.line(s, line_color, (int(p1.x), int(p1.y)), (int(p2.x), int(p2.y)), 1)
-                                screen.blit(s, (0, 0))
-
-        for particle in self.particles:
-            particle.draw(screen)
+            if profiler:
+                start = time.perf_counter()
+            if self.engine == "object":
+                stars = [p for p in self.particles if p.special_type == "constellation"]
+                self.constellation_renderer.draw(screen, [p.x for p in stars], [p.y for p in stars],
+                                                 [p.color for p in stars], [p.life / p.max_life for p in stars])
+            else:
+                self.constellation_renderer.draw(screen, *store.constellation_points())
+            if profiler:
+                profiler.add("draw", "(constellation lines)", time.perf_counter() - start)
+
+        if self.renderer == "batched":
+            # One blits call for everything, so there is nothing to split by type
+            if profiler:
+                start = time.perf_counter()
+            if self.engine == "object":
+                self.batch_renderer.draw(screen, *particle_draw_columns(self.particles, alpha, stride), detail)
+            elif store.count:
+                self.batch_renderer.draw(screen, *store.draw_columns(alpha, stride), detail)
+            if profiler:
+                profiler.add("draw", "(batched)", time.perf_counter() - start)
+        elif self.engine == "object":
+            for particle in self.particles:
+                if profiler:
+                    start = time.perf_counter()
+                particle.draw(screen, alpha, detail)
+                if profiler:
+                    profiler.add("draw", particle.special_type, time.perf_counter() - start)
+        else:
+            store.draw(screen, profiler, alpha, detail)
+
+    def draw_boxes(self):
+        # Screen boxes of everything draw() draws, for DirtyRects
+        if self.engine == "object":
+            return particle_draw_boxes(self.particles)
+        return (self.front if self.pipelined else self.store).draw_boxes()
+
+# What ParticleSystem.evictions counts per policy
+EVICTION_KEYS = {"oldest": lambda particle: None,
+                 "lowest_life": lambda particle: particle.life,
+                 "type_quota": lambda particle: particle.special_type}
+
+class ConstellationRenderer:
+    # Draws the lines between nearby constellation stars. Pairs come from a spatial index, so the cost
+    # follows the number of links rather than N^2, and every line goes onto one persistent alpha
+    # layer that is composited onto the screen once per frame.
+    def __init__(self, link_distance=CONSTELLATION_LINK_DISTANCE):
+        self.link_distance = link_distance
+        self.index = SpatialHash(link_distance)
+        self.layer = None
+        self.dirty = None # Area of the layer drawn on last frame, the only part that needs clearing
+
+    def draw(self, screen, xs, ys, colors, life_ratios):
+        if self.layer is None or self.layer.get_size() != screen.get_size():
+            self.layer = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
+            self.dirty = None
+        if self.dirty:
+            self.layer.fill((0, 0, 0, 0), self.dirty)
+            self.dirty = None
+
+        self.index.rebuild(xs, ys)
+        first, second, _, _, dist = self.index.pairs(self.link_distance)
+        life_ratios = np.asarray(life_ratios, np.float32)
+        line_alpha = (255 * (1 - dist / self.link_distance) * life_ratios[first] * life_ratios[second]).astype(np.int32)
+        visible = line_alpha > 0
+        if not visible.any():
+            return
+        first, second, line_alpha = first[visible], second[visible], line_alpha[visible]
+        colors = np.asarray(colors, np.int32)
+        line_colors = np.minimum(255, colors[first] + colors[second]) // 2
+        line_colors = np.column_stack([line_colors, line_alpha]).tolist()
+        px = np.asarray(xs).astype(np.int32)
+        py = np.asarray(ys).astype(np.int32)
+        starts = np.column_stack([px[first], py[first]]).tolist()
+        ends = np.column_stack([px[second], py[second]]).tolist()
+
+        layer = self.layer
+        rects = [pygame.draw.line(layer, color, start, end, 1) for color, start, end in zip(line_colors, starts, ends)]
+        self.dirty = rects[0].unionall(rects[1:])
+        screen.blit(layer, self.dirty.topleft, self.dirty)
+
+# Types whose body is only a translucent glow sprite, and what the others' bodies look like without one
+GLOW_ONLY_TYPES = {"nebula", "aurora", "wave_ripple"}
+GLOW_TYPES = GLOW_ONLY_TYPES | {"firefly", "solar", "sound_visualizer"}
+BODY_SHAPES = {"firefly": "smoke", "solar": "smoke", "sound_visualizer": "smoke", "electric": "smoke"}
+ROTATION_PERIODS = {"snow": 60, "spiral": math.pi / 2, "confetti": math.pi / 2, "crystal": math.pi / 2} # Snow turns in degrees
+SPARK_COLOR = (255, 255, 100) # Electric particles' flickering sparks
+ATLAS_COLORKEY = (255, 0, 254) # Transparent in atlas sprites; bucketed colors (step >= 2) never land on it
+
+def particle_draw_columns(particles, alpha=1.0, trail_stride=1):
+    # Particle objects as the same columns ParticleStore.draw_columns returns
+    offsets, points, trail_colors, radii = [0], [], [], []
+    for p in particles:
+        # Same circles as draw_trail, flattened so NumPy can take them in one go
+        life_ratio = p.life / p.max_life
+        trail = p.trail_points()
+        count = len(trail) // 2
+        for i in range((count - 2) % trail_stride if count > 1 else 0, count - 1, trail_stride):
+            fade = (i / count) * life_ratio
+            if fade > 0:
+                points += (int(trail[2 * i]), int(trail[2 * i + 1]))
+                trail_colors += (int(p.color[0] * fade * 0.5), int(p.color[1] * fade * 0.5), int(p.color[2] * fade * 0.5))
+                radii.append(max(1, int(p.current_size * fade * 0.5)))
+        offsets.append(len(radii))
+    trails = (np.array(offsets), np.array(points, np.int32).reshape(-1, 2),
+              np.array(trail_colors, np.int32).reshape(-1, 3), np.array(radii, np.int32))
+    if alpha != 1:
+        xs = [int(p.x + (p.x - p.prev_x) * (alpha - 1)) for p in particles]
+        ys = [int(p.y + (p.y - p.prev_y) * (alpha - 1)) for p in particles]
+    else:
+        xs = [int(p.x) for p in particles]
+        ys = [int(p.y) for p in particles]
+    return ([p.special_type for p in particles], xs, ys,
+            [p.current_size for p in particles], [p.current_color for p in particles], [p.color for p in particles],
+            [p.rotation for p in particles], [p.vx for p in particles], [p.vy for p in particles],
+            [p.life > 0 for p in particles], trails)
+
+def particle_draw_boxes(particles):
+    # Particle objects' draw_boxes, like ParticleStore.draw_boxes
+    spans = []
+    for p in particles:
+        trail = p.trail # Any order will do for the bounds
+        xs, ys = trail[0::2], trail[1::2]
+        spans.append((min(p.x, p.prev_x, *xs), min(p.y, p.prev_y, *ys), max(p.x, p.prev_x, *xs),
+                      max(p.y, p.prev_y, *ys), p.current_size, p.vx, p.vy))
+    spans = np.array(spans, np.float32).reshape(-1, 7)
+    kind = np.array([TYPE_CODES[p.special_type] for p in particles], np.int16)
+    return draw_boxes(kind, *spans.T)
+
+class SpriteAtlas:
+    # Pre-rendered particle bodies and trail dots for the batched renderer, one page of sprites per type.
+    # Colors are bucketed by color_step and rotations into rotation_steps per symmetry period so the pages
+    # stay small. Once all pages together pass the memory budget they are dropped and refilled on demand.
+    def __init__(self, budget=SPRITE_ATLAS_BUDGET, color_step=4, rotation_steps=24):
+        self.budget = budget
+        self.color_step = color_step
+        self.rotation_steps = rotation_steps
+        self.pages = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+    def sprite(self, half):
+        # Colorkeyed, RLE-accelerated surfaces blit several times faster than per-pixel alpha ones
+        sprite = pygame.Surface((half * 2 + 1, half * 2 + 1))
+        sprite.fill(ATLAS_COLORKEY)
+        sprite.set_colorkey(ATLAS_COLORKEY, pygame.RLEACCEL)
+        return sprite
+
+    def add(self, page, key, sprite, half):
+        if self.bytes > self.budget:
+            for cached in self.pages.values(): # Emptied in place: callers hold on to their page
+                cached.clear()
+            self.bytes = 0
+            self.flushes += 1
+        self.misses += 1
+        self.bytes += sprite.get_width() * sprite.get_height() * 4
+        page[key] = (sprite, half)
+        return sprite, half
+
+    def dot(self, radius, rgb):
+        # Filled circle, the sprite for one trail circle or spark
+        page = self.pages.setdefault("trail", {})
+        step = self.color_step
+        key = (radius, rgb[0] // step, rgb[1] // step, rgb[2] // step)
+        entry = page.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        sprite = self.sprite(radius)
+        if radius:
+            pygame.draw.circle(sprite, (key[1] * step, key[2] * step, key[3] * step), (radius, radius), radius)
+        else:
+            sprite.fill((key[1] * step, key[2] * step, key[3] * step)) # Single pixel
+        return self.add(page, key, sprite, radius)
+
+    def dots(self, colors, radii):
+        # Sprites and half sizes for a whole array of trail circles, one lookup per distinct dot
+        if len(radii) == 0:
+            return [], radii
+        quantized = colors // self.color_step
+        keys = (radii.astype(np.int64) << 24) | (quantized[:, 0] << 16) | (quantized[:, 1] << 8) | quantized[:, 2]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sprites = np.empty(len(unique), dtype=object)
+        for j, key in enumerate(unique.tolist()):
+            sprites[j] = self.dot(key >> 24, ((key >> 16 & 255) * self.color_step, (key >> 8 & 255) * self.color_step,
+                                              (key & 255) * self.color_step))[0]
+        return sprites[inverse].tolist(), radii
+
+    def body(self, special_type, size, rgb, rotation, vx, vy):
+        # The particle's draw_particle_body output (minus glow and sparks) on a transparent sprite.
+        # Returns (sprite, half): blit it at (x - half, y - half).
+        page = self.pages.get(special_type)
+        if page is None:
+            page = self.pages[special_type] = {}
+        step = self.color_step
+        if special_type in ROTATION_PERIODS:
+            period = ROTATION_PERIODS[special_type]
+            pose = int(rotation % period / period * self.rotation_steps)
+        elif special_type == "swarm":
+            # Triangle pointing along the velocity, or a circle when nearly still
+            pose = 1 + int(math.atan2(vy, vx) % (2 * math.pi) / (2 * math.pi) * self.rotation_steps) if math.hypot(vx, vy) > 0.1 else 0
+        elif special_type == "rain":
+            pose = (round(vx * 0.5), round(vy * 0.5)) # Streak length follows the velocity
+        else:
+            pose = 0
+        key = (size, rgb[0] // step, rgb[1] // step, rgb[2] // step, pose)
+        entry = page.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        if special_type in ROTATION_PERIODS:
+            rotation = pose * ROTATION_PERIODS[special_type] / self.rotation_steps
+        elif special_type == "swarm" and pose:
+            angle = (pose - 1) * 2 * math.pi / self.rotation_steps
+            vx, vy = math.cos(angle), math.sin(angle)
+        elif special_type == "swarm":
+            vx = vy = 0
+        elif special_type == "rain":
+            vx, vy = pose[0] * 2, pose[1] * 2
+        if special_type == "spiral":
+            half = size * 2 + 3
+        elif special_type == "rain":
+            half = max(abs(pose[0]), abs(pose[1])) + 2
+        else:
+            half = size + 3
+        sprite = self.sprite(half)
+        color = (key[1] * step, key[2] * step, key[3] * step)
+        draw_particle_body(sprite, BODY_SHAPES.get(special_type, special_type), half, half, size, color, color, rotation, vx, vy)
+        return self.add(page, key, sprite, half)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "flushes": self.flushes,
+                "sprites": sum(len(page) for page in self.pages.values()), "bytes": self.bytes}
+
+class BatchRenderer:
+    # Alternative to the immediate-mode draw calls: every trail circle, body and glow becomes a
+    # (sprite, position) pair from the atlas, and the whole frame goes to the screen in one Surface.blits
+    # call, in the same order the immediate renderer draws. Colors and rotations are bucketed, so the
+    # picture is close to, not exactly, the immediate one.
+    def __init__(self, atlas=None):
+        self.atlas = atlas or SpriteAtlas()
+
+    def draw(self, screen, kinds, xs, ys, sizes, current_colors, colors, rotations, vxs, vys, alive, trails, detail=None):
+        # detail: the DrawDetail (LOD level) to draw at; trails come already sampled at its trail_stride
+        atlas = self.atlas
+        simple = detail.simple_bodies if detail else False
+        offsets, points, trail_colors, radii = trails
+        dot_sprites, halves = atlas.dots(trail_colors, radii)
+        trail_blits = list(zip(dot_sprites, (points - halves[:, None]).tolist()))
+        offsets = offsets.tolist()
+        sequence = []
+        append, extend = sequence.append, sequence.extend
+        for i, special_type in enumerate(kinds):
+            extend(trail_blits[offsets[i]:offsets[i + 1]])
+            if not alive[i]:
+                continue
+            x, y = xs[i], ys[i]
+            if detail and detail.pixel(sizes[i], current_colors[i]):
+                append((atlas.dot(0, current_colors[i])[0], (x, y)))
+                continue
+            if special_type == "electric" and not simple:
+                spark = atlas.dot(1, SPARK_COLOR)[0]
+                for _ in range(3):
+                    append((spark, (x + draw_random.randint(-3, 3) - 1, y + draw_random.randint(-3, 3) - 1)))
+            if special_type not in GLOW_ONLY_TYPES:
+                sprite, half = atlas.body(special_type, sizes[i], current_colors[i], rotations[i], vxs[i], vys[i])
+                append((sprite, (x - half, y - half)))
+            if special_type in GLOW_TYPES and not (simple and special_type in SIMPLE_BODY_TYPES):
+                rgb, alpha = glow_style(special_type, current_colors[i], colors[i])
+                if alpha > 0:
+                    sprite, half_w, half_h = glow_sprites.get(special_type, sizes[i], rgb, alpha, rotations[i])
+                    append((sprite, (x - half_w, y - half_h)))
+        screen.blits(sequence, doreturn=False)
+
+class InputRecorder:
+    # Writes everything main() feeds the simulation to a compact binary log that replay.py plays back:
+    # a HEADER, then one FRAME record per rendered frame (23 bytes). Flags hold the three mouse buttons
+    # in bits 0-2, whether the mouse was held (emitting) in bit 3 and whether particles were cleared in bit 4.
+    # Recording starts from a restarted system, so the log's seed and frames reproduce the run exactly.
+    MAGIC = b"PSIL"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBBQ") # Magic, version, engine (0 array, 1 object), seed
+    # Steps, mouse x, y, velocity x, y, flags, index into MODES, draw alpha, emission scale. The scale is a double,
+    # the value the live run emitted with: emission_count carries its fractions, so rounding it would drift.
+    FRAME = struct.Struct("<B4hBBfd")
+    ENGINES = ("array", "object")
+
+    def __init__(self, path, engine, seed):
+        self.file = open(path, "wb")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.ENGINES.index(engine), seed))
+        self.frames = 0
+
+    def record(self, steps, mouse_pos, mouse_velocity, mouse_buttons, pressed, cleared, mode, alpha, emission_scale):
+        flags = (mouse_buttons[0] | mouse_buttons[1] << 1 | mouse_buttons[2] << 2 | pressed << 3 | cleared << 4)
+        self.file.write(self.FRAME.pack(steps, mouse_pos[0], mouse_pos[1], mouse_velocity[0], mouse_velocity[1],
+                                        flags, MODES.index(mode), alpha, emission_scale))
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+def read_input_log(path):
+    # Returns (engine, seed, frames) from an InputRecorder log. Each frame is (steps, mouse_pos,
+    # mouse_velocity, mouse_buttons, pressed, cleared, mode, alpha, emission_scale).
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, engine, seed = InputRecorder.HEADER.unpack_from(data)
+    if magic != InputRecorder.MAGIC or version != InputRecorder.VERSION:
+        raise ValueError("%s is not a version %d input log" % (path, InputRecorder.VERSION))
+    frames = []
+    for steps, x, y, vx, vy, flags, mode, alpha, scale in InputRecorder.FRAME.iter_unpack(data[InputRecorder.HEADER.size:]):
+        buttons = (bool(flags & 1), bool(flags & 2), bool(flags & 4))
+        frames.append((steps, (x, y), (vx, vy), buttons, bool(flags & 8), bool(flags & 16), MODES[mode], alpha, scale))
+    return InputRecorder.ENGINES[engine], seed, frames
+
+class FixedTimestep:
+    # Turns real frame times into whole simulation steps of 1 / rate seconds, so physics runs at the same
+    # speed however long drawing takes: a slow frame gets several steps, a fast one possibly none. At most
+    # max_steps run per frame; anything beyond that is dropped. alpha is how far the leftover time reaches
+    # into the next step, for drawing particles between their last two positions.
+    def __init__(self, rate=SIM_RATE, max_steps=MAX_SUBSTEPS):
+        self.step = 1 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 1.0
+
+    def steps(self, seconds):
+        # Simulation steps to run for a frame that took seconds
+        self.accumulator += seconds
+        count = int(self.accumulator / self.step)
+        if count > self.max_steps:
+            count = self.max_steps
+            self.accumulator %= self.step # Drop the backlog, keep the fraction
+        else:
+            self.accumulator -= count * self.step
+        self.alpha = self.accumulator / self.step
+        return count
+
+class LodController:
+    # Adaptive level of detail: keeps a running average of how long each frame's work (everything but
+    # waiting for the frame cap) takes and moves one level down LOD_LEVELS when it passes high of the
+    # frame budget, one level back up when it falls under low. After a move it holds for hold frames so
+    # the average can settle at the new level. With auto off, level stays wherever it was set.
+    def __init__(self, budget=1 / FPS, high=LOD_HIGH, low=LOD_LOW, hold=LOD_HOLD, smoothing=LOD_SMOOTHING):
+        self.budget = budget
+        self.high = high
+        self.low = low
+        self.hold = hold
+        self.smoothing = smoothing
+        self.level = 0
+        self.auto = True
+        self.average = 0.0 # Seconds of work per frame
+        self.held = 0 # Frames since the level last changed
+
+    def update(self, seconds):
+        # Feed one frame's work time; returns the level to draw the next frame at
+        self.average += (seconds - self.average) * self.smoothing
+        self.held += 1
+        if self.auto and self.held >= self.hold:
+            if self.average > self.budget * self.high and self.level < len(LOD_LEVELS) - 1:
+                self.level += 1
+                self.held = 0
+            elif self.average < self.budget * self.low and self.level > 0:
+                self.level -= 1
+                self.held = 0
+        return self.level
+
+    def cycle(self):
+        # Manual selection for benchmarking: auto, then each level fixed in turn, then auto again
+        if self.auto:
+            self.auto = False
+            self.level = 0
+        elif self.level < len(LOD_LEVELS) - 1:
+            self.level += 1
+        else:
+            self.auto = True
+        self.held = 0
+
+class EmissionGovernor:
+    # Emission throttling: keeps a running average of each frame's work time, like LodController, and while
+    # the mouse is held scales the current mode's emission down by backoff every frame the average is over
+    # high of the budget, and back up by recovery every frame it is under low. Scales are kept per mode, so
+    # switching back to a heavy mode starts from where it left off. ParticleSystem.emission_count applies
+    # the scale to the mode's EMISSION_RATES count.
+    def __init__(self, budget=1 / FPS, high=EMIT_HIGH, low=EMIT_LOW, backoff=EMIT_BACKOFF, recovery=EMIT_RECOVERY,
+                 floor=EMIT_MIN_SCALE, smoothing=EMIT_SMOOTHING):
+        self.budget = budget
+        self.high = high
+        self.low = low
+        self.backoff = backoff
+        self.recovery = recovery
+        self.floor = floor
+        self.smoothing = smoothing
+        self.enabled = EMISSION_GOVERNOR
+        self.scales = {} # By mode; modes not in here emit at the full rate
+        self.average = 0.0 # Seconds of work per frame
+
+    def scale(self, mode):
+        # Fraction of the mode's EMISSION_RATES count to emit
+        return self.scales.get(mode, 1.0) if self.enabled else 1.0
+
+    def update(self, mode, seconds, emitting):
+        # Feed one frame's work time and whether mode was emitting during it
+        self.average += (seconds - self.average) * self.smoothing
+        if not emitting:
+            return
+        scale = self.scales.get(mode, 1.0)
+        if self.average > self.budget * self.high:
+            scale = max(self.floor, scale * self.backoff)
+        elif self.average < self.budget * self.low:
+            scale = min(1.0, scale + self.recovery)
+        self.scales[mode] = scale
+
+class DirtyRects:
+    # Dirty-rectangle rendering: tracks which DIRTY_TILE tiles anything was drawn on last frame, so a frame
+    # only has to clear and present the tiles drawn on then or now. begin() takes this frame's particle boxes
+    # and returns the rects to clear (black) and redraw, or None when more than coverage of the screen is
+    # dirty and a full fill and flip is cheaper. Whatever else is drawn on top (UI) goes to add().
+    # Dense scenes stay dense for a while, so after such a frame due() is False for recheck frames and
+    # the caller can skip computing boxes.
+    def __init__(self, size=(WIDTH, HEIGHT), tile=DIRTY_TILE, coverage=DIRTY_COVERAGE, recheck=DIRTY_RECHECK):
+        self.size = size
+        self.tile = tile
+        self.coverage = coverage
+        self.recheck = recheck
+        self.wait = 0 # Frames left until due()
+        self.columns = -(-size[0] // tile)
+        self.rows = -(-size[1] // tile)
+        self.drawn = np.zeros((self.rows, self.columns), bool) # Tiles drawn on since the last begin()
+        self.full = True # Next frame must be redrawn whole: nothing is known about what is on screen
+        self.dirty = 0.0 # Fraction of tiles dirty last frame
+
+    def reset(self):
+        # Forget the screen contents, e.g. after frames drawn without the tracker
+        self.full = True
+
+    def due(self):
+        # Whether this frame may be drawn with dirty rects; otherwise draw it whole and call reset()
+        if self.wait:
+            self.wait -= 1
+            return False
+        return True
+
+    def tiles(self, boxes):
+        # Tiles touched by (x0, y0, x1, y1) boxes: a 2D difference array marks each box's corners, and
+        # cumulative sums fill them in
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        width, height = self.size
+        boxes = boxes[(boxes[:, 2] >= 0) & (boxes[:, 3] >= 0) & (boxes[:, 0] < width) & (boxes[:, 1] < height)]
+        tile = self.tile
+        x0 = np.clip(boxes[:, 0] // tile, 0, self.columns - 1).astype(np.int64)
+        y0 = np.clip(boxes[:, 1] // tile, 0, self.rows - 1).astype(np.int64)
+        x1 = np.clip(boxes[:, 2] // tile, 0, self.columns - 1).astype(np.int64) + 1
+        y1 = np.clip(boxes[:, 3] // tile, 0, self.rows - 1).astype(np.int64) + 1
+        stride = self.columns + 1
+        cells = (self.rows + 1) * stride
+        corners = (np.bincount(y0 * stride + x0, minlength=cells) - np.bincount(y0 * stride + x1, minlength=cells)
+                   - np.bincount(y1 * stride + x0, minlength=cells) + np.bincount(y1 * stride + x1, minlength=cells))
+        counts = corners.reshape(self.rows + 1, stride).cumsum(axis=0).cumsum(axis=1)
+        return counts[:-1, :-1] > 0
+
+    def begin(self, boxes):
+        current = self.tiles(boxes)
+        dirty = current | self.drawn
+        self.drawn = current
+        self.dirty = dirty.mean()
+        if self.dirty > self.coverage:
+            self.wait = self.recheck
+        if self.full or self.wait:
+            self.full = False
+            return None
+        # One rect per run of dirty tiles in a row
+        edges = np.diff(np.pad(dirty, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        rows, starts = np.nonzero(edges == 1)
+        ends = np.nonzero(edges == -1)[1]
+        tile = self.tile
+        return [pygame.Rect(start * tile, row * tile, (end - start) * tile, tile)
+                for row, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist())]
+
+    def add(self, rects):
+        # Rects drawn after begin(), to be cleared next frame
+        if rects:
+            self.drawn |= self.tiles([(r.left, r.top, r.right - 1, r.bottom - 1) for r in rects])
+
+class FrameProfiler:
+    # Times every phase of a frame and, while attached to a ParticleSystem (its profiler attribute),
+    # update and draw per special_type. Keeps a rolling window of frames for the p50/p95/p99 overlay
+    # and can stream every frame to a JSON-lines file.
+    PHASES = ("events", "emit", "update", "draw", "ui", "flip")
+    REFRESH = 15 # Frames between overlay text updates; rendering text every frame would show up in "ui"
+    TOP_TYPES = 5 # Slowest types listed per phase on the overlay
+
+    def __init__(self, window=PROFILE_WINDOW):
+        self.window = window
+        self.phases = {phase: deque(maxlen=window) for phase in self.PHASES}
+        self.types = {} # (phase, type name) -> deque of per-frame seconds
+        self.frame = {}
+        self.frame_types = {}
+        self.recent_types = [] # (phase, type name) keys the last finished frame reported
+        self.frame_count = 0
+        self.last = time.perf_counter()
+        self.show = False
+        self.log = None
+        self.lines = [] # Rendered overlay text
+
+    def start_frame(self):
+        self.frame = {}
+        self.frame_types = {}
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        # Charge the time since the previous mark (or start_frame) to phase
+        now = time.perf_counter()
+        self.frame[phase] = self.frame.get(phase, 0) + now - self.last
+        self.last = now
+
+    def add(self, phase, special_type, seconds):
+        key = (phase, special_type or "default")
+        self.frame_types[key] = self.frame_types.get(key, 0) + seconds
+
+    def end_frame(self, mode=None, particles=None):
+        for phase, seconds in self.frame.items():
+            self.phases[phase].append(seconds)
+        for key, seconds in self.frame_types.items():
+            history = self.types.get(key)
+            if history is None:
+                history = self.types[key] = deque(maxlen=self.window)
+            history.append(seconds)
+        self.recent_types = list(self.frame_types)
+        if self.log:
+            record = {"frame": self.frame_count, "mode": mode, "particles": particles}
+            record.update((phase, round(seconds * 1000, 3)) for phase, seconds in self.frame.items())
+            for (phase, special_type), seconds in self.frame_types.items():
+                record.setdefault(phase + "_types", {})[special_type] = round(seconds * 1000, 3)
+            self.log.write(json.dumps(record) + "\n")
+        self.frame_count += 1
+
+    def percentiles(self, history):
+        # p50, p95 and p99 of a history in milliseconds
+        return np.percentile(np.array(history) * 1000, (50, 95, 99))
+
+    def start_log(self, path=PROFILE_LOG):
+        self.log = open(path, "a")
+
+    def stop_log(self):
+        self.log.close()
+        self.log = None
+
+    def overlay_text(self):
+        lines = ["phase      p50    p95    p99 ms"]
+        for phase in self.PHASES:
+            if self.phases[phase]:
+                lines.append("%-7s %6.2f %6.2f %6.2f" % (phase, *self.percentiles(self.phases[phase])))
+        for phase in ("update", "draw"):
+            # Only types that were around last frame, slowest p95 first
+            current = [key for key in self.recent_types if key[0] == phase]
+            ranked = sorted(((self.percentiles(self.types[key]), key[1]) for key in current), key=lambda item: -item[0][1])
+            for (p50, p95, p99), special_type in ranked[:self.TOP_TYPES]:
+                lines.append("%s %-22s %6.2f %6.2f %6.2f" % (phase[0], special_type[:22], p50, p95, p99))
+        return lines
+
+    def draw(self, screen, font):
+        if self.frame_count % self.REFRESH == 0 or not self.lines:
+            self.lines = [font.render(line, True, WHITE, BLACK) for line in self.overlay_text()]
+        y = HEIGHT - 10 - len(self.lines) * 18
+        for line in self.lines:
+            screen.blit(line, (WIDTH - line.get_width() - 10, y))
+            y += 18
 
 def main():
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -1350,6 +3562,14 @@ def main():
     clock = pygame.time.Clock()
     
     particle_system = ParticleSystem()
+    profiler = FrameProfiler()
+    timestep = FixedTimestep()
+    recorder = None # InputRecorder while F5 recording is on
+    snapshot_status = "" # Outcome of the last F6 save or F7 load, shown under the particle count
+    dirty_rendering = DIRTY_RECTS
+    dirty_rects = DirtyRects()
+    lod = LodController()
+    governor = EmissionGovernor()
     running = True
     mouse_pressed = False
     prev_mouse_pos = (0, 0)
@@ -1359,9 +3579,13 @@ def main():
     # Instructions
     font = pygame.font.Font(None, 36)
     small_font = pygame.font.Font(None, 24)
+    mono_font = pygame.font.SysFont("monospace", 14) # Profiler overlay columns
     
     while running:
-        dt = clock.tick(FPS)
+        dt = clock.tick(FPS) / 1000
+        frame_start = time.perf_counter() # Work from here to the end of the frame is what LOD and emission budget for
+        profiler.start_frame()
+        cleared = False
         
         # Handle events
         for event in pygame.event.get():
@@ -1443,12 +3667,63 @@ def main():
                 elif event.key == pygame.K_RIGHTBRACKET: # Corrected: Geyser
                     particle_system.mode = "geyser"
                 elif event.key == pygame.K_v: # Clear particles
-                    particle_system.particles.clear()
+                    particle_system.clear()
+                    cleared = True
+                elif event.key == pygame.K_F1: # Switch between the immediate and batched renderers
+                    particle_system.renderer = "batched" if particle_system.renderer == "immediate" else "immediate"
+                elif event.key == pygame.K_F2: # Toggle the profiler overlay
+                    profiler.show = not profiler.show
+                elif event.key == pygame.K_F3: # Start/stop streaming frame metrics to PROFILE_LOG
+                    if profiler.log:
+                        profiler.stop_log()
+                    else:
+                        profiler.start_log()
+                elif event.key == pygame.K_F4: # Update on a background thread while drawing (array engine)
+                    particle_system.pipelined = not particle_system.pipelined and particle_system.engine != "object"
+                elif event.key == pygame.K_F5: # Start/stop recording input to INPUT_LOG, from a fresh seeded system
+                    if recorder:
+                        recorder.close()
+                        recorder = None
+                    else:
+                        particle_system.restart()
+                        recorder = InputRecorder(INPUT_LOG, particle_system.engine, particle_system.seed)
+                elif event.key == pygame.K_F6: # Save the simulation state to SNAPSHOT
+                    particle_system.save(SNAPSHOT)
+                    snapshot_status = f"Saved {particle_system.particle_count()}"
+                elif event.key == pygame.K_F7: # Restore the simulation state from SNAPSHOT
+                    if recorder: # The log could no longer reproduce the run
+                        recorder.close()
+                        recorder = None
+                    try:
+                        particle_system.load(SNAPSHOT)
+                        snapshot_status = f"Loaded {particle_system.particle_count()}"
+                    except (OSError, ValueError):
+                        snapshot_status = "Failed"
+                elif event.key == pygame.K_F8: # Toggle dirty-rect rendering
+                    dirty_rendering = not dirty_rendering
+                elif event.key == pygame.K_F9: # Level of detail: auto, then each level by hand
+                    lod.cycle()
+                    particle_system.lod = lod.level
+                elif event.key == pygame.K_F10: # Toggle the emission governor
+                    governor.enabled = not governor.enabled
+                elif event.key in (pygame.K_F11, pygame.K_F12): # Place an emitter of the mode at the mouse / remove all
+                    if recorder: # Emitters aren't in the log, so it could no longer reproduce the run
+                        recorder.close()
+                        recorder = None
+                    if event.key == pygame.K_F11:
+                        x, y = pygame.mouse.get_pos()
+                        particle_system.add_emitter(Emitter(particle_system.mode, x, y))
+                    else:
+                        particle_system.clear_emitters()
+                # Per-type timing costs a little, so only collect it while someone is looking
+                particle_system.profiler = profiler if profiler.show or profiler.log else None
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 mouse_pressed = True
             elif event.type == pygame.MOUSEBUTTONUP:
                 mouse_pressed = False
                 
+        profiler.mark("events")
+
         # Mouse interaction
         mouse_pos = pygame.mouse.get_pos()
         mouse_buttons = pygame.mouse.get_pressed() # Get state of all mouse buttons (left, middle, right)
@@ -1456,105 +3731,45 @@ def main():
                          mouse_pos[1] - prev_mouse_pos[1])
         prev_mouse_pos = mouse_pos
         
-        if mouse_pressed:
-            if particle_system.mode == "fountain":
-                particle_system.create_fountain(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "fireworks":
-                if random.random() < 0.1:
-                    particle_system.create_firework(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "paint":
-                particle_system.create_paint_splash(mouse_pos[0], mouse_pos[1], mouse_velocity)
-            elif particle_system.mode == "electric":
-                particle_system.create_electric_storm(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "bubbles":
-                particle_system.create_bubbles(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "snow":
-                particle_system.create_snow(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "spiral":
-                particle_system.create_spiral(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "galaxy":
-                if random.random() < 0.3:
-                    particle_system.create_galaxy(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "tornado":
-                particle_system.create_tornado(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "rain":
-                particle_system.create_rain(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "smoke":
-                particle_system.create_smoke(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "confetti":
-                particle_system.create_confetti(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "attractor":
-                particle_system.create_attractor(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "blackhole":
-                particle_system.create_blackhole(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "fluid":
-                particle_system.create_fluid(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "crystal":
-                particle_system.create_crystal(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "lightning":
-                if random.random() < 0.2:
-                    particle_system.create_lightning(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "lava":
-                particle_system.create_lava(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "firefly":
-                if random.random() < 0.1:
-                    particle_system.create_firefly(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "nebula":
-                if random.random() < 0.05:
-                    particle_system.create_nebula(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "solar":
-                particle_system.create_solar(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "vortex":
-                particle_system.create_vortex(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "aurora":
-                if random.random() < 0.05:
-                    particle_system.create_aurora(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "geyser":
-                particle_system.create_geyser(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "swarm":
-                particle_system.create_swarm(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "gravity_field":
-                particle_system.create_gravity_field(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "flowing_stream":
-                particle_system.create_flowing_stream(mouse_pos[0], mouse_pos[1], mouse_velocity)
-            elif particle_system.mode == "bouncing_collision":
-                particle_system.create_bouncing_collision(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "explosion_implosion":
-                if mouse_buttons[0]: # Left click for explosion
-                    particle_system.create_explosion_implosion(mouse_pos[0], mouse_pos[1], False)
-                elif mouse_buttons[2]: # Right click for implosion
-                    particle_system.create_explosion_implosion(mouse_pos[0], mouse_pos[1], True)
-            elif particle_system.mode == "wave_ripple":
-                particle_system.create_wave_ripple(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "path_follower":
-                particle_system.create_path_follower(mouse_pos[0], mouse_pos[1], mouse_velocity)
-            elif particle_system.mode == "spring_attraction":
-                particle_system.create_spring_attraction(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "pixel_painter":
-                particle_system.create_pixel_painter(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "chain_reaction":
-                particle_system.create_chain_reaction(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "light_tracer": # New mode
-                particle_system.create_light_tracer(mouse_pos[0], mouse_pos[1], mouse_velocity)
-            elif particle_system.mode == "sound_visualizer": # New mode
-                particle_system.create_sound_visualizer(mouse_pos[0], mouse_pos[1])
-            elif particle_system.mode == "constellation": # New mode
-                particle_system.create_constellation(mouse_pos[0], mouse_pos[1])
-
-        # Update
-        particle_system.update(mouse_pos, mouse_buttons) 
+        # Emit and update in fixed simulation steps, as many as the time since the last frame calls for
+        steps = timestep.steps(dt)
+        particle_system.emission_scale = governor.scale(particle_system.mode)
+        if recorder:
+            recorder.record(steps, mouse_pos, mouse_velocity, mouse_buttons, mouse_pressed, cleared,
+                            particle_system.mode, timestep.alpha, particle_system.emission_scale)
+        if particle_system.pipelined:
+            particle_system.start_update(steps, mouse_pos, mouse_velocity, mouse_buttons, mouse_pressed)
+        else:
+            for _ in range(steps):
+                if mouse_pressed:
+                    particle_system.create_for_mode(mouse_pos[0], mouse_pos[1], mouse_velocity, mouse_buttons)
+                profiler.mark("emit")
+                particle_system.update(mouse_pos, mouse_buttons)
+                profiler.mark("update")
         
-        # Draw
-        screen.fill(BLACK)
-        particle_system.draw(screen)
+        # Draw: everything, or with dirty rects just what was drawn on last frame or will be now.
+        # The profiler overlay is not tracked, so it always gets whole frames.
+        redraw = None
+        if dirty_rendering and not profiler.show and dirty_rects.due():
+            redraw = dirty_rects.begin(particle_system.draw_boxes())
+        else:
+            dirty_rects.reset()
+        if redraw is None:
+            screen.fill(BLACK)
+        else:
+            for rect in redraw:
+                screen.fill(BLACK, rect)
+        particle_system.draw(screen, timestep.alpha)
+        profiler.mark("draw")
         
         # Draw UI (only if show_menu is True)
+        ui_rects = []
         if show_menu:
             title = font.render("Interactive Particle Physics Sandbox", True, WHITE)
-            screen.blit(title, (10, 10))
+            ui_rects.append(screen.blit(title, (10, 10)))
             
             mode_text = small_font.render(f"Mode: {particle_system.mode.title()}", True, WHITE)
-            screen.blit(mode_text, (10, 50))
+            ui_rects.append(screen.blit(mode_text, (10, 50)))
             
             instructions = [
                 "Hold mouse to create particles",
@@ -1572,19 +3787,64 @@ def main():
                 "U: Wave/Ripple I: Path Follower",
                 "Z: Spring Attraction X: Pixel Painter C: Chain Reaction",
                 "B: Light Tracer [: Aurora    ]: Geyser", # Instructions
-                "V: Clear particles"
+                "V: Clear particles  F1: Immediate/Batched renderer",
+                "F2: Profiler overlay  F3: Stream metrics to " + PROFILE_LOG,
+                "F4: Pipelined update (background thread)  F5: Record input to " + INPUT_LOG,
+                "F6: Save snapshot to " + SNAPSHOT + "  F7: Load it  F8: Dirty-rect rendering",
+                "F9: Level of detail (auto / fixed)  F10: Emission governor",
+                "F11: Emitter of this mode at the mouse  F12: Remove emitters"
             ]
             
             # Adjust instruction display to fit more lines
             for i, instruction in enumerate(instructions):
                 text = small_font.render(instruction, True, WHITE)
-                screen.blit(text, (10, 80 + i * 25))
-            
-            particle_count = small_font.render(f"Particles: {len(particle_system.particles)}", True, WHITE)
-            screen.blit(particle_count, (WIDTH - 150, 10))
+                ui_rects.append(screen.blit(text, (10, 80 + i * 25)))
+            
+            particle_count = small_font.render(f"Particles: {particle_system.particle_count()}", True, WHITE)
+            ui_rects.append(screen.blit(particle_count, (WIDTH - 150, 10)))
+            renderer_text = small_font.render(f"Renderer: {particle_system.renderer.title()}", True, WHITE)
+            ui_rects.append(screen.blit(renderer_text, (WIDTH - 150, 35)))
+            recycled_text = small_font.render(f"Recycled: {particle_system.pool.reused_per_second():.0f}/s", True, WHITE)
+            ui_rects.append(screen.blit(recycled_text, (WIDTH - 150, 60)))
+            update_text = small_font.render("Update: " + ("Pipelined" if particle_system.pipelined else "Serial"), True, WHITE)
+            ui_rects.append(screen.blit(update_text, (WIDTH - 150, 85)))
+            if recorder:
+                recording_text = small_font.render(f"Recording: {recorder.frames}", True, (255, 80, 80))
+                ui_rects.append(screen.blit(recording_text, (WIDTH - 150, 110)))
+            if snapshot_status:
+                snapshot_text = small_font.render(f"Snapshot: {snapshot_status}", True, WHITE)
+                ui_rects.append(screen.blit(snapshot_text, (WIDTH - 150, 135)))
+            lod_text = small_font.render(f"LOD: {LOD_LEVELS[lod.level].name}" + (" auto" if lod.auto else ""), True, WHITE)
+            ui_rects.append(screen.blit(lod_text, (WIDTH - 150, 160)))
+            emission = f"{particle_system.emission_scale:.0%}" if governor.enabled else "Off"
+            emission_text = small_font.render(f"Emission: {emission}", True, WHITE)
+            ui_rects.append(screen.blit(emission_text, (WIDTH - 150, 185)))
+            if particle_system.emitters:
+                emitters_text = small_font.render(f"Emitters: {len(particle_system.emitters)}", True, WHITE)
+                ui_rects.append(screen.blit(emitters_text, (WIDTH - 150, 210)))
         
-        pygame.display.flip()
+        if profiler.show:
+            profiler.draw(screen, mono_font)
+        profiler.mark("ui")
+        
+        if redraw is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(redraw + ui_rects)
+        dirty_rects.add(ui_rects)
+        profiler.mark("flip")
+        particle_system.finish_update() # Pipelined mode: the background update must be done before the next frame
+        profiler.mark("update") # Time spent waiting for it
+        frame_work = time.perf_counter() - frame_start
+        particle_system.lod = lod.update(frame_work)
+        governor.update(particle_system.mode, frame_work, mouse_pressed or bool(particle_system.emitters))
+        profiler.end_frame(particle_system.mode, particle_system.particle_count())
     
+    if profiler.log:
+        profiler.stop_log()
+    if recorder:
+        recorder.close()
+    particle_system.close()
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,413 @@
+# Headless benchmark: drives ParticleSystem with a scripted mouse for every mode, at fixed population
+# levels, and records update and draw time (per frame and per particle), particle count and memory allocated per frame.
+#   python benchmark.py --engines array object --populations 500 2000 --output results.json
+#   python benchmark.py --output new.csv --compare results.json   (exit code 1 on a regression)
+#   python benchmark.py --memory   (bytes per Particle object and GC pauses under spawn churn)
+#   python benchmark.py --scaling --workers 0 4 16   (array-engine update time at 100k particles per worker count)
+#   python benchmark.py --pipeline   (whole-frame time, serial versus update on a background thread)
+#   python benchmark.py --lods 0 1 2 3   (draw time at each level of detail in LOD_LEVELS)
+#   python benchmark.py --spawn --engines array object   (time per create_batch call, nominal and burst sizes)
+#   python benchmark.py --emitters 48 --modes fountain geyser galaxy   (a scene of persistent emitters per mode)
+import argparse
+import csv
+import gc
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import Particlesim as sim
+
+FRAMES = 120 # Measured frames per run
+WARMUP_FRAMES = 300 # Most frames spent growing the population before measuring starts
+TRACE_FRAMES = 10 # Extra frames run under tracemalloc, which is too slow to leave on while timing
+POPULATIONS = [500, 2000]
+TOLERANCE = 0.25 # Fractional slowdown --compare reports as a regression
+CHURN_MODES = ["lightning", "lava", "chain_reaction", "fountain"] # Constant spawning and dying
+SCALING_MODES = ["fountain", "rain", "snow"] # No particle interaction
+SCALING_POPULATION = 100000
+SPAWN_BURST = 1000 # Particles per create_batch call in the --spawn burst column
+SPAWN_REPEATS = 20 # Calls per measurement; the fastest counts
+EMITTER_WARMUP = 60 # Steps an --emitters scene runs before it is timed
+FIELDS = ["mode", "engine", "renderer", "lod", "population", "particles", "update_ms", "draw_ms", "update_us_per_particle",
+          "draw_us_per_particle", "alloc_kb"]
+
+def mouse_path(frame):
+    # Figure eight across the screen, so attractors and trails always have somewhere to go
+    angle = frame * 0.03
+    return (int(sim.WIDTH / 2 + math.sin(angle) * sim.WIDTH * 0.35),
+            int(sim.HEIGHT / 2 + math.sin(angle * 2) * sim.HEIGHT * 0.3))
+
+def mouse_buttons(frame):
+    # Left button held throughout; the right button is pressed every other second (repel, implosion)
+    return (True, False, frame // sim.FPS % 2 == 1)
+
+class Run:
+    # One mode on one engine and renderer, emitting whenever the population is under its target
+    def __init__(self, mode, engine, renderer, population, seed, workers=0, lod=0):
+        self.system = sim.ParticleSystem(engine=engine, workers=workers, max_particles=max(population, sim.MAX_PARTICLES),
+                                         seed=seed)
+        sim.draw_random.seed(seed)
+        self.system.mode = mode
+        self.system.renderer = renderer
+        self.system.lod = lod
+        self.population = population
+        self.screen = pygame.display.get_surface()
+        self.frame = 0
+        self.prev_pos = mouse_path(0)
+
+    def step(self):
+        # Returns (update seconds, draw seconds); emission counts as update, like in main()
+        system = self.system
+        mouse_pos = mouse_path(self.frame)
+        buttons = mouse_buttons(self.frame)
+        mouse_vel = (mouse_pos[0] - self.prev_pos[0], mouse_pos[1] - self.prev_pos[1])
+        self.prev_pos = mouse_pos
+        self.frame += 1
+
+        start = time.perf_counter()
+        if system.particle_count() < self.population:
+            system.create_for_mode(mouse_pos[0], mouse_pos[1], mouse_vel, buttons)
+        system.update(mouse_pos, buttons)
+        updated = time.perf_counter()
+        self.screen.fill(sim.BLACK)
+        system.draw(self.screen)
+        drawn = time.perf_counter()
+        return updated - start, drawn - updated
+
+    def whole_frame(self):
+        # One whole frame the way main() runs it, display flip included; returns seconds
+        system = self.system
+        mouse_pos = mouse_path(self.frame)
+        buttons = mouse_buttons(self.frame)
+        mouse_vel = (mouse_pos[0] - self.prev_pos[0], mouse_pos[1] - self.prev_pos[1])
+        self.prev_pos = mouse_pos
+        self.frame += 1
+        emit = system.particle_count() < self.population
+
+        start = time.perf_counter()
+        if system.pipelined:
+            system.start_update(1, mouse_pos, mouse_vel, buttons, emit)
+        else:
+            system.simulate(1, mouse_pos, mouse_vel, buttons, emit)
+        self.screen.fill(sim.BLACK)
+        system.draw(self.screen)
+        pygame.display.flip()
+        system.finish_update()
+        return time.perf_counter() - start
+
+    def warm_up(self, frames):
+        for _ in range(frames):
+            if self.system.particle_count() >= self.population:
+                break
+            self.step()
+
+    def fill(self):
+        # Emit at the current mouse position until the population is back up to its target
+        system = self.system
+        mouse_pos = mouse_path(self.frame)
+        while system.particle_count() < self.population:
+            system.create_for_mode(mouse_pos[0], mouse_pos[1], (0, 0), mouse_buttons(self.frame))
+
+def run(mode, engine, renderer, population, frames=FRAMES, seed=0, lod=0):
+    bench = Run(mode, engine, renderer, population, seed, lod=lod)
+    bench.warm_up(WARMUP_FRAMES)
+    update_times, draw_times, counts = [], [], []
+    for _ in range(frames):
+        update_time, draw_time = bench.step()
+        update_times.append(update_time)
+        draw_times.append(draw_time)
+        counts.append(bench.system.particle_count())
+
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(TRACE_FRAMES):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        bench.step()
+        allocated += tracemalloc.get_traced_memory()[1] - before # Peak growth during the frame
+    tracemalloc.stop()
+
+    return {"mode": mode, "engine": engine, "renderer": renderer, "lod": lod, "population": population,
+            "particles": round(float(np.mean(counts)), 1),
+            "update_ms": round(float(np.mean(update_times)) * 1000, 3),
+            "draw_ms": round(float(np.mean(draw_times)) * 1000, 3),
+            "update_us_per_particle": round(float(np.sum(update_times) / max(1, np.sum(counts))) * 1e6, 3),
+            "draw_us_per_particle": round(float(np.sum(draw_times) / max(1, np.sum(counts))) * 1e6, 3),
+            "alloc_kb": round(allocated / TRACE_FRAMES / 1024, 1)}
+
+def particle_bytes(special_type, count=1000, frames=20):
+    # Average traced bytes per object-engine Particle, including its trail and per-type state,
+    # after enough updates for a typical trail to fill up (spawned children are dropped)
+    random.seed(0)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    pool = sim.ParticlePool()
+    particles = [pool.acquire(100, 100, 1, 1, (200, 100, 50), 4, special_type) for _ in range(count)]
+    for _ in range(frames):
+        for particle in particles:
+            particle.update((sim.WIDTH // 2, sim.HEIGHT // 2), (True, False, False))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del particles
+    return used / count
+
+def gc_pauses(mode, frames=FRAMES, population=POPULATIONS[-1], seed=0):
+    # Garbage collections and their pause times while the object engine runs a mode, plus how many
+    # spawns the particle pool recycled versus allocated
+    pauses = []
+    started = []
+    def timer(phase, info):
+        if phase == "start":
+            started.append(time.perf_counter())
+        else:
+            pauses.append(time.perf_counter() - started.pop())
+    bench = Run(mode, "object", "immediate", population, seed)
+    pool = bench.system.pool
+    reused, allocated = pool.reused, pool.allocated
+    gc.collect()
+    gc.callbacks.append(timer)
+    try:
+        for _ in range(frames):
+            bench.step()
+    finally:
+        gc.callbacks.remove(timer)
+    return (len(pauses), sum(pauses) * 1000, max(pauses, default=0) * 1000,
+            pool.reused - reused, pool.allocated - allocated)
+
+def memory_report(frames):
+    sizes = [particle_bytes(special_type) for special_type in sim.PARTICLE_TYPES]
+    for special_type, size in zip(sim.PARTICLE_TYPES, sizes):
+        print("%-20s %7.0f bytes per particle" % (special_type or "default", size))
+    print("%-20s %7.0f bytes per particle" % ("mean", np.mean(sizes)))
+    print("%-20s %11s %9s %9s %9s %9s" % ("gc pauses", "collections", "total ms", "max ms", "reused", "allocated"))
+    for mode in CHURN_MODES:
+        print("%-20s %11d %9.2f %9.3f %9d %9d" % ((mode,) + gc_pauses(mode, frames)))
+
+def scaling_report(modes, population, workers, frames):
+    # Array-engine update time with the population topped up (untimed) every frame, per worker count
+    print("%-20s %7s %9s %9s" % ("mode", "workers", "update ms", "speedup"))
+    for mode in modes:
+        serial = None
+        for count in workers:
+            bench = Run(mode, "array", "immediate", population, 0, count)
+            times = []
+            for _ in range(frames):
+                bench.fill()
+                mouse_pos = mouse_path(bench.frame)
+                start = time.perf_counter()
+                bench.system.update(mouse_pos, mouse_buttons(bench.frame))
+                times.append(time.perf_counter() - start)
+                bench.frame += 1
+            bench.system.close()
+            update_ms = float(np.mean(times[frames // 10:])) * 1000 # Skip the first frames (pool start-up)
+            serial = serial or update_ms
+            print("%-20s %7d %9.2f %8.2fx" % (mode, count, update_ms, serial / update_ms))
+
+def pipeline_report(modes, population, renderers, frames):
+    # Whole-frame time with the update run serially versus pipelined on a background thread
+    print("%-20s %-9s %9s %9s %9s" % ("mode", "renderer", "serial ms", "pipe ms", "speedup"))
+    for mode in modes:
+        for renderer in renderers:
+            frame_ms = []
+            for pipelined in (False, True):
+                bench = Run(mode, "array", renderer, population, 0)
+                bench.system.pipelined = pipelined
+                bench.warm_up(WARMUP_FRAMES)
+                frame_ms.append(float(np.mean([bench.whole_frame() for _ in range(frames)])) * 1000)
+                bench.system.close()
+            print("%-20s %-9s %9.2f %9.2f %8.2fx" % (mode, renderer, frame_ms[0], frame_ms[1], frame_ms[0] / frame_ms[1]))
+
+def spawn_report(modes, engines, burst=SPAWN_BURST, repeats=SPAWN_REPEATS):
+    # Time of one create_batch call per mode, at the mode's EMISSION_RATES count and at burst particles
+    print("%-20s %-7s %10s %10s %12s" % ("mode", "engine", "nominal us", "burst us", "burst ns/pt"))
+    for mode in modes:
+        for engine in engines:
+            system = sim.ParticleSystem(engine=engine, max_particles=burst, seed=0)
+            times = []
+            for count in (sim.EMISSION_RATES[mode], burst):
+                best = math.inf
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    system.create_batch(mode, sim.WIDTH // 2, sim.HEIGHT // 2, count)
+                    best = min(best, time.perf_counter() - start)
+                    system.clear()
+                times.append(best)
+            system.close()
+            print("%-20s %-7s %10.1f %10.1f %12.1f" % (mode, engine, times[0] * 1e6, times[1] * 1e6, times[1] / burst * 1e9))
+
+def emitter_scene(system, mode, emitters):
+    # emitters emitters of mode on a grid over the screen
+    columns = math.ceil(math.sqrt(emitters))
+    rows = math.ceil(emitters / columns)
+    for i in range(emitters):
+        system.add_emitter(sim.Emitter(mode, (i % columns + 0.5) * sim.WIDTH / columns,
+                                       (i // columns + 0.5) * sim.HEIGHT / rows))
+
+def emitter_report(modes, engines, emitters, frames):
+    # Per-step cost of a scene of persistent emitters: the spawn, batched into one create_batch per mode by
+    # tick_emitters, against one create_batch call per emitter, and the whole update that ticks them
+    print("%-20s %-7s %8s %9s %12s %13s %10s" % ("mode", "engine", "emitters", "particles", "batched us",
+                                                 "per-emitter us", "update ms"))
+    for mode in modes:
+        for engine in engines:
+            system = sim.ParticleSystem(engine=engine, seed=0)
+            emitter_scene(system, mode, emitters)
+            for _ in range(EMITTER_WARMUP):
+                system.update()
+            batched = separate = updates = 0
+            chance = sim.EMISSION_CHANCES.get(mode)
+            for _ in range(frames):
+                # The step's spawn twice, rewound after each: one create_batch per emitter, gated like
+                # tick_emitters, then tick_emitters itself, which spawns the same particles batched.
+                # The update after that ticks the emitters for real.
+                state = [(emitter.age, emitter.credit) for emitter in system.emitters]
+                rng_state = system.spawn_rng.bit_generator.state
+                count = system.particle_count()
+                def rewind():
+                    for emitter, (age, credit) in zip(system.emitters, state):
+                        emitter.age, emitter.credit = age, credit
+                    system.spawn_rng.bit_generator.state = rng_state
+                    if engine == "object":
+                        system.pool.release(system.particles[count:])
+                        del system.particles[count:]
+                    else:
+                        system.store.count = count
+                scale = system.emission_factor()
+                start = time.perf_counter()
+                for emitter in system.emitters:
+                    emitting = chance is None or system.spawn_rng.random() < chance
+                    system.create_batch(mode, emitter.x, emitter.y, emitter.step(scale, emitting), emitter.velocity,
+                                        emitter.buttons)
+                separate += time.perf_counter() - start
+                rewind()
+                start = time.perf_counter()
+                system.tick_emitters()
+                batched += time.perf_counter() - start
+                rewind()
+                start = time.perf_counter()
+                system.update()
+                updates += time.perf_counter() - start
+            print("%-20s %-7s %8d %9d %12.1f %13.1f %10.2f" % (mode, engine, emitters, system.particle_count(),
+                                                             batched / frames * 1e6, separate / frames * 1e6,
+                                                             updates / frames * 1000))
+            system.close()
+
+def write_results(results, path):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=1)
+
+def read_results(path):
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            return [{name: value if name in ("mode", "engine", "renderer") else float(value)
+                     for name, value in row.items()} for row in csv.DictReader(f)]
+    with open(path) as f:
+        return json.load(f)
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    # Runs that got slower than the baseline run with the same mode, engine, renderer, LOD and population
+    key = lambda row: (row["mode"], row["engine"], row["renderer"], int(row.get("lod", 0)), int(row["population"]))
+    previous = {key(row): row for row in baseline}
+    found = []
+    for row in results:
+        old = previous.get(key(row))
+        if old is None:
+            continue
+        for field in ("update_ms", "draw_ms"):
+            # Ignore sub-0.1 ms noise on nearly empty runs
+            if row[field] > old[field] * (1 + tolerance) and row[field] - old[field] > 0.1:
+                found.append("%s %s/%s @%d %s %.2f -> %.2f ms" % (row["mode"], row["engine"], row["renderer"],
+                                                                 row["population"], field, old[field], row[field]))
+    return found
+
+def engine_summary(results):
+    # Total update + draw time per engine, renderer and LOD over the runs they share
+    totals = {}
+    for row in results:
+        name = "%s/%s" % (row["engine"], row["renderer"]) + ("/lod %d" % row["lod"] if row["lod"] else "")
+        totals[name] = totals.get(name, 0) + row["update_ms"] + row["draw_ms"]
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless particle benchmark")
+    parser.add_argument("--modes", nargs="+", default=sim.MODES, choices=sim.MODES, metavar="MODE")
+    parser.add_argument("--engines", nargs="+", default=[sim.ENGINE], choices=["array", "object"])
+    parser.add_argument("--renderers", nargs="+", default=[sim.RENDERER], choices=["immediate", "batched"])
+    parser.add_argument("--lods", nargs="+", type=int, default=[0], choices=range(len(sim.LOD_LEVELS)),
+                        help="levels of detail to draw at (indexes into LOD_LEVELS)")
+    parser.add_argument("--populations", nargs="+", type=int, default=POPULATIONS)
+    parser.add_argument("--frames", type=int, default=FRAMES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this .json or .csv file")
+    parser.add_argument("--compare", help="earlier .json or .csv results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--memory", action="store_true", help="report Particle memory and GC pauses instead")
+    parser.add_argument("--scaling", action="store_true", help="report parallel update scaling instead")
+    parser.add_argument("--pipeline", action="store_true", help="compare serial and pipelined frame times instead")
+    parser.add_argument("--spawn", action="store_true", help="time batched emission per mode instead")
+    parser.add_argument("--emitters", type=int, help="time a scene of this many persistent emitters per mode instead")
+    parser.add_argument("--workers", nargs="+", type=int, default=[0, 2, 4, os.cpu_count()],
+                        help="worker process counts for --scaling (0 updates in this process)")
+    args = parser.parse_args(argv)
+
+    pygame.display.set_mode((sim.WIDTH, sim.HEIGHT))
+    if args.memory:
+        memory_report(args.frames)
+        return 0
+    if args.spawn:
+        spawn_report(args.modes, args.engines)
+        return 0
+    if args.emitters:
+        emitter_report(args.modes, args.engines, args.emitters, args.frames)
+        return 0
+    if args.pipeline:
+        for population in args.populations:
+            pipeline_report(args.modes, population, args.renderers, args.frames)
+        return 0
+    if args.scaling:
+        modes = args.modes if args.modes != sim.MODES else SCALING_MODES
+        populations = args.populations if args.populations != POPULATIONS else [SCALING_POPULATION]
+        for population in populations:
+            scaling_report(modes, population, sorted(set(args.workers)), args.frames)
+        return 0
+    results = []
+    print("%-20s %-7s %-9s %3s %6s %9s %9s %9s %9s %9s %9s" % ("mode", "engine", "renderer", "lod", "popul.", "particles",
+                                                              "update ms", "draw ms", "update us", "draw us", "alloc kb"))
+    for population in args.populations:
+        for mode in args.modes:
+            for engine in args.engines:
+                for renderer in args.renderers:
+                    for lod in args.lods:
+                        row = run(mode, engine, renderer, population, args.frames, args.seed, lod)
+                        results.append(row)
+                        print("%-20s %-7s %-9s %3d %6d %9.1f %9.3f %9.3f %9.3f %9.3f %9.1f"
+                              % tuple(row[name] for name in FIELDS))
+    for name, total in engine_summary(results).items():
+        print("%-20s %.1f ms per frame summed over all runs" % (name, total))
+
+    if args.output:
+        write_results(results, args.output)
+    if args.compare:
+        found = regressions(results, read_results(args.compare), args.tolerance)
+        for line in found:
+            print("REGRESSION", line)
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
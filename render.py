@@ -0,0 +1,199 @@
+# Offline, headless rendering of a particle sequence to numbered PNGs or, through an encoder subprocess
+# (ffmpeg by default), to a video file. Input is either a scripted mouse path in one mode or a log recorded
+# with F5 in the sandbox. Time is counted in frames, not measured: every output frame advances the
+# simulation by exactly SIM_RATE / fps steps, however long it takes to render.
+# Frames go through a bounded queue to worker threads, so encoding overlaps with simulating and drawing
+# and at most QUEUE_FRAMES frames are held in memory.
+#   python render.py frames/ --mode galaxy --seconds 10 --size 1920x1080 --fps 30
+#   python render.py out.mp4 --log input_log.bin --fps 60
+import argparse
+import math
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import Particlesim as sim
+
+QUEUE_FRAMES = 8 # Rendered frames waiting for a writer, at most
+PNG_THREADS = 4 # Threads compressing PNGs; an encoder subprocess gets one thread feeding its stdin
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".webm", ".avi", ".gif")
+
+def scripted_input(mode, seconds, seed):
+    # Per-step input for one mode: the mouse sweeps a figure eight with the left button held.
+    # Yields (mouse_pos, mouse_velocity, mouse_buttons, emit, cleared, mode, emission scale) for every
+    # simulation step; offline there is no frame budget, so emission always runs at the full rate.
+    prev_pos = None
+    for step in range(int(seconds * sim.SIM_RATE)):
+        angle = step * 0.02 + seed
+        mouse_pos = (int(sim.WIDTH / 2 + math.sin(angle) * sim.WIDTH * 0.3),
+                     int(sim.HEIGHT / 2 + math.sin(angle * 2) * sim.HEIGHT * 0.25))
+        prev_pos = prev_pos or mouse_pos
+        yield (mouse_pos, (mouse_pos[0] - prev_pos[0], mouse_pos[1] - prev_pos[1]), (True, False, False), True, False,
+               mode, 1.0)
+        prev_pos = mouse_pos
+
+def logged_input(frames):
+    # Per-step input from read_input_log frames, so the log plays back at any output frame rate. A clear
+    # recorded on a frame that ran no steps is carried to the next step. The recorded emission scale is
+    # kept, so the particles match the recorded run's.
+    cleared = False
+    for steps, mouse_pos, mouse_velocity, mouse_buttons, pressed, frame_cleared, mode, _, emission_scale in frames:
+        cleared = cleared or frame_cleared
+        for _ in range(steps):
+            yield mouse_pos, mouse_velocity, mouse_buttons, pressed, cleared, mode, emission_scale
+            cleared = False
+
+class FrameWriter:
+    # Hands frames to worker threads through a bounded queue; put() blocks while the queue is full, which
+    # keeps the simulation from running ahead of the writers. write(number, data) is called on a worker.
+    # A worker that fails keeps draining the queue so put() never blocks on it, and the error is re-raised
+    # from the next put() or close().
+    def __init__(self, write, threads=1, size=QUEUE_FRAMES):
+        self.write = write
+        self.frames = queue.Queue(size)
+        self.error = None
+        self.wait_time = 0 # Seconds put() spent blocked on a full queue
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def work(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.write(*item)
+                except Exception as error:
+                    self.error = error
+
+    def put(self, number, data):
+        if self.error:
+            raise self.error
+        start = time.perf_counter()
+        self.frames.put((number, data))
+        self.wait_time += time.perf_counter() - start
+
+    def close(self):
+        for _ in self.threads:
+            self.frames.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error:
+            raise self.error
+
+def png_writer(directory, size):
+    os.makedirs(directory, exist_ok=True)
+    def write(number, data):
+        pygame.image.save(pygame.image.frombytes(data, size, "RGB"), os.path.join(directory, "frame_%06d.png" % number))
+    return FrameWriter(write, PNG_THREADS)
+
+class EncoderWriter(FrameWriter):
+    # Raw RGB frames into an encoder subprocess's stdin, in order, from a single thread
+    def __init__(self, path, size, fps, ffmpeg="ffmpeg"):
+        self.ffmpeg = ffmpeg
+        command = [ffmpeg, "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "%dx%d" % size,
+                   "-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p", path]
+        self.encoder = subprocess.Popen(command, stdin=subprocess.PIPE)
+        super().__init__(lambda number, data: self.encoder.stdin.write(data))
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.encoder.stdin.close()
+            if self.encoder.wait():
+                raise RuntimeError("%s exited with status %d" % (self.ffmpeg, self.encoder.returncode))
+
+def render(steps, system, writer, size, fps):
+    # Draws one output frame per 1 / fps seconds of simulated time from the per-step input iterator and
+    # passes them to the writer. Returns (frames, simulate seconds, draw seconds).
+    screen = pygame.display.get_surface()
+    output = pygame.Surface(size) if size != screen.get_size() else None
+    frame = done = 0
+    simulate_time = draw_time = 0
+    finished = False
+    while not finished:
+        start = time.perf_counter()
+        # Whole steps up to the end of this frame; alpha is how far that time reaches into the next step
+        target, remainder = divmod((frame + 1) * sim.SIM_RATE, fps)
+        while done < target:
+            step = next(steps, None)
+            if step is None:
+                finished = True
+                break
+            mouse_pos, mouse_velocity, mouse_buttons, emit, cleared, mode, emission_scale = step
+            if cleared:
+                system.clear()
+            system.mode = mode
+            system.emission_scale = emission_scale
+            system.simulate(1, mouse_pos, mouse_velocity, mouse_buttons, emit)
+            done += 1
+        if finished and done < target:
+            break
+        drawn = time.perf_counter()
+        screen.fill(sim.BLACK)
+        system.draw(screen, remainder / fps if remainder else 1.0)
+        if output:
+            pygame.transform.smoothscale(screen, size, output)
+        data = pygame.image.tobytes(output or screen, "RGB")
+        simulate_time += drawn - start
+        draw_time += time.perf_counter() - drawn
+        writer.put(frame, data)
+        frame += 1
+    return frame, simulate_time, draw_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render particles offline to PNG frames or a video file")
+    parser.add_argument("output", help="directory for numbered PNGs, or a video file (%s)" % ", ".join(VIDEO_EXTENSIONS))
+    parser.add_argument("--log", help="input log recorded with F5 in the sandbox, instead of a scripted path")
+    parser.add_argument("--mode", default="fountain", choices=sim.MODES, help="mode for the scripted path")
+    parser.add_argument("--seconds", type=float, default=10, help="length of the scripted path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=["array", "object"], help="default: the log's engine, else " + sim.ENGINE)
+    parser.add_argument("--renderer", default=sim.RENDERER, choices=["immediate", "batched"])
+    parser.add_argument("--size", default="%dx%d" % (sim.WIDTH, sim.HEIGHT), help="output WIDTHxHEIGHT; the "
+                        "simulation always runs at %dx%d and frames are scaled" % (sim.WIDTH, sim.HEIGHT))
+    parser.add_argument("--fps", type=int, default=sim.SIM_RATE)
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="encoder executable for video output")
+    args = parser.parse_args(argv)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    pygame.display.set_mode((sim.WIDTH, sim.HEIGHT))
+    if args.log:
+        engine, seed, frames = sim.read_input_log(args.log)
+        steps = logged_input(frames)
+    else:
+        engine, seed = sim.ENGINE, args.seed
+        steps = scripted_input(args.mode, args.seconds, seed)
+    system = sim.ParticleSystem(engine=args.engine or engine, seed=seed)
+    system.renderer = args.renderer
+    sim.draw_random.seed(seed)
+
+    if args.output.lower().endswith(VIDEO_EXTENSIONS):
+        writer = EncoderWriter(args.output, size, args.fps, args.ffmpeg)
+    else:
+        writer = png_writer(args.output, size)
+    start = time.perf_counter()
+    try:
+        frames, simulate_time, draw_time = render(steps, system, writer, size, args.fps)
+    finally:
+        writer.close()
+        system.close()
+    elapsed = time.perf_counter() - start
+    per_frame = 1000 / max(1, frames)
+    print("%d frames (%.1f s at %d fps) in %.1f s: %.2f ms simulate, %.2f ms draw, %.2f ms waiting on writers per frame"
+          % (frames, frames / args.fps, args.fps, elapsed, simulate_time * per_frame, draw_time * per_frame,
+             writer.wait_time * per_frame))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# Headless replay of an input log recorded with F5 in the sandbox (see InputRecorder). The log's seed and
+# per-frame input drive a fresh ParticleSystem exactly as main() did, so every replay of a log produces the
+# same particles and the same frames.
+#   python replay.py input_log.bin --save-golden golden.txt   (one state+frame checksum per frame)
+#   python replay.py input_log.bin --check-golden golden.txt  (exit code 1 at the first frame that differs)
+#   python replay.py input_log.bin --frames-dir frames       (also save every frame as a PNG)
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import Particlesim as sim
+
+def state_bytes(system):
+    # Positions, velocities and life of every particle, in order
+    if system.engine == "object":
+        return np.array([(p.x, p.y, p.vx, p.vy, p.life) for p in system.particles], np.float64).tobytes()
+    store = system.store
+    n = store.count
+    return b"".join(getattr(store, name)[:n].tobytes() for name in ("x", "y", "vx", "vy", "life"))
+
+def replay(path, renderer=sim.RENDERER, engine=None):
+    # Yields (frame number, system, screen, update seconds, draw seconds) after each replayed frame
+    log_engine, seed, frames = sim.read_input_log(path)
+    system = sim.ParticleSystem(engine=engine or log_engine, seed=seed)
+    system.renderer = renderer
+    sim.draw_random.seed(seed)
+    screen = pygame.display.get_surface()
+    try:
+        for number, (steps, mouse_pos, mouse_velocity, mouse_buttons, pressed, cleared, mode, alpha,
+                     emission_scale) in enumerate(frames):
+            start = time.perf_counter()
+            if cleared:
+                system.clear()
+            system.mode = mode
+            system.emission_scale = emission_scale
+            system.simulate(steps, mouse_pos, mouse_velocity, mouse_buttons, pressed)
+            updated = time.perf_counter()
+            screen.fill(sim.BLACK)
+            system.draw(screen, alpha)
+            yield number, system, screen, updated - start, time.perf_counter() - updated
+    finally:
+        system.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded input log headlessly")
+    parser.add_argument("log", help="input log written by the sandbox (F5)")
+    parser.add_argument("--renderer", default=sim.RENDERER, choices=["immediate", "batched"])
+    parser.add_argument("--engine", choices=["array", "object"], help="override the engine the log was recorded with")
+    parser.add_argument("--save-golden", help="write one checksum per frame to this file")
+    parser.add_argument("--check-golden", help="compare every frame against checksums saved earlier")
+    parser.add_argument("--frames-dir", help="save every frame as a PNG here")
+    args = parser.parse_args(argv)
+
+    pygame.display.set_mode((sim.WIDTH, sim.HEIGHT))
+    golden = None
+    if args.check_golden:
+        with open(args.check_golden) as f:
+            golden = f.read().split()
+    if args.frames_dir:
+        os.makedirs(args.frames_dir, exist_ok=True)
+
+    checksums = []
+    update_time = draw_time = 0
+    for number, system, screen, update_seconds, draw_seconds in replay(args.log, args.renderer, args.engine):
+        update_time += update_seconds
+        draw_time += draw_seconds
+        checksum = hashlib.sha1(state_bytes(system) + pygame.image.tobytes(screen, "RGB")).hexdigest()
+        checksums.append(checksum)
+        if args.frames_dir:
+            pygame.image.save(screen, os.path.join(args.frames_dir, "frame_%05d.png" % number))
+        if golden is not None and (number >= len(golden) or golden[number] != checksum):
+            print("frame %d differs from %s" % (number, args.check_golden))
+            return 1
+
+    frames = max(1, len(checksums))
+    print("%d frames, %.3f ms update, %.3f ms draw per frame" % (len(checksums), update_time / frames * 1000,
+                                                                 draw_time / frames * 1000))
+    if golden is not None and len(golden) != len(checksums):
+        print("%s has %d frames, the log %d" % (args.check_golden, len(golden), len(checksums)))
+        return 1
+    if args.save_golden:
+        with open(args.save_golden, "w") as f:
+            f.write("\n".join(checksums) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())